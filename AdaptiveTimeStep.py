@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+
+# Standard libraries
+import math
+
+# External libraries
+import numpy as np
+
+# Internal libraries
+from SimulationLog import SimulationLog
+from VectorizedEngine import segment_load
+from EventSolver import EventSolver
+from PowermodeSchedule import compile_schedule
+
+# Units are seconds, the default shortest step and the longest step an adaptive run takes
+MIN_TIME_STEP = 1
+MAX_TIME_STEP = 3600
+
+
+def choose_step(slope: float, maxSocChangePerStep: float, minTimeStep: float = MIN_TIME_STEP) -> float:
+    """ Pick the longest time step that changes the state of charge by no more than maxSocChangePerStep
+
+    Args:
+        slope (float): Change in state of charge (in %) per second
+        maxSocChangePerStep (float): Largest state of charge change (in %) allowed in one step
+        minTimeStep (float, optional): Shortest step in seconds, may be below one second. Defaults to MIN_TIME_STEP.
+
+    Returns:
+        float: Step length in seconds, between minTimeStep and MAX_TIME_STEP
+    """
+    if slope == 0:
+        return MAX_TIME_STEP
+
+    return min(max(maxSocChangePerStep / abs(slope), minTimeStep), MAX_TIME_STEP)
+
+
+def time_to_next_event(chemistry: str, stateOfCharge: float, slope: float) -> float:
+    """ Time until a linear state of charge trajectory reaches the next CHEM_SOC snap point, or 0% when discharging
+
+        Adaptive steps end exactly on these events, so voltage changes and depletion land on a logged time.
+
+    Args:
+        chemistry (str): The chemistry type of a battery cell, defined as a CONSTANT in BatteryCell.py
+        stateOfCharge (float): State of charge (in %) now
+        slope (float): Change in state of charge (in %) per second
+
+    Returns:
+        float: Seconds until the next event, or infinity if there is none
+    """
+    snapPoints = EventSolver.snap_points(chemistry)
+
+    if slope < 0:
+        below = snapPoints[snapPoints < stateOfCharge]
+        target = below[-1] if len(below) > 0 else 0.0
+        if stateOfCharge <= 0:
+            return float("inf")
+    elif slope > 0:
+        above = snapPoints[snapPoints > stateOfCharge]
+        if len(above) == 0:
+            return float("inf")
+        target = above[0]
+    else:
+        return float("inf")
+
+    return (target - stateOfCharge) / slope
+
+
+def run_adaptive(sim, runTimeInSeconds: int, voltageRegulatorEfficiency: int) -> list:
+    """ Run a Simulation with variable length time steps, chosen so every step changes the state of charge by at most sim.maxSocChangePerStep
+
+        Idle and low power stretches take long steps (up to MAX_TIME_STEP), heavy loads and recharges take short ones
+        (down to sim.minAdaptiveTimeStep, which may be below one second to follow fast transients).
+        Every step uses the same BatteryCell methods and ValueErrors as Simulation.run(), and every powermode boundary,
+        voltage change and depletion lands exactly on a step. The time of every log entry is written to sim.timeLog.
+
+    Args:
+        sim (Simulation): The simulation to run, with sim.timeStep set to Simulation.ADAPTIVE_TIME_STEP
+        runTimeInSeconds (int): The duration in seconds for which the simulation is run.
+        voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+
+    Returns:
+        list: Battery charge state data calculated during a simulation run, one entry per entry of sim.timeLog
+    """
+    if sim.experimentDuration < runTimeInSeconds:
+        raise ValueError(f"Requested simulation time of {runTimeInSeconds}, is more than time defined in the powermodes variable.")
+
+    if sim.minAdaptiveTimeStep <= 0:
+        raise ValueError("Shortest adaptive time step must be positive.")
+
+    cell = sim.generator.cells
+    timeLog = [0]
+    stateOfChargeLog = [int(cell.stateOfCharge)]
+    # Every SimulationLog channel and the powermode index of every step, only kept if sim.logType is set
+    records = [(int(cell.stateOfCharge), cell.currentVoltage, *sim.generator.current_volts_amps_power, 0, SimulationLog.NO_MODE)]
+    segmentStart = 0
+    totalElaspedTime = sim.ONE_SECOND
+    schedule = compile_schedule(sim.consumers, sim.powermodes)
+
+    try:
+        for i in range(0, len(sim.powermodes), 2):
+            timeDuration = sim.powermodes[i+1]
+            timeToRun = min(timeDuration, runTimeInSeconds - totalElaspedTime)
+            fastestAllowedRechargeTime = int(((cell.totalEnergyCapacity - cell.currentEnergy) / (cell.maxPower)) * 3600) / sim.generator.parallelCount
+
+            if timeToRun > 0:
+                load = 0
+                segment = schedule[i // 2]
+                isRecharge = bool(segment["isRecharge"])
+                if isRecharge:
+                    if fastestAllowedRechargeTime > timeDuration:
+                        raise ValueError(f"Requested recharge time of {timeDuration} seconds is too fast!")
+
+                    # State of charge gained per second
+                    rechargeStep = (float(segment["rechargeTarget"]) - cell.state_of_charge()) / timeToRun
+                    slope = rechargeStep
+                else:
+                    energyPerCell = segment_load(sim, segment, voltageRegulatorEfficiency)
+                    slope = -(energyPerCell / cell.totalEnergyCapacity) * 100
+                    load = float(segment["totalPower"])
+
+                step = choose_step(slope, sim.maxSocChangePerStep, sim.minAdaptiveTimeStep)
+                t = 0
+                while t < timeToRun:
+                    activeSlope = slope if (slope > 0 or cell.currentEnergy > 0) else 0
+                    stepLength = float(min(step, max(time_to_next_event(cell.chemistry, cell.stateOfCharge, activeSlope), sim.minAdaptiveTimeStep)))
+                    lastStep = math.isclose(t + stepLength, timeToRun) or t + stepLength > timeToRun
+                    if lastStep:
+                        stepLength = timeToRun - t
+
+                    if isRecharge and lastStep:
+                        # Land the last step exactly on the requested state of charge, instead of on a rounded sum of steps
+                        cell.recharge(float(segment["rechargeTarget"]))
+                    elif isRecharge:
+                        cell.recharge(rechargeStep * stepLength + cell.stateOfCharge)
+                    else:
+                        cell.consume_energy(energyPerCell * stepLength)
+
+                    t = timeToRun if lastStep else t + stepLength
+                    timeLog.append(segmentStart + t)
+                    stateOfChargeLog.append(cell.state_of_charge())
+                    if sim.logType is not None:
+                        records.append((stateOfChargeLog[-1], cell.currentVoltage, *sim.generator.current_volts_amps_power, load, i // 2))
+
+                segmentStart += timeToRun
+
+            totalElaspedTime += timeToRun
+            if totalElaspedTime > runTimeInSeconds:
+                break
+    finally:
+        sim.timeLog = timeLog
+        sim.batteryPackPercentageLog = stateOfChargeLog
+
+        if sim.logType is not None:
+            # The number of adaptive steps is only known now, so the SimulationLog is allocated at the end
+            sim.log = SimulationLog(len(records), sim.logType)
+            columns = np.array(records, dtype=np.float64).T
+            sim.log.data[:] = columns[:-1]
+            sim.log.modeIndex[:] = columns[-1]
+            sim.batteryPackPercentageLog = sim.log.stateOfCharge
+
+    return sim.batteryPackPercentageLog
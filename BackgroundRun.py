@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+
+# Standard libraries
+import threading
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+# Internal libraries
+from Simulation import Simulation
+
+
+class RunCancelled(Exception):
+    """ Raised inside a background run to stop it at its next progress update """
+
+
+@dataclass(frozen=True)
+class RunProgress:
+    completed: int              # Log entries (from index 0) of sim.timeLog and sim.batteryPackPercentageLog that are final
+    total: int                  # Log entries of a full run
+    done: bool = False          # The run finished, failed or was cancelled
+    cancelled: bool = False
+    error: str = None           # ValueError message the run stopped with, or None
+
+    @property
+    def fraction(self) -> float:
+        return self.completed / self.total if self.total > 0 else 1.0
+
+
+class BackgroundRunner:
+
+    def __init__(self):
+        """ Runs one Simulation.run_incremental() at a time on a worker thread, so a GUI stays responsive during long runs
+
+            The GUI thread polls progress with poll() and draws the finished part of the logs while the run continues.
+            Starting a new run cancels the one in flight, which stops cleanly within Simulation.PROGRESS_INTERVAL time steps,
+            and the new run waits for it in the single worker's queue. Cancelled runs keep their checkpoints, so the next run
+            carries on from the start of the powermode the cancelled one stopped in.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Simulation")
+        self.lock = threading.Lock()
+        self.cancelEvent = None
+        self.future = None
+        self.progress = None
+
+
+    @property
+    def running(self) -> bool:
+        return self.future is not None and not self.future.done()
+
+
+    def start(self, sim: Simulation, runTimeInSeconds: int, voltageRegulatorEfficiency: int):
+        """ Cancel any run in flight, then queue a new run
+
+        Args:
+            sim (Simulation): The simulation to run, which only the worker thread may change until the run is done
+            runTimeInSeconds (int): The duration in seconds for which the simulation is run.
+            voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+
+        Returns:
+            Future: Completes when the run is done, see poll() for how it ended
+        """
+        self.cancel()
+
+        cancelEvent = threading.Event()
+        with self.lock:
+            self.cancelEvent = cancelEvent
+            self.progress = RunProgress(0, len(sim.timeLog))
+        self.future = self.executor.submit(self.work, sim, runTimeInSeconds, voltageRegulatorEfficiency, cancelEvent)
+
+        return self.future
+
+
+    def cancel(self, wait: bool = False) -> None:
+        """ Ask the run in flight to stop at its next progress update, at most Simulation.PROGRESS_INTERVAL time steps away
+
+        Args:
+            wait (bool, optional): Block until the worker has stopped, before changing the simulation it runs. Defaults to False.
+        """
+        with self.lock:
+            if self.cancelEvent is not None:
+                self.cancelEvent.set()
+
+        if wait and self.future is not None:
+            self.future.exception()
+
+
+    def poll(self) -> RunProgress:
+        """ Latest progress of the current run, safe to call from the GUI thread as often as needed
+
+        Returns:
+            RunProgress: Progress of the latest run started, or None before the first run
+        """
+        with self.lock:
+            return self.progress
+
+
+    def publish(self, cancelEvent: threading.Event, progress: RunProgress) -> None:
+        with self.lock:
+            # A run that was replaced doesn't overwrite the progress of its replacement
+            if cancelEvent is self.cancelEvent:
+                self.progress = progress
+
+
+    def work(self, sim: Simulation, runTimeInSeconds: int, voltageRegulatorEfficiency: int, cancelEvent: threading.Event) -> None:
+        """ Body of a run on the worker thread, publishing progress at every powermode and every Simulation.PROGRESS_INTERVAL time steps
+
+        Args:
+            sim (Simulation): The simulation to run
+            runTimeInSeconds (int): The duration in seconds for which the simulation is run.
+            voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+            cancelEvent (threading.Event): Set by cancel() to stop this run
+        """
+        if cancelEvent.is_set():
+            self.publish(cancelEvent, RunProgress(0, len(sim.timeLog), done=True, cancelled=True))
+            return
+
+        completed = 0
+
+        def progress(timeIndex: int) -> None:
+            nonlocal completed
+            completed = timeIndex
+            if cancelEvent.is_set():
+                raise RunCancelled()
+            self.publish(cancelEvent, RunProgress(timeIndex, len(sim.timeLog)))
+
+        try:
+            sim.run_incremental(runTimeInSeconds, voltageRegulatorEfficiency, progress)
+            self.publish(cancelEvent, RunProgress(len(sim.timeLog), len(sim.timeLog), done=True))
+        except RunCancelled:
+            self.publish(cancelEvent, RunProgress(completed, len(sim.timeLog), done=True, cancelled=True))
+        except ValueError as e:
+            self.publish(cancelEvent, RunProgress(completed, len(sim.timeLog), done=True, error=str(e)))
+
+
+    def shutdown(self) -> None:
+        """ Cancel any run in flight and stop the worker thread """
+        self.cancel()
+        self.executor.shutdown(wait=True)
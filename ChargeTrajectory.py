@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+
+# Standard libraries
+import math
+
+# External libraries
+import numpy as np
+
+# Internal libraries
+from Power.BatteryCell import BatteryCell
+from PowermodeSchedule import has_traces
+
+
+class ChargeTrajectory:
+
+    def __init__(self, breakpointTimes: np.ndarray, breakpointValues: np.ndarray):
+        """ Battery cell state of charge over a whole powermodes schedule, as straight lines between breakpoints
+
+            Built once in O(n), where n is the number of powermodes, then state of charge and time to threshold queries
+            take O(log n) each, without running a simulation or scanning a log.
+
+        Args:
+            breakpointTimes (np.ndarray): Times in seconds, sorted, starting at 0
+            breakpointValues (np.ndarray): State of charge (in %) at each breakpoint time
+        """
+        self.breakpointTimes = np.asarray(breakpointTimes, dtype=np.float64)
+        self.breakpointValues = np.asarray(breakpointValues, dtype=np.float64)
+
+        # Lowest state of charge reached so far, never increasing, so the first crossing of any threshold is a binary search
+        self.runningMinimum = np.minimum.accumulate(self.breakpointValues)
+
+
+    @classmethod
+    def from_schedule(cls, schedule: np.ndarray, generator):
+        """ Work out the trajectory in closed form, one straight line per powermode plus one more where a cell runs empty
+
+            Follows the same energy bookkeeping and recharge checks as Simulation.run(), but not the battery pack power or
+            current limits, see Simulation.compile_schedule() to check those.
+
+        Args:
+            schedule (np.ndarray): Compiled powermodes, see PowermodeSchedule.compile_schedule()
+            generator (BatteryPack): The battery pack, in its starting state
+
+        Returns:
+            ChargeTrajectory: The state of charge trajectory
+
+        Raises:
+            ValueError: If a recharge segment asks for less than the current state of charge, above 100%, or faster than the cell (or charger) allows,
+                        or a TraceConsumption plays
+        """
+        if has_traces(schedule):
+            raise ValueError("A charge trajectory needs a constant load in every powermode, not a playing TraceConsumption.")
+
+        cell = generator.cells
+        cellsInPack = generator.seriesCount * generator.parallelCount
+        energy = cell.currentEnergy
+        times = [0.0]
+        values = [(energy / cell.totalEnergyCapacity) * 100]
+
+        for segment in schedule:
+            start = float(segment["start"])
+            duration = float(segment["duration"])
+            if duration == 0:
+                continue
+
+            if segment["isRecharge"] and generator.charger is not None:
+                # Breakpoints where the constant current phase ends and the target is reached, the constant voltage phase is drawn straight
+                target = float(segment["rechargeTarget"])
+                profile = generator.charger.profile(generator, values[-1], target)
+                if profile.duration > duration:
+                    raise ValueError(f"Requested recharge time of {duration} seconds is too fast! The charger needs {math.ceil(profile.duration)} seconds.")
+
+                for phaseEnd in sorted({profile.ccDuration, profile.duration}):
+                    if 0 < phaseEnd < duration:
+                        times.append(start + phaseEnd)
+                        values.append(float(profile.state_of_charge_at(phaseEnd)))
+
+                energy = (target / 100) * cell.totalEnergyCapacity
+            elif segment["isRecharge"]:
+                target = float(segment["rechargeTarget"])
+                fastestAllowedRechargeTime = int(((cell.totalEnergyCapacity - energy) / cell.maxPower) * 3600) / generator.parallelCount
+                if fastestAllowedRechargeTime > duration:
+                    raise ValueError(f"Requested recharge time of {duration} seconds is too fast!")
+                if target > BatteryCell.MAX_STATE_OF_CHARGE:
+                    raise ValueError("Can't recharge battery cell above 100%")
+                if target < values[-1]:
+                    raise ValueError(f"Requested State of Recharge ({target}%), is less than current state of charge ({round(values[-1], 2)}%).")
+
+                energy = (target / 100) * cell.totalEnergyCapacity
+            else:
+                energyPerCell = float(segment["energyPerSecond"]) / cellsInPack
+                if energyPerCell > 0 and energy < energyPerCell * duration:
+                    # Cell energy is clamped at zero, which ends the straight line early
+                    times.append(start + energy / energyPerCell)
+                    values.append(0.0)
+                    energy = 0.0
+                else:
+                    energy -= energyPerCell * duration
+
+            times.append(start + duration)
+            values.append((energy / cell.totalEnergyCapacity) * 100)
+
+        return cls(times, values)
+
+
+    @property
+    def endTime(self) -> float:
+        return float(self.breakpointTimes[-1])
+
+
+    def state_of_charge_at(self, times) -> np.ndarray:
+        """ State of charge at any times, in O(log n) each
+
+        Args:
+            times (float or np.ndarray): Times in seconds since the start of the powermodes, clamped to the schedule
+
+        Returns:
+            np.ndarray: State of charge (in %) at each time
+        """
+        return np.interp(times, self.breakpointTimes, self.breakpointValues)
+
+
+    def time_to_state_of_charge(self, thresholds) -> np.ndarray:
+        """ First time the state of charge falls to or below each threshold, in O(log n) each
+
+        Args:
+            thresholds (float or np.ndarray): State of charge thresholds (in %)
+
+        Returns:
+            np.ndarray: Time in seconds of each first crossing, or infinity if the schedule never gets that low
+        """
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+
+        # First breakpoint at or below the threshold, the crossing is on the straight line just before it
+        k = np.searchsorted(-self.runningMinimum, -thresholds, side='left')
+        reached = k < len(self.breakpointTimes)
+        k = np.where(reached, k, 0)
+        previous = np.maximum(k - 1, 0)
+
+        t0, t1 = self.breakpointTimes[previous], self.breakpointTimes[k]
+        v0, v1 = self.breakpointValues[previous], self.breakpointValues[k]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crossing = np.where(v1 < v0, t0 + (thresholds - v0) * (t1 - t0) / (v1 - v0), t1)
+
+        return np.where(reached, np.where(k == 0, 0.0, crossing), math.inf)
@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+
+# Standard libraries
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class CellState:
+    # Every BatteryCell attribute a simulation changes
+    currentEnergy: float
+    currentVoltage: float
+    currentPower: float
+    stateOfCharge: float
+    health: float
+    rechargeCycleNumber: int
+    currentAmpere: float
+    currentDrawSet: bool
+    pairVoltages: tuple = ()    # Units are Volts, across every RC pair of the cell's EquivalentCircuit (if it has one)
+
+    @classmethod
+    def capture(cls, cell):
+        """ Snapshot the simulated state of a battery cell
+
+        Args:
+            cell (BatteryCell): The cell to snapshot
+
+        Returns:
+            CellState: Immutable copy of the cell state
+        """
+        pairVoltages = tuple(cell.equivalentCircuit.pairVoltage.tolist()) if cell.equivalentCircuit is not None else ()
+
+        return cls(cell.currentEnergy, cell.currentVoltage, cell.currentPower, cell.stateOfCharge, cell.health,
+                   cell.rechargeCycleNumber, cell.currentAmpere, cell.currentDrawSet, pairVoltages)
+
+
+    def restore(self, cell) -> None:
+        """ Put a battery cell back into this state
+
+        Args:
+            cell (BatteryCell): The cell to update in place
+        """
+        cell.currentEnergy = self.currentEnergy
+        cell.currentVoltage = self.currentVoltage
+        cell.currentPower = self.currentPower
+        cell.stateOfCharge = self.stateOfCharge
+        cell.health = self.health
+        cell.rechargeCycleNumber = self.rechargeCycleNumber
+        cell.currentAmpere = self.currentAmpere
+        cell.currentDrawSet = self.currentDrawSet
+        if cell.equivalentCircuit is not None:
+            cell.equivalentCircuit.pairVoltage[:] = self.pairVoltages
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    segmentIndex: int           # Index into Simulation.powermodes of the next powermode to run
+    timeIndex: int              # Next batteryPackPercentageLog entry to write
+    totalElaspedTime: float     # Units are seconds, same bookkeeping as Simulation.run()
+    cell: CellState
+    consumers: tuple            # (current, power, deviceOn) of every consumer, in Simulation.consumers order
+
+    @classmethod
+    def capture(cls, sim, segmentIndex: int, timeIndex: int, totalElaspedTime: float):
+        """ Snapshot a simulation at a powermode boundary
+
+        Args:
+            sim (Simulation): The simulation to snapshot
+            segmentIndex (int): Index into sim.powermodes of the next powermode to run
+            timeIndex (int): Next batteryPackPercentageLog entry to write
+            totalElaspedTime (float): Simulated time in seconds, including the one time step offset of Simulation.run()
+
+        Returns:
+            Checkpoint: Immutable copy of everything needed to carry on from this boundary
+        """
+        consumers = tuple((consumer.current, consumer.power, consumer.deviceOn) for consumer in sim.consumers)
+
+        return cls(segmentIndex, timeIndex, totalElaspedTime, CellState.capture(sim.generator.cells), consumers)
+
+
+    def restore(self, sim) -> None:
+        """ Put a simulation's battery cell and consumers back into this state
+
+        Args:
+            sim (Simulation): The simulation to update in place
+        """
+        self.cell.restore(sim.generator.cells)
+        for consumer, (current, power, deviceOn) in zip(sim.consumers, self.consumers):
+            consumer.current = current
+            consumer.power = power
+            consumer.deviceOn = deviceOn
@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+
+# External libraries
+import numpy as np
+
+# Decimation methods that can be passed to downsample()
+MIN_MAX = "MIN_MAX"     # Lowest and highest point of every bucket, never hides a dip to 0% (fast, fully vectorized)
+LTTB = "LTTB"           # Largest Triangle Three Buckets, the point of every bucket that best keeps the shape of the line
+
+
+def visible_range(times: np.ndarray, timeRange: tuple = None) -> slice:
+    """ Indexes of the points inside a time range, plus one point either side so lines reach the edge of the plot
+
+    Args:
+        times (np.ndarray): Sorted times in seconds
+        timeRange (tuple, optional): (start, stop) times in seconds. Defaults to None (every point).
+
+    Returns:
+        slice: Indexes of the visible points
+    """
+    if timeRange is None:
+        return slice(0, len(times))
+
+    start = max(int(np.searchsorted(times, timeRange[0], side='right')) - 1, 0)
+    stop = min(int(np.searchsorted(times, timeRange[1], side='left')) + 1, len(times))
+
+    return slice(start, stop)
+
+
+def min_max(times: np.ndarray, values: np.ndarray, bucketCount: int) -> tuple:
+    """ Keep the lowest and highest value of every bucket of consecutive points, in time order
+
+    Args:
+        times (np.ndarray): Times in seconds
+        values (np.ndarray): Value at each time
+        bucketCount (int): Number of buckets, at most 2 * bucketCount + 2 points are kept
+
+    Returns:
+        np.ndarray: Times of the kept points
+        np.ndarray: Values of the kept points
+    """
+    if len(values) <= 2 * bucketCount + 2:
+        return times, values
+
+    # Equal sized buckets, the last one padded by repeating the last value, which can't change its min or max
+    bucketSize = -(-len(values) // bucketCount)
+    padded = np.empty(bucketSize * bucketCount)
+    padded[:len(values)] = values
+    padded[len(values):] = values[-1]
+    buckets = padded.reshape(bucketCount, bucketSize)
+
+    offsets = np.arange(bucketCount) * bucketSize
+    lowest = offsets + buckets.argmin(axis=1)
+    highest = offsets + buckets.argmax(axis=1)
+    indexes = np.unique(np.concatenate(([0], lowest, highest, [len(values) - 1])))
+    indexes = indexes[indexes < len(values)]
+
+    return times[indexes], values[indexes]
+
+
+def lttb(times: np.ndarray, values: np.ndarray, pointCount: int) -> tuple:
+    """ Largest Triangle Three Buckets, keeping the first and last point and the most visually significant point of every bucket
+
+    Args:
+        times (np.ndarray): Times in seconds
+        values (np.ndarray): Value at each time
+        pointCount (int): Number of points to keep, at least 3
+
+    Returns:
+        np.ndarray: Times of the kept points
+        np.ndarray: Values of the kept points
+    """
+    if len(values) <= pointCount or pointCount < 3:
+        return times, values
+
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    edges = np.linspace(1, len(values) - 1, pointCount - 1).astype(np.int64)
+    indexes = np.empty(pointCount, dtype=np.int64)
+    indexes[0] = 0
+    indexes[-1] = len(values) - 1
+
+    for b in range(pointCount - 2):
+        # Triangle between the point kept in the previous bucket, a candidate, and the average of the next bucket
+        nextStart, nextStop = edges[b + 1], (edges[b + 2] if b + 2 < len(edges) else len(values))
+        averageTime = times[nextStart:nextStop].mean()
+        averageValue = values[nextStart:nextStop].mean()
+
+        previousTime, previousValue = times[indexes[b]], values[indexes[b]]
+        candidateTimes = times[edges[b]:edges[b + 1]]
+        candidateValues = values[edges[b]:edges[b + 1]]
+        areas = np.abs((previousTime - averageTime) * (candidateValues - previousValue) - (previousTime - candidateTimes) * (averageValue - previousValue))
+        indexes[b + 1] = edges[b] + int(areas.argmax())
+
+    return times[indexes], values[indexes]
+
+
+def downsample(times, values, pixelWidth: int, timeRange: tuple = None, method: str = MIN_MAX) -> tuple:
+    """ Reduce a trace to about two points per horizontal pixel of the visible time range, for plotting
+
+    Args:
+        times (list or np.ndarray): Sorted times in seconds
+        values (list or np.ndarray): Value at each time
+        pixelWidth (int): Width of the plot in pixels
+        timeRange (tuple, optional): (start, stop) times in seconds of a zoomed in plot. Defaults to None (every point).
+        method (str, optional): MIN_MAX or LTTB. Defaults to MIN_MAX.
+
+    Returns:
+        np.ndarray: Times of the points to plot
+        np.ndarray: Values of the points to plot
+
+    Raises:
+        ValueError: If the method is unknown
+    """
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    visible = visible_range(times, timeRange)
+    times, values = times[visible], values[visible]
+
+    if method == MIN_MAX:
+        return min_max(times, values, max(pixelWidth, 1))
+    elif method == LTTB:
+        return lttb(times, values, max(2 * pixelWidth, 3))
+    else:
+        raise ValueError(f"{method} is an unsupported downsampling method. Use 'Downsample.MIN_MAX' or 'Downsample.LTTB'.")
@@ -0,0 +1,355 @@
+#!/usr/bin/python3
+
+# Standard libraries
+import math
+
+# External libraries
+import numpy as np
+
+# Internal libraries
+from Power.BatteryCell import BatteryCell
+from SimulationLog import SimulationLog
+from PiecewiseLinearLog import PiecewiseLinearLog
+from VectorizedEngine import segment_load
+from PowermodeSchedule import compile_schedule
+
+
+class EventSolver:
+
+    # Half way points between neighbouring CHEM_SOC entries, where BatteryCell snaps to a new voltage
+    SNAP_POINTS = {chemistry: (socTable[:-1] + socTable[1:]) / 2 for chemistry, socTable in BatteryCell.CHEM_SOC.items()}
+
+    @staticmethod
+    def snap_points(chemistry: str) -> np.ndarray:
+        """ Snap points of a chemistry, worked out the first time a chemistry loaded from a ChemistryRegistry is used
+
+        Args:
+            chemistry (str): The chemistry type of a battery cell
+
+        Returns:
+            np.ndarray: Half way points between neighbouring CHEM_SOC entries
+        """
+        if chemistry not in EventSolver.SNAP_POINTS:
+            socTable = BatteryCell.voltage_lookup(chemistry).socTable
+            EventSolver.SNAP_POINTS[chemistry] = (socTable[:-1] + socTable[1:]) / 2
+
+        return EventSolver.SNAP_POINTS[chemistry]
+
+    def __init__(self, sim):
+        """ Solves a Simulation by jumping from one state change (event) to the next, instead of stepping second by second.
+
+            Between events only the cell energy changes, and it changes linearly, so the state of charge at any
+            time can be interpolated from the event list. Cost scales with the number of events, not the number of seconds.
+
+        Args:
+            sim (Simulation): The simulation to solve, whose consumers and battery pack are updated in place.
+        """
+        self.sim = sim
+
+        # Parallel lists, one entry per event
+        self.eventTimes = [0.0]                                         # Units are seconds since start of simulation
+        self.eventStateOfCharge = [sim.generator.cells.stateOfCharge]   # Units are percentage
+        self.eventVoltages = [sim.generator.cells.currentVoltage]       # Units are Volts (single cell)
+
+        self.endTime = 0                                                # Units are seconds solved
+        self.stepsSolved = 0                                            # Number of Simulation.timeStep long steps solved
+
+        # (first step, step after the last, cell current, load, powermode index) of every solved segment, for SimulationLog
+        self.segments = []
+        self.initialVoltsAmpsPower = sim.generator.current_volts_amps_power
+
+
+    def add_event(self, time: float, stateOfCharge: float, voltage: float) -> None:
+        """ Append one event, keeping the event list sorted by time
+
+        Args:
+            time (float): Time of the event in seconds since start of simulation
+            stateOfCharge (float): Cell state of charge (in %) at the event
+            voltage (float): Cell voltage (in Volts) from the event onwards
+        """
+        self.eventTimes.append(time)
+        self.eventStateOfCharge.append(stateOfCharge)
+        self.eventVoltages.append(voltage)
+
+
+    def add_snap_events(self, startTime: float, startSoC: float, slope: float, endTime: float) -> None:
+        """ Add an event everywhere a linear state of charge trajectory crosses a CHEM_SOC snap point
+
+        Args:
+            startTime (float): Start of the linear piece in seconds
+            startSoC (float): State of charge (in %) at startTime
+            slope (float): Change in state of charge (in %) per second
+            endTime (float): End of the linear piece in seconds
+        """
+        if slope == 0 or endTime <= startTime:
+            return
+
+        chemistry = self.sim.generator.cells.chemistry
+        snapPoints = EventSolver.snap_points(chemistry)
+        endSoC = startSoC + slope * (endTime - startTime)
+        low, high = min(startSoC, endSoC), max(startSoC, endSoC)
+        crossed = snapPoints[(snapPoints > low) & (snapPoints < high)]
+
+        if slope < 0:
+            crossed = crossed[::-1]
+
+        for snapPoint in crossed:
+            # Entering the lower neighbour when discharging, or the upper neighbour when recharging
+            idx = int(np.searchsorted(snapPoints, snapPoint)) + (1 if slope > 0 else 0)
+            self.add_event(startTime + (snapPoint - startSoC) / slope, float(snapPoint), float(BatteryCell.CHEM_VOLTAGE[chemistry][idx]))
+
+
+    def consume(self, segment, stepLengths: list, voltageRegulatorEfficiency: int) -> None:
+        """ Solve one power consuming segment of the "powermodes" list
+
+        Args:
+            segment (np.void): Row of the compiled powermodes, see PowermodeSchedule.compile_schedule()
+            stepLengths (list): Length in seconds of every time step in the segment, see Simulation.step_lengths()
+            voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+        """
+        cell = self.sim.generator.cells
+        energyPerCell = segment_load(self.sim, segment, voltageRegulatorEfficiency)
+        timeToRun = sum(stepLengths)
+
+        startTime = float(self.endTime)
+        startSoC = cell.state_of_charge()
+        slope = -(energyPerCell / cell.totalEnergyCapacity) * 100
+
+        # The cell energy is clamped at zero, which ends the linear piece early
+        activeTime = timeToRun
+        if energyPerCell > 0 and cell.currentEnergy < energyPerCell * timeToRun:
+            activeTime = cell.currentEnergy / energyPerCell
+
+        self.add_snap_events(startTime, startSoC, slope, startTime + activeTime)
+
+        # BatteryCell.consume_energy() snaps the voltage using the state of charge from BEFORE the last step of energy is removed
+        previousSoC = cell.stateOfCharge
+        if len(stepLengths) > 1:
+            previousSoC = (max(cell.currentEnergy - energyPerCell * (timeToRun - stepLengths[-1]), 0.00) / cell.totalEnergyCapacity) * 100
+
+        if activeTime < timeToRun:
+            cell.currentEnergy = 0.00
+            self.add_event(startTime + activeTime, 0.0, self.eventVoltages[-1])
+        else:
+            cell.currentEnergy -= energyPerCell * timeToRun
+
+        cell.stateOfCharge = cell.state_of_charge()
+        cell.currentVoltage = float(cell.voltageLookup.voltage(previousSoC))
+        cell.currentPower = cell.currentVoltage * cell.currentAmpere
+
+        self.endTime += timeToRun
+        self.stepsSolved += len(stepLengths)
+        self.add_event(float(self.endTime), cell.stateOfCharge, cell.currentVoltage)
+
+
+    def recharge(self, finalSoC: float, timeDuration: int, stepLengths: list, fastestAllowedRechargeTime: float) -> None:
+        """ Solve one "RECHARGE" segment of the "powermodes" list
+
+        Args:
+            finalSoC (float): The requested state of charge at the end of the full (non truncated) segment
+            timeDuration (int): The requested recharge time in seconds defined in the "powermodes" list
+            stepLengths (list): Length in seconds of every time step in the segment, see Simulation.step_lengths()
+            fastestAllowedRechargeTime (float): Shortest recharge time in seconds the battery pack allows, as computed in Simulation.run()
+
+        Raises:
+            ValueError: If the recharge is too fast, lowers the state of charge, goes above 100%, or ends at exactly 100%
+        """
+        cell = self.sim.generator.cells
+        timeToRun = sum(stepLengths)
+        timeStep = stepLengths[0]
+        # State of charge gained per second
+        rechargeStep = (finalSoC - cell.state_of_charge()) / timeToRun
+        if fastestAllowedRechargeTime > timeDuration:
+            raise ValueError(f"Requested recharge time of {timeDuration} seconds is too fast!")
+
+        if rechargeStep < 0:
+            raise ValueError(f"Requested State of Recharge ({rechargeStep * timeStep + cell.stateOfCharge}%), is less than current state of charge ({round(cell.stateOfCharge, 2)}%).")
+
+        # Simulation.run() sums the requested state of charge once per step, so whether a recharge to exactly 100% ends just
+        # above 100% (and fails) depends on rounding this solver doesn't reproduce
+        if rechargeStep > 0 and finalSoC == BatteryCell.MAX_STATE_OF_CHARGE:
+            raise ValueError("The EVENT_ENGINE can't recharge to exactly 100%, use the LOOP_ENGINE or VECTORIZED_ENGINE.")
+
+        # Number of steps completed before BatteryCell.recharge() would be asked to go above 100%
+        completedSteps = len(stepLengths)
+        completedTime = timeToRun
+        error = None
+        if rechargeStep > 0 and cell.stateOfCharge + rechargeStep * timeToRun > BatteryCell.MAX_STATE_OF_CHARGE:
+            completedSteps = min(len(stepLengths), math.floor((BatteryCell.MAX_STATE_OF_CHARGE - cell.stateOfCharge) / (rechargeStep * timeStep)))
+            completedTime = sum(stepLengths[:completedSteps])
+            error = ValueError("Can't recharge battery cell above 100%")
+
+        startTime = float(self.endTime)
+        startSoC = cell.stateOfCharge
+        self.add_snap_events(startTime, startSoC, rechargeStep, startTime + completedTime)
+
+        if completedSteps > 0:
+            # BatteryCell.recharge() counts every call that ends at or below 50%, and health lags that count by one call
+            if rechargeStep > 0:
+                cyclesCounted = min(completedSteps, max(0, math.floor((50 - startSoC) / (rechargeStep * timeStep))))
+            else:
+                cyclesCounted = completedSteps if startSoC <= 50 else 0
+            requestedSoC = startSoC + rechargeStep * completedTime
+            lastCallCounted = 1 if requestedSoC <= 50 else 0
+
+            cell.health = np.exp((np.log(0.8) / BatteryCell.CHEM_MAX_CYCLES[cell.chemistry]) * (cell.rechargeCycleNumber + cyclesCounted - lastCallCounted))
+            cell.rechargeCycleNumber += cyclesCounted
+
+            cell.stateOfCharge = requestedSoC
+            cell.currentEnergy = cell.totalEnergyCapacity * (requestedSoC / 100)
+            cell.currentVoltage = float(cell.voltageLookup.voltage(requestedSoC))
+            cell.currentPower = cell.currentVoltage * cell.currentAmpere
+
+        self.endTime += completedTime
+        self.stepsSolved += completedSteps
+        self.add_event(float(self.endTime), cell.state_of_charge(), cell.currentVoltage)
+
+        if error is not None:
+            raise error
+
+
+    def solve(self, runTimeInSeconds: int, voltageRegulatorEfficiency: int) -> int:
+        """ Solve the whole "powermodes" list, one segment at a time
+
+        Args:
+            runTimeInSeconds (int): The duration in seconds for which the simulation is run.
+            voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+
+        Returns:
+            int: Number of events found
+
+        Raises:
+            ValueError: The same ValueErrors as Simulation.run()
+        """
+        sim = self.sim
+        if sim.experimentDuration < runTimeInSeconds:
+            raise ValueError(f"Requested simulation time of {runTimeInSeconds}, is more than time defined in the powermodes variable.")
+
+        totalElaspedTime = sim.timeStep
+        schedule = compile_schedule(sim.consumers, sim.powermodes)
+        for i in range(0, len(sim.powermodes), 2):
+            timeDuration = sim.powermodes[i+1]
+            timeToRun = min(timeDuration, runTimeInSeconds - totalElaspedTime)
+            stepLengths = sim.step_lengths(timeToRun)
+            cell = sim.generator.cells
+            fastestAllowedRechargeTime = int(((cell.totalEnergyCapacity - cell.currentEnergy) / (cell.maxPower)) * 3600) / sim.generator.parallelCount
+
+            if len(stepLengths) > 0:
+                firstStep = self.stepsSolved + 1
+                load = 0
+                try:
+                    segment = schedule[i // 2]
+                    if segment["isRecharge"]:
+                        self.recharge(float(segment["rechargeTarget"]), timeDuration, stepLengths, fastestAllowedRechargeTime)
+                    else:
+                        self.consume(segment, stepLengths, voltageRegulatorEfficiency)
+                        load = float(segment["totalPower"])
+                finally:
+                    self.segments.append((firstStep, self.stepsSolved + 1, cell.currentAmpere, load, i // 2))
+
+            totalElaspedTime += timeToRun
+            if totalElaspedTime > runTimeInSeconds:
+                break
+
+        return len(self.eventTimes)
+
+
+    def state_of_charge_at(self, times: np.ndarray) -> np.ndarray:
+        """ Interpolate the cell state of charge between events
+
+        Args:
+            times (np.ndarray): Times in seconds since start of simulation, between 0 and self.endTime
+
+        Returns:
+            np.ndarray: State of charge (in %) at each requested time
+        """
+        return np.interp(times, self.eventTimes, self.eventStateOfCharge)
+
+
+    def voltage_at(self, times: np.ndarray) -> np.ndarray:
+        """ Look up the snapped cell voltage at any time, which only changes at events
+
+        Args:
+            times (np.ndarray): Times in seconds since start of simulation, between 0 and self.endTime
+
+        Returns:
+            np.ndarray: Cell voltage (in Volts) at each requested time
+        """
+        idx = np.searchsorted(self.eventTimes, times, side='right') - 1
+
+        return np.asarray(self.eventVoltages)[np.clip(idx, 0, len(self.eventVoltages) - 1)]
+
+
+    def fill_log(self, log: list) -> list:
+        """ Write the solved trajectory into a Simulation.batteryPackPercentageLog style list, one entry per time step
+
+        Args:
+            log (list): List to overwrite in place, usually Simulation.batteryPackPercentageLog
+
+        Returns:
+            list: The same list, with the same layout as Simulation.run() returns
+        """
+        times = np.asarray(self.sim.timeLog[:self.stepsSolved + 1], dtype=np.float64)
+        stateOfCharge = self.state_of_charge_at(times)
+        log[0] = int(self.eventStateOfCharge[0])
+        log[1:self.stepsSolved + 1] = stateOfCharge[1:].tolist()
+
+        if self.sim.log is not None:
+            pack = self.sim.generator
+            self.sim.log.record(0, log[0], self.eventVoltages[0], self.initialVoltsAmpsPower, 0, SimulationLog.NO_MODE)
+            for firstStep, stopStep, cellAmpere, load, modeIndex in self.segments:
+                self.sim.log.record_block(firstStep, stateOfCharge[firstStep:stopStep], self.voltage_at(times[firstStep:stopStep]), pack.seriesCount, pack.parallelCount, cellAmpere, load, modeIndex)
+
+        return log
+
+
+def run_event_driven(sim, runTimeInSeconds: int, voltageRegulatorEfficiency: int) -> list:
+    """ Replacement for the second by second Simulation.run() loop, solving event to event and interpolating the log afterwards
+
+        Produces the same batteryPackPercentageLog (to floating point rounding) and raises the same ValueErrors.
+        Use EventSolver directly to query the trajectory without building the one entry per second log.
+
+    Args:
+        sim (Simulation): The simulation to run
+        runTimeInSeconds (int): The duration in seconds for which the simulation is run.
+        voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+
+    Returns:
+        list: Battery charge state data calculated during a simulation run.
+    """
+    solver = EventSolver(sim)
+    if sim.experimentDuration < runTimeInSeconds:
+        raise ValueError(f"Requested simulation time of {runTimeInSeconds}, is more than time defined in the powermodes variable.")
+
+    try:
+        solver.solve(runTimeInSeconds, voltageRegulatorEfficiency)
+    finally:
+        solver.fill_log(sim.batteryPackPercentageLog)
+
+    return sim.batteryPackPercentageLog
+
+
+def run_piecewise_linear(sim, runTimeInSeconds: int, voltageRegulatorEfficiency: int) -> PiecewiseLinearLog:
+    """ Solve event to event like run_event_driven(), but keep the result as straight line pieces instead of filling a dense log
+
+        Memory scales with the number of powermodes, not the number of time steps.
+
+    Args:
+        sim (Simulation): The simulation to run, with sim.logType set to Simulation.PIECEWISE_LINEAR_LOG
+        runTimeInSeconds (int): The duration in seconds for which the simulation is run.
+        voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+
+    Returns:
+        PiecewiseLinearLog: Battery charge state data calculated during a simulation run.
+    """
+    solver = EventSolver(sim)
+    if sim.experimentDuration < runTimeInSeconds:
+        raise ValueError(f"Requested simulation time of {runTimeInSeconds}, is more than time defined in the powermodes variable.")
+
+    fillValue = sim.batteryPackPercentageLog.fillValue
+    try:
+        solver.solve(runTimeInSeconds, voltageRegulatorEfficiency)
+    finally:
+        sim.batteryPackPercentageLog = PiecewiseLinearLog.from_events(solver.eventTimes, solver.eventStateOfCharge, sim.timeLog, int(solver.eventStateOfCharge[0]), solver.stepsSolved + 1, fillValue)
+
+    return sim.batteryPackPercentageLog
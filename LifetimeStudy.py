@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+
+# Standard libraries
+import math
+from dataclasses import dataclass
+
+# External libraries
+import numpy as np
+
+# Internal libraries
+from Simulation import Simulation
+from Power.Consumption import Consumption
+from Power.BatteryPack import BatteryPack
+from Power.CellAging import CellAging
+from ChargeTrajectory import ChargeTrajectory
+from PowermodeSchedule import compile_schedule, validate_schedule
+
+
+@dataclass
+class LifetimeResult:
+    missionEndTimes: np.ndarray     # Units are seconds since the start of the study
+    health: np.ndarray              # Units are percentage, at the end of every mission
+    capacity: np.ndarray            # Units are Watt-hours (single cell), at the end of every mission
+    minStateOfCharge: np.ndarray    # Units are percentage, lowest state of charge in every mission
+    cycleRanges: np.ndarray         # Units are percentage, state of charge range of every distinct full cycle counted
+    cycleCounts: np.ndarray         # Number of full cycles of each range
+    endOfLifeTime: float            # Units are seconds, first mission end with health at or below CellAging.END_OF_LIFE_HEALTH, NaN if never
+    violation: str                  # ValueError message that stopped the study early, or None
+
+
+class LifetimeStudy:
+
+    ONE_DAY_IN_SECONDS = 24 * Simulation.ONE_HOUR_IN_SECONDS
+    ONE_YEAR_IN_SECONDS = 365 * ONE_DAY_IN_SECONDS
+
+    # Seconds between updates of the cell's capacity and resistances, health changes far too slowly to need more
+    DEFAULT_UPDATE_INTERVAL = ONE_DAY_IN_SECONDS
+
+    def __init__(self, powerDrawSources: list[Consumption], powerGenerationSource: BatteryPack, modes: list, voltageRegulatorEfficiency: int):
+        """ Ages a battery pack through years of the same mission (the powermodes) repeated back to back
+
+            Every mission is worked out in closed form (see ChargeTrajectory.py), the same state of charge a 1 second
+            simulation gives, so only its few breakpoints go through the rainflow cycle counter. Missions between two
+            capacity updates start from the same state and are not recomputed, so a five year study takes seconds.
+
+        Args:
+            powerDrawSources (list[Consumption]): Submodules to simulate
+            powerGenerationSource (BatteryPack): The battery pack to age, updated in place
+            modes (list): Power modes of one mission, in the same format as Simulation.powermodes
+            voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+        """
+        self.consumers = powerDrawSources
+        self.generator = powerGenerationSource
+        self.powermodes = modes
+        self.voltageRegulatorEfficiency = voltageRegulatorEfficiency
+        self.missionDuration = sum(modes[i+1] for i in range(0, len(modes), 2))
+        self.aging = CellAging(powerGenerationSource.cells)
+
+
+    def run(self, runTimeInSeconds: float, updateInterval: float = DEFAULT_UPDATE_INTERVAL) -> LifetimeResult:
+        """ Repeat the mission for a run time, counting cycles and aging the cell as it goes
+
+            Stops early, recording the ValueError message, if a mission can't be done with the aged battery pack.
+
+        Args:
+            runTimeInSeconds (float): Length of the study in seconds (e.g. 5 * LifetimeStudy.ONE_YEAR_IN_SECONDS), the last mission may be cut short
+            updateInterval (float, optional): Seconds between capacity and resistance updates, at mission ends. Defaults to DEFAULT_UPDATE_INTERVAL.
+
+        Returns:
+            LifetimeResult: Health and capacity after every mission, and the cycles counted
+
+        Raises:
+            ValueError: If the mission has no duration, or exceeds the battery pack power limits
+        """
+        if self.missionDuration <= 0:
+            raise ValueError("A lifetime study needs powermodes with a positive duration.")
+
+        schedule = compile_schedule(self.consumers, self.powermodes)
+        validate_schedule(schedule, self.generator, self.voltageRegulatorEfficiency)
+
+        cell = self.generator.cells
+        missionCount = math.ceil(runTimeInSeconds / self.missionDuration)
+        missionEndTimes = np.minimum(np.arange(1, missionCount + 1) * float(self.missionDuration), runTimeInSeconds)
+        health = np.full(missionCount, np.nan)
+        capacity = np.full(missionCount, np.nan)
+        minStateOfCharge = np.full(missionCount, np.nan)
+        violation = None
+
+        self.aging.add(cell.stateOfCharge)
+        nextUpdate = updateInterval
+        previousStart = None
+
+        for m in range(missionCount):
+            # A mission starting from the same energy and capacity as the last one has the same trajectory
+            start = (cell.currentEnergy, cell.totalEnergyCapacity)
+            if start != previousStart:
+                try:
+                    trajectory = ChargeTrajectory.from_schedule(schedule, self.generator)
+                except ValueError as e:
+                    violation = str(e)
+                    break
+                previousStart = start
+
+            values = trajectory.breakpointValues
+            if missionEndTimes[m] - m * self.missionDuration < self.missionDuration:
+                # Last mission cut short
+                partialTimes = trajectory.breakpointTimes[trajectory.breakpointTimes < missionEndTimes[m] - m * self.missionDuration]
+                values = trajectory.state_of_charge_at(np.append(partialTimes, missionEndTimes[m] - m * self.missionDuration))
+
+            self.aging.add(values[1:])
+            cell.stateOfCharge = float(values[-1])
+            cell.currentEnergy = (cell.stateOfCharge / 100) * cell.totalEnergyCapacity
+            minStateOfCharge[m] = values.min()
+
+            if missionEndTimes[m] >= nextUpdate or m == missionCount - 1:
+                self.aging.apply()
+                nextUpdate = missionEndTimes[m] + updateInterval
+
+            health[m] = self.aging.health
+            capacity[m] = cell.totalEnergyCapacity
+
+        cell.currentVoltage = cell.voltageLookup.voltage(cell.stateOfCharge)
+        cycleRanges, cycleCounts = self.aging.counter.cycles()
+        endOfLife = np.flatnonzero(health <= CellAging.END_OF_LIFE_HEALTH)
+        endOfLifeTime = float(missionEndTimes[endOfLife[0]]) if len(endOfLife) > 0 else math.nan
+
+        return LifetimeResult(missionEndTimes, health, capacity, minStateOfCharge, cycleRanges, cycleCounts, endOfLifeTime, violation)
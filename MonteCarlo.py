@@ -0,0 +1,234 @@
+#!/usr/bin/python3
+
+# Standard libraries
+import zlib
+import warnings
+from dataclasses import dataclass
+
+# External libraries
+import numpy as np
+
+# Internal libraries
+from Simulation import Simulation
+from ParameterSweep import PackBatch
+from PowermodeSchedule import compile_schedule
+from Power.Consumption import Consumption
+from Power.ConsumerBank import ConsumerBank
+from Power.TraceConsumption import TraceConsumption
+from Power.BatteryCell import BatteryCell
+from Power.BatteryPack import BatteryPack
+
+
+@dataclass
+class Distribution:
+    NORMAL = "NORMAL"           # parameters = (mean, standard deviation)
+    UNIFORM = "UNIFORM"         # parameters = (low, high)
+    TRIANGULAR = "TRIANGULAR"   # parameters = (low, mode, high)
+
+    kind: str
+    parameters: tuple
+
+    def __post_init__(self):
+        if self.kind not in (Distribution.NORMAL, Distribution.UNIFORM, Distribution.TRIANGULAR):
+            raise ValueError(f"{self.kind} is an unsupported distribution. Use 'Distribution.NORMAL', 'Distribution.UNIFORM' or 'Distribution.TRIANGULAR'.")
+
+
+    def sample(self, rng: np.random.Generator, count: int) -> np.ndarray:
+        """ Draw random values from this distribution
+
+        Args:
+            rng (np.random.Generator): Random number generator to draw from
+            count (int): Number of values to draw
+
+        Returns:
+            np.ndarray: The random values
+        """
+        if self.kind == Distribution.NORMAL:
+            return rng.normal(*self.parameters, size=count)
+        elif self.kind == Distribution.UNIFORM:
+            return rng.uniform(*self.parameters, size=count)
+        else:
+            return rng.triangular(*self.parameters, size=count)
+
+
+@dataclass
+class MonteCarloResult:
+    times: np.ndarray                   # Units are seconds, the time axis of the percentile bands
+    p5: np.ndarray                      # Units are percentage, 5th percentile state of charge
+    p50: np.ndarray                     # Units are percentage, median state of charge
+    p95: np.ndarray                     # Units are percentage, 95th percentile state of charge
+    probabilityOfDepletion: float       # Fraction of samples that reach 0% state of charge
+    probabilityOfViolation: float       # Fraction of samples that Simulation.run() would stop with a ValueError
+    samples: int
+
+
+class MonteCarlo:
+
+    # Attributes of Consumption objects that can be given a Distribution, and the one each power draw mode uses
+    CONSUMER_ATTRIBUTES = ("minCurrent", "averageCurrent", "maxCurrent", "dutyCycle")
+    MODE_ATTRIBUTE = {Consumption.MIN_POWER_DRAW_MODE: "minCurrent",
+                      Consumption.AVG_POWER_DRAW_MODE: "averageCurrent",
+                      Consumption.MAX_POWER_DRAW_MODE: "maxCurrent"}
+
+    # Attributes of the battery cell and the simulation itself that can be given a Distribution
+    CELL_CAPACITY = "totalEnergyCapacity"
+    EFFICIENCY = "voltageRegulatorEfficiency"
+
+    PERCENTILES = (5, 50, 95)
+
+    def __init__(self, powerDrawSources: list[Consumption], powerGenerationSource: BatteryPack, modes: list, voltageRegulatorEfficiency: int):
+        """ Simulates thousands of random variations of one simulation in a single batch.
+
+            Every sample is one row of a PackBatch, so all samples advance together with one NumPy operation per block of
+            time steps. Only the percentile bands are kept, never each sample's full state of charge trace.
+
+        Args:
+            powerDrawSources (list[Consumption]): Submodules to simulate, with their nominal values.
+            powerGenerationSource (BatteryPack): The battery pack to simulate, with its nominal values and starting state.
+            modes (list): Power modes to simulate, in the same format as Simulation.powermodes
+            voltageRegulatorEfficiency (int): Nominal efficiency of a DC to DC voltage regulator
+        """
+        self.consumers = powerDrawSources
+        self.generator = powerGenerationSource
+        self.powermodes = modes
+        self.voltageRegulatorEfficiency = voltageRegulatorEfficiency
+        self.experimentDuration = sum(modes[i+1] for i in range(0, len(modes), 2))
+
+        # (Consumption object or None, attribute name) mapped to a Distribution
+        self.uncertainties = {}
+
+
+    def vary(self, attribute: str, distribution: Distribution, consumer: Consumption = None) -> None:
+        """ Replace one fixed simulation input with a random distribution
+
+        Args:
+            attribute (str): One of MonteCarlo.CONSUMER_ATTRIBUTES, MonteCarlo.CELL_CAPACITY or MonteCarlo.EFFICIENCY
+            distribution (Distribution): Distribution to draw the attribute from
+            consumer (Consumption, optional): The consumer to vary, required for consumer attributes. Defaults to None.
+
+        Raises:
+            ValueError: If the attribute can't be varied
+        """
+        if attribute in MonteCarlo.CONSUMER_ATTRIBUTES:
+            if consumer not in self.consumers:
+                raise ValueError(f"{attribute} is a Consumption attribute, pass one of the simulated consumers.")
+        elif attribute in (MonteCarlo.CELL_CAPACITY, MonteCarlo.EFFICIENCY):
+            consumer = None
+        else:
+            raise ValueError(f"{attribute} can't be varied. Use one of {MonteCarlo.CONSUMER_ATTRIBUTES}, '{MonteCarlo.CELL_CAPACITY}' or '{MonteCarlo.EFFICIENCY}'.")
+
+        self.uncertainties[(consumer, attribute)] = distribution
+
+
+    def draw(self, consumer: Consumption, attribute: str, nominal: float, samples: int, seed: int) -> np.ndarray:
+        """ Draw one attribute for every sample, from its own random stream
+
+            Each stream is seeded from the seed and the attribute's name, so adding or removing one uncertainty
+            never changes the values drawn for any other.
+
+        Args:
+            consumer (Consumption): The consumer the attribute belongs to, or None
+            attribute (str): Attribute name
+            nominal (float): Value used when the attribute has no Distribution
+            samples (int): Number of samples
+            seed (int): Seed of the whole Monte Carlo run
+
+        Returns:
+            np.ndarray: One value per sample
+        """
+        distribution = self.uncertainties.get((consumer, attribute))
+        if distribution is None:
+            return np.full(samples, float(nominal))
+
+        streamName = f"{consumer.name if consumer is not None else ''}.{attribute}"
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(zlib.crc32(streamName.encode()),)))
+
+        return distribution.sample(rng, samples)
+
+
+    def run(self, samples: int, seed: int = 0, runTimeInSeconds: int = None, bandInterval: int = Simulation.ONE_SECOND) -> MonteCarloResult:
+        """ Simulate every sample and reduce them to percentile bands of state of charge over time
+
+        Args:
+            samples (int): Number of random samples
+            seed (int, optional): Seed for reproducible results. Defaults to 0.
+            runTimeInSeconds (int, optional): The duration in seconds for which the simulation is run. Defaults to the full powermodes duration.
+            bandInterval (int, optional): Seconds between points of the percentile bands. Defaults to Simulation.ONE_SECOND.
+
+        Returns:
+            MonteCarloResult: Percentile bands and probabilities
+        """
+        if runTimeInSeconds is None:
+            runTimeInSeconds = self.experimentDuration
+
+        if self.experimentDuration < runTimeInSeconds:
+            raise ValueError(f"Requested simulation time of {runTimeInSeconds}, is more than time defined in the powermodes variable.")
+
+        if self.generator.charger is not None:
+            raise ValueError("MonteCarlo doesn't model a battery pack charger, recharge powermodes charge in a straight line.")
+
+        if any(isinstance(consumer, TraceConsumption) for consumer in self.consumers):
+            raise ValueError("MonteCarlo needs a constant load in every powermode, a TraceConsumption has no minimum, average and maximum current to vary.")
+
+        # Random inputs, clipped to physically possible values
+        consumerValues = {}
+        for consumer in self.consumers:
+            consumerValues[consumer] = {attribute: np.maximum(self.draw(consumer, attribute, getattr(consumer, attribute), samples, seed), 0.0) for attribute in MonteCarlo.CONSUMER_ATTRIBUTES}
+            consumerValues[consumer]["dutyCycle"] = np.minimum(consumerValues[consumer]["dutyCycle"], 100.0)
+
+        cell = self.generator.cells
+        capacity = np.maximum(self.draw(None, MonteCarlo.CELL_CAPACITY, cell.totalEnergyCapacity, samples, seed), np.finfo(float).tiny)
+        efficiency = np.clip(self.draw(None, MonteCarlo.EFFICIENCY, self.voltageRegulatorEfficiency, samples, seed), 0.0, 100.0)
+
+        # Same limits as BatteryCell.__init__() and BatteryPack.__init__(), for every sampled capacity
+        batch = PackBatch(samples)
+        batch.capacity = capacity
+        batch.cellMaxAmpere = cell.cRating * capacity / cell.nominalVoltage
+        batch.cellMaxPower = cell.maxVoltage * batch.cellMaxAmpere
+        maxPackAmpere = np.round(self.generator.parallelCount * batch.cellMaxAmpere, BatteryPack.SUGGESTED_ROUNDING)
+        batch.effectivePowerOutput = self.generator.maxPackVoltage * maxPackAmpere * (efficiency / 100)
+        batch.seriesCount[:] = self.generator.seriesCount
+        batch.parallelCount[:] = self.generator.parallelCount
+        batch.stateOfCharge[:] = cell.stateOfCharge
+        batch.energy = (cell.state_of_charge() / 100) * capacity
+        batch.nominalVoltage[:] = cell.nominalVoltage
+        if cell.equivalentCircuit is not None:
+            batch.set_circuit(slice(None), cell.equivalentCircuit)
+
+        # (attribute x consumer x sample) draws, and the row of each power draw mode's current
+        schedule = compile_schedule(self.consumers, self.powermodes)
+        sampled = np.array([[consumerValues[consumer][attribute] for consumer in self.consumers] for attribute in MonteCarlo.CONSUMER_ATTRIBUTES]).reshape(len(MonteCarlo.CONSUMER_ATTRIBUTES), len(self.consumers), samples)
+        modeRows = np.array([MonteCarlo.CONSUMER_ATTRIBUTES.index(MonteCarlo.MODE_ATTRIBUTE[mode]) for mode in sorted(MonteCarlo.MODE_ATTRIBUTE)])
+        voltage = np.array([consumer.voltage for consumer in self.consumers], dtype=np.float64)[:, None]
+        dutyCycle = sampled[MonteCarlo.CONSUMER_ATTRIBUTES.index("dutyCycle")]
+
+        def segment_load(segmentIndex: int) -> tuple:
+            current = sampled[modeRows[schedule["drawModes"][segmentIndex]], np.arange(len(self.consumers))]
+            return ConsumerBank.total_loads(voltage, current, dutyCycle, axis=0)
+
+        times = np.arange(0, max(runTimeInSeconds, 1), bandInterval)
+        bands = np.full((len(MonteCarlo.PERCENTILES), len(times)), np.nan)
+        bands[:, 0] = np.percentile(batch.stateOfCharge, MonteCarlo.PERCENTILES)
+        depleted = np.zeros(samples, dtype=bool)
+
+        def reduce_block(timeIndex: int, socBlock: np.ndarray, completed: np.ndarray) -> None:
+            valid = np.arange(socBlock.shape[1])[None, :] < completed[:, None]
+            depleted[:] |= (valid & (socBlock <= 0)).any(axis=1)
+
+            columns = np.arange((-timeIndex) % bandInterval, socBlock.shape[1], bandInterval)
+            if len(columns) == 0:
+                return
+
+            values = socBlock[:, columns]
+            if valid[:, columns].all():
+                bands[:, (timeIndex + columns) // bandInterval] = np.percentile(values, MonteCarlo.PERCENTILES, axis=0)
+            else:
+                # Samples stopped by a ValueError drop out of the bands from that time onwards
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", RuntimeWarning)
+                    bands[:, (timeIndex + columns) // bandInterval] = np.nanpercentile(np.where(valid[:, columns], values, np.nan), MonteCarlo.PERCENTILES, axis=0)
+
+        batch.run(self.powermodes, segment_load, runTimeInSeconds, reduce_block)
+        violated = np.array([violation is not None for violation in batch.violations])
+
+        return MonteCarloResult(times, bands[0], bands[1], bands[2], float(depleted.mean()), float(violated.mean()), samples)
@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+
+# Standard libraries
+from dataclasses import dataclass, field, replace
+
+# External libraries
+import numpy as np
+
+# Internal libraries
+from ParameterSweep import SweepConfiguration
+from PowermodeSchedule import compile_schedule, validate_schedule
+from ChargeTrajectory import ChargeTrajectory
+from Power.Consumption import Consumption
+
+
+@dataclass
+class PackCandidate:
+    configuration: SweepConfiguration
+    cellCount: int
+    packEnergy: float           # Units are Watt-hours, nominal energy of all cells together
+    powerMargin: float          # Units are Watts, usable pack power (BatteryPack.maxPackPower after the regulator) minus the peak powermode load
+
+
+@dataclass
+class SizingResult:
+    smallest: PackCandidate                                     # Fewest cells (so lowest mass and cost), largest power margin on ties, or None
+    front: list = field(default_factory=list)                   # PackCandidate objects that trade pack energy against power margin, smallest first
+    minimumParallel: dict = field(default_factory=dict)         # Series count mapped to the fewest parallel cells that complete the mission, or None
+    evaluations: int = 0                                        # Number of candidate packs simulated
+
+
+class PackOptimizer:
+
+    DEFAULT_MAX_SERIES = 16
+    DEFAULT_MAX_PARALLEL = 64
+
+    def __init__(self, powerDrawSources: list[Consumption], modes: list):
+        """ Finds the smallest battery packs that complete a powermodes schedule without dropping below a state of charge floor
+
+            Adding cells in series or in parallel only lowers the energy drawn from every cell and raises the pack power limit,
+            so whether a pack completes the mission is monotonic in both counts. That turns the search into one bisection over
+            the parallel count per series count, instead of simulating every configuration. (A recharge to a target below the
+            state of charge a bigger pack still has breaks this, as Simulation.run() raises a ValueError for it.)
+
+        Args:
+            powerDrawSources (list[Consumption]): Submodules to simulate, shared by every candidate pack.
+            modes (list): Power modes to simulate, in the same format as Simulation.powermodes
+        """
+        self.consumers = powerDrawSources
+        self.powermodes = modes
+        self.schedule = compile_schedule(powerDrawSources, modes)
+
+
+    def completes_mission(self, configuration: SweepConfiguration, stateOfChargeFloor: float) -> bool:
+        """ Simulate one candidate pack with the closed form ChargeTrajectory, the fastest engine for a single pack
+
+        Args:
+            configuration (SweepConfiguration): The candidate pack
+            stateOfChargeFloor (float): Lowest state of charge (in %) allowed at any time during the mission
+
+        Returns:
+            bool: True if the pack stays within its limits and above the floor for the whole mission
+        """
+        try:
+            pack = configuration.build_battery_pack()
+            validate_schedule(self.schedule, pack, configuration.efficiency)
+            trajectory = ChargeTrajectory.from_schedule(self.schedule, pack)
+        except ValueError:
+            return False
+
+        return bool(trajectory.runningMinimum[-1] >= stateOfChargeFloor)
+
+
+    def optimize(self, cell: SweepConfiguration, stateOfChargeFloor: float, maxSeries: int = DEFAULT_MAX_SERIES, maxParallel: int = DEFAULT_MAX_PARALLEL) -> SizingResult:
+        """ Search every series and parallel count up to the limits for the packs that complete the mission
+
+        Args:
+            cell (SweepConfiguration): Cell chemistry, voltage, energy, C-rating and regulator efficiency shared by every candidate, its packConfiguration is ignored
+            stateOfChargeFloor (float): Lowest state of charge (in %) allowed at any time during the mission
+            maxSeries (int, optional): Most cells in series. Defaults to DEFAULT_MAX_SERIES.
+            maxParallel (int, optional): Most cells in parallel. Defaults to DEFAULT_MAX_PARALLEL.
+
+        Returns:
+            SizingResult: The smallest pack and the Pareto front of pack energy against power margin
+
+        Raises:
+            ValueError: If a limit is less than one
+        """
+        if maxSeries < 1 or maxParallel < 1:
+            raise ValueError("Pack sizing needs at least one series and one parallel cell.")
+
+        result = SizingResult(None)
+
+        def candidate(seriesCount: int, parallelCount: int) -> SweepConfiguration:
+            return replace(cell, packConfiguration=[f"{seriesCount}S", f"{parallelCount}P"])
+
+        def completes(seriesCount: int, parallelCount: int) -> bool:
+            result.evaluations += 1
+            return self.completes_mission(candidate(seriesCount, parallelCount), stateOfChargeFloor)
+
+        # More series cells never need more parallel cells, so each bisection searches below the previous answer
+        upper = maxParallel
+        for seriesCount in range(1, maxSeries + 1):
+            if not completes(seriesCount, upper):
+                result.minimumParallel[seriesCount] = None
+                continue
+
+            low, high = 1, upper
+            while low < high:
+                middle = (low + high) // 2
+                if completes(seriesCount, middle):
+                    high = middle
+                else:
+                    low = middle + 1
+
+            result.minimumParallel[seriesCount] = low
+            upper = low
+
+        # Every count above a minimum also completes the mission, so the front needs no more simulations
+        peakLoad = float(self.schedule["totalPower"].max(initial=0.0))
+        candidates = []
+        for seriesCount, minimumParallel in result.minimumParallel.items():
+            if minimumParallel is None:
+                continue
+
+            for parallelCount in range(minimumParallel, maxParallel + 1):
+                configuration = candidate(seriesCount, parallelCount)
+                usablePower = float(configuration.build_battery_pack().maxPackPower) * (cell.efficiency / 100)
+                candidates.append(PackCandidate(configuration, seriesCount * parallelCount, seriesCount * parallelCount * cell.cellEnergy, usablePower - peakLoad))
+
+        if len(candidates) == 0:
+            return result
+
+        candidates.sort(key=lambda c: (c.packEnergy, -c.powerMargin))
+        result.smallest = candidates[0]
+
+        bestMargin = -np.inf
+        for c in candidates:
+            if c.powerMargin > bestMargin:
+                result.front.append(c)
+                bestMargin = c.powerMargin
+
+        return result
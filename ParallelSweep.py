@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+
+# Standard libraries
+import os
+import math
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+
+# External libraries
+import numpy as np
+
+# Internal libraries
+from Simulation import Simulation
+from ParameterSweep import SweepResult
+from Power.Consumption import Consumption
+from Power.BatteryCell import BatteryCell
+
+# Shared memory block each worker process attaches to once in worker_initializer(), and the trace of runs nobody asked to keep
+workerSharedMemory = None
+workerTraces = None
+workerScratchTrace = None
+
+
+def worker_initializer(sharedMemoryName: str, shape: tuple, chemistrySources: dict = None, chemistryCacheDirectory: str = None) -> None:
+    """ Attach a worker process to the shared (kept trace x time) state of charge trace array
+
+    Args:
+        sharedMemoryName (str): Name of the multiprocessing.shared_memory block created by the parent process
+        shape (tuple): Shape of the trace array (number of traces to keep, experiment duration in seconds)
+        chemistrySources (dict, optional): ChemistryRegistry.sources of the parent process. Defaults to None.
+        chemistryCacheDirectory (str, optional): ChemistryRegistry.cacheDirectory of the parent process. Defaults to None.
+    """
+    global workerSharedMemory, workerTraces, workerScratchTrace
+
+    # Registered chemistries memory map the curves the parent process already resampled, rather than each reading the data files
+    if chemistrySources:
+        BatteryCell.REGISTRY.cacheDirectory = chemistryCacheDirectory
+        for chemistry, (path, maxCycles) in chemistrySources.items():
+            if chemistry not in BatteryCell.REGISTRY:
+                BatteryCell.REGISTRY.register(chemistry, path, maxCycles)
+
+    workerSharedMemory = shared_memory.SharedMemory(name=sharedMemoryName)
+    workerTraces = np.ndarray(shape, dtype=np.float64, buffer=workerSharedMemory.buf)
+    workerScratchTrace = np.empty(shape[1])
+
+
+def worker_run(indexes: list, traceRows: list, configurations: list, consumers: list, powermodes: list, runTimeInSeconds: int, engine: str) -> list:
+    """ Run one chunk of independent simulations, each writing its trace straight into its row of the shared trace array
+
+        Runs whose trace isn't kept write into this process's scratch trace instead, which is only used for their summary.
+
+    Args:
+        indexes (list): Index of each configuration in the whole sweep
+        traceRows (list): Row of the shared trace array for each configuration, or None to use the scratch trace
+        configurations (list): SweepConfiguration objects to simulate
+        consumers (list): Consumption objects shared by all configurations
+        powermodes (list): Power modes to simulate, keyed by the consumers above
+        runTimeInSeconds (int): The duration in seconds for which each simulation is run
+        engine (str): Simulation engine to use, defined as a CONSTANT in Simulation.py
+
+    Returns:
+        list: One (index, end state of charge, minimum state of charge, time to empty, steps run, ValueError message or None) tuple per configuration
+    """
+    summaries = []
+
+    for index, traceRow, configuration in zip(indexes, traceRows, configurations):
+        # NaN marks every second the simulation never reached, because it finished or raised
+        trace = workerScratchTrace if traceRow is None else workerTraces[traceRow]
+        trace[:] = np.nan
+
+        try:
+            # One second steps and a dense log, so trace index k is always the time k seconds in the summary below
+            sim = Simulation(consumers, configuration.build_battery_pack(), powermodes, Simulation.ONE_SECOND)
+        except ValueError as e:
+            summaries.append((index, np.nan, np.nan, np.nan, 0, str(e)))
+            continue
+
+        initialStateOfCharge = sim.generator.cells.stateOfCharge
+        # The engine writes every step straight into the trace, with no per-process copy of it
+        sim.batteryPackPercentageLog = trace
+        error = None
+
+        try:
+            sim.run(runTimeInSeconds, configuration.efficiency, engine)
+        except ValueError as e:
+            error = str(e)
+
+        reached = ~np.isnan(trace)
+        stepsRun = len(trace) if reached.all() else int(reached.argmin())
+        empty = reached & (trace <= 0)
+        empty[:1] = False
+        timeToEmpty = empty.argmax() if empty.any() else np.nan
+
+        summaries.append((index, sim.generator.cells.state_of_charge(), min(initialStateOfCharge, np.nanmin(trace[1:], initial=np.inf)), timeToEmpty, stepsRun, error))
+
+    return summaries
+
+
+class ParallelSweep:
+
+    # Maximum number of chunks waiting in the process pool for every worker process
+    CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+    def __init__(self, powerDrawSources: list[Consumption], modes: list, maxWorkers: int = None, chunkSize: int = None):
+        """ Runs independent Simulation objects, one per battery pack configuration, across all CPU cores.
+
+            Use this for sweeps that ParameterSweep can't batch into one array computation. Workers write the state of
+            charge traces that are kept straight into one shared memory array, with one row per kept trace, so only small
+            summaries are pickled back and memory use doesn't grow with the number of configurations.
+
+        Args:
+            powerDrawSources (list[Consumption]): Submodules to simulate, shared by all configurations.
+            modes (list): Power modes to simulate, in the same format as Simulation.powermodes
+            maxWorkers (int, optional): Number of worker processes. Defaults to the number of CPU cores.
+            chunkSize (int, optional): Configurations per task sent to a worker. Defaults to about four tasks per worker.
+        """
+        self.consumers = powerDrawSources
+        self.powermodes = modes
+        self.experimentDuration = sum(modes[i+1] for i in range(0, len(modes), 2))
+        self.maxWorkers = maxWorkers or os.cpu_count() or 1
+        self.chunkSize = chunkSize
+
+
+    def run(self, configurations: list, runTimeInSeconds: int = None, engine: str = Simulation.VECTORIZED_ENGINE, progressCallback = None, traceIndexes: list = ()) -> SweepResult:
+        """ Simulate every configuration in a process pool
+
+        Args:
+            configurations (list): SweepConfiguration objects, see ParameterSweep.grid()
+            runTimeInSeconds (int, optional): The duration in seconds for which the simulation is run. Defaults to the full powermodes duration.
+            engine (str, optional): Simulation engine each worker uses, defined as a CONSTANT in Simulation.py. Defaults to VECTORIZED_ENGINE.
+            progressCallback (callable, optional): Called as progressCallback(completedCount, totalCount) every time a chunk finishes.
+            traceIndexes (list, optional): Indexes into configurations to keep a full state of charge trace for. Defaults to none.
+
+        Returns:
+            SweepResult: Per configuration summary in the same order as configurations, plus the requested traces.
+        """
+        if runTimeInSeconds is None:
+            runTimeInSeconds = self.experimentDuration
+
+        if self.experimentDuration < runTimeInSeconds:
+            raise ValueError(f"Requested simulation time of {runTimeInSeconds}, is more than time defined in the powermodes variable.")
+
+        # Summaries read times straight off trace indexes, which needs one of these engines and its dense one second log
+        if engine not in (Simulation.LOOP_ENGINE, Simulation.VECTORIZED_ENGINE, Simulation.EVENT_ENGINE):
+            raise ValueError(f"{engine} is an unsupported simulation engine. Use 'Simulation.LOOP_ENGINE', 'Simulation.VECTORIZED_ENGINE' or 'Simulation.EVENT_ENGINE'.")
+
+        count = len(configurations)
+        traceRowOf = {c: row for row, c in enumerate(dict.fromkeys(traceIndexes))}
+        shape = (len(traceRowOf), self.experimentDuration)
+        chunkSize = self.chunkSize or max(1, math.ceil(count / (self.maxWorkers * 4)))
+        chunks = [list(range(start, min(start + chunkSize, count))) for start in range(0, count, chunkSize)]
+
+        endStateOfCharge = np.full(count, np.nan)
+        minStateOfCharge = np.full(count, np.nan)
+        timeToEmpty = np.full(count, np.nan)
+        stepsRun = np.zeros(count, dtype=np.int64)
+        violations = [None] * count
+        completedCount = 0
+
+        # Resample registered chemistries once here, so worker processes only memory map them
+        for chemistry in {configuration.chemistry for configuration in configurations}:
+            BatteryCell.load_chemistry(chemistry)
+
+        sharedMemory = shared_memory.SharedMemory(create=True, size=max(1, shape[0] * shape[1] * np.dtype(np.float64).itemsize))
+        try:
+            with ProcessPoolExecutor(max_workers=self.maxWorkers, initializer=worker_initializer,
+                                     initargs=(sharedMemory.name, shape, BatteryCell.REGISTRY.sources, BatteryCell.REGISTRY.cacheDirectory)) as pool:
+                pending = set()
+                nextChunk = 0
+
+                while nextChunk < len(chunks) or pending:
+                    # Submit chunks lazily, so a huge sweep never queues every task (and its pickled arguments) at once
+                    while nextChunk < len(chunks) and len(pending) < self.maxWorkers * ParallelSweep.CHUNKS_IN_FLIGHT_PER_WORKER:
+                        indexes = chunks[nextChunk]
+                        pending.add(pool.submit(worker_run, indexes, [traceRowOf.get(c) for c in indexes], [configurations[c] for c in indexes], self.consumers, self.powermodes, runTimeInSeconds, engine))
+                        nextChunk += 1
+
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        for index, endSoC, minSoC, emptyTime, steps, error in future.result():
+                            endStateOfCharge[index] = endSoC
+                            minStateOfCharge[index] = minSoC
+                            timeToEmpty[index] = emptyTime
+                            stepsRun[index] = steps
+                            violations[index] = error
+                            completedCount += 1
+
+                        if progressCallback is not None:
+                            progressCallback(completedCount, count)
+
+            sharedTraces = np.ndarray(shape, dtype=np.float64, buffer=sharedMemory.buf)
+            traces = {c: sharedTraces[row].copy() for c, row in traceRowOf.items()}
+            del sharedTraces
+        finally:
+            sharedMemory.close()
+            sharedMemory.unlink()
+
+        violationTime = np.where([v is not None for v in violations], stepsRun, -1).astype(np.int64)
+
+        return SweepResult(configurations, endStateOfCharge, minStateOfCharge, timeToEmpty, violationTime, violations, traces)
+
@@ -0,0 +1,379 @@
+#!/usr/bin/python3
+
+# Standard libraries
+import itertools
+from dataclasses import dataclass, field
+
+# External libraries
+import numpy as np
+
+# Internal libraries
+from PowermodeSchedule import compile_schedule, format_watts
+from Power.Consumption import Consumption
+from Power.TraceConsumption import TraceConsumption
+from Power.BatteryCell import BatteryCell
+from Power.BatteryPack import BatteryPack
+from Power.EquivalentCircuit import EquivalentCircuit, rc_response
+
+
+@dataclass
+class SweepConfiguration:
+    chemistry: str = BatteryCell.LI_FE_P_O4
+    cellVoltage: float = 3.65                                       # Units are Volts (V), sets the initial state of charge
+    cellEnergy: float = 5.0                                         # Units are Watt-hours (Wh)
+    cRating: int = 10                                               # Unitless
+    packConfiguration: list = field(default_factory=lambda: ['1S', '1P'])
+    efficiency: int = 95                                            # Units are percent (25-99%)
+    equivalentCircuit: EquivalentCircuit = None                     # Optional internal resistance and RC pairs, copied into every cell built
+
+    def build_battery_pack(self) -> BatteryPack:
+        """ Build the BatteryPack object this configuration describes
+
+        Returns:
+            BatteryPack: A newly initialized battery pack.
+
+        Raises:
+            ValueError: If the cell or pack parameters are invalid.
+        """
+        cell = BatteryCell(self.cellVoltage, self.cellEnergy, self.cRating, self.chemistry)
+        if self.equivalentCircuit is not None:
+            cell.equivalentCircuit = self.equivalentCircuit.copy()
+
+        return BatteryPack(cell, list(self.packConfiguration))
+
+
+@dataclass
+class SweepResult:
+    configurations: list                                            # SweepConfiguration objects, one per row of every array below
+    endStateOfCharge: np.ndarray                                    # Units are percentage, at the end of the run or at the first violation
+    minStateOfCharge: np.ndarray                                    # Units are percentage
+    timeToEmpty: np.ndarray                                         # Units are seconds, NaN if a pack never reaches 0%
+    violationTime: np.ndarray                                       # Units are seconds, -1 if a pack never violates a limit
+    violations: list = field(default_factory=list)                  # ValueError message Simulation.run() would raise, or None
+    traces: dict = field(default_factory=dict)                      # Configuration index mapped to a batteryPackPercentageLog style array
+    irLossEnergy: np.ndarray = None                                 # Units are Watt-hours, heat given off inside every pack, or None if not worked out
+
+
+class PackBatch:
+
+    # Number of one second time steps computed together in each (row x time) block, and the most values in one block, bounding memory use
+    CHUNK_SIZE = 4096
+    MAX_BLOCK_ELEMENTS = 4000000
+
+    def __init__(self, count: int):
+        """ Many battery packs simulated together, one per row of every array, with the same time stepping as Simulation.run()
+
+            Rows start out empty, fill them with set_row() or by writing the per row arrays directly.
+
+        Args:
+            count (int): Number of battery packs (rows)
+        """
+        self.count = count
+        self.built = np.ones(count, dtype=bool)                             # False if a row's BatteryCell or BatteryPack is invalid
+        self.alive = np.ones(count, dtype=bool)                             # False once a row has violated a limit
+        self.violations = [None] * count                                    # ValueError message Simulation.run() would raise
+        self.violationTime = np.full(count, -1, dtype=np.int64)            # Units are seconds
+
+        self.capacity = np.ones(count)                                      # BatteryCell.totalEnergyCapacity
+        self.cellMaxAmpere = np.zeros(count)                                # BatteryCell.maxAmpere
+        self.cellMaxPower = np.ones(count)                                  # BatteryCell.maxPower
+        self.effectivePowerOutput = np.zeros(count)                         # BatteryPack.maxPackPower * efficiency
+        self.seriesCount = np.ones(count)
+        self.parallelCount = np.ones(count)
+        self.stateOfCharge = np.zeros(count)                                # BatteryCell.stateOfCharge attribute
+        self.energy = np.zeros(count)                                       # BatteryCell.currentEnergy attribute
+        self.nominalVoltage = np.ones(count)                                # BatteryCell.nominalVoltage, sets the charging current
+
+        # EquivalentCircuit of every row, padded to MAX_RC_PAIRS with pairs that never hold a voltage or give off heat
+        self.equivalentCircuit = False                                      # True once any row has an EquivalentCircuit
+        self.seriesResistance = np.zeros(count)                             # Units are Ohms
+        self.pairResistance = np.zeros((count, EquivalentCircuit.MAX_RC_PAIRS))
+        self.pairConductance = np.zeros((count, EquivalentCircuit.MAX_RC_PAIRS))
+        self.timeConstant = np.ones((count, EquivalentCircuit.MAX_RC_PAIRS))
+        self.pairVoltage = np.zeros((count, EquivalentCircuit.MAX_RC_PAIRS))
+        self.irLossEnergy = np.zeros(count)                                 # Units are Watt-hours, heat given off inside the whole pack
+
+
+    def set_row(self, c: int, pack: BatteryPack, voltageRegulatorEfficiency: int) -> None:
+        """ Copy the limits and state of a real BatteryPack object into one row, so every limit matches Simulation.run()
+
+        Args:
+            c (int): Row index
+            pack (BatteryPack): Battery pack to copy
+            voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+        """
+        self.capacity[c] = pack.cells.totalEnergyCapacity
+        self.cellMaxAmpere[c] = pack.cells.maxAmpere
+        self.cellMaxPower[c] = pack.cells.maxPower
+        self.effectivePowerOutput[c] = pack.maxPackPower * (voltageRegulatorEfficiency / 100)
+        self.seriesCount[c] = pack.seriesCount
+        self.parallelCount[c] = pack.parallelCount
+        self.stateOfCharge[c] = pack.cells.stateOfCharge
+        self.energy[c] = pack.cells.currentEnergy
+        self.nominalVoltage[c] = pack.cells.nominalVoltage
+        if pack.cells.equivalentCircuit is not None:
+            self.set_circuit(c, pack.cells.equivalentCircuit)
+
+
+    def set_circuit(self, rows, circuit: EquivalentCircuit) -> None:
+        """ Give rows the internal resistance, RC pairs and RC pair state of an EquivalentCircuit
+
+        Args:
+            rows (int, slice or np.ndarray): Row indexes
+            circuit (EquivalentCircuit): Circuit to copy
+        """
+        pairs = len(circuit.pairResistance)
+        self.seriesResistance[rows] = circuit.seriesResistance
+        self.pairResistance[rows, :pairs] = circuit.pairResistance
+        self.pairConductance[rows, :pairs] = 1 / circuit.pairResistance
+        self.timeConstant[rows, :pairs] = circuit.timeConstant
+        self.pairVoltage[rows, :pairs] = circuit.pairVoltage
+        self.equivalentCircuit = True
+
+
+    def circuit_block(self, cellAmpere: np.ndarray, columns: int) -> tuple:
+        """ Exact response of every row's EquivalentCircuit to a constant current over the next one second time steps
+
+        Args:
+            cellAmpere (np.ndarray): Current through every cell of every row (in Amps), negative when charging
+            columns (int): Number of time steps
+
+        Returns:
+            np.ndarray: Energy (in Watt-hours) every cell supplies on top of the load, per row and time step
+            np.ndarray: Energy (in Watt-hours) every cell turns into heat, per row and time step
+            np.ndarray: Voltage across every RC pair at the end of every time step, per row, pair and time step
+        """
+        stepEnds = np.arange(1, columns + 1, dtype=np.float64)
+        current = cellAmpere[:, None]
+        drawn = current * current * self.seriesResistance[:, None] * np.ones(columns)
+        heat = drawn.copy()
+        pairVoltages = np.empty((self.count, EquivalentCircuit.MAX_RC_PAIRS, columns))
+
+        for k in range(EquivalentCircuit.MAX_RC_PAIRS):
+            pairVoltages[:, k], voltageIntegral, pairHeat = rc_response(self.pairVoltage[:, k, None], current * self.pairResistance[:, k, None], self.timeConstant[:, k, None],
+                                                                        self.pairConductance[:, k, None], stepEnds - 1, stepEnds)
+            drawn += current * voltageIntegral
+            heat += pairHeat
+
+        return drawn / 3600, heat / 3600, pairVoltages
+
+
+    def stop(self, c: int, message: str, time: int) -> None:
+        """ Record the first limit violation of one row and stop simulating it
+
+        Args:
+            c (int): Row index
+            message (str): The ValueError message Simulation.run() would raise
+            time (int): Time in seconds of the violation
+        """
+        self.alive[c] = False
+        self.violations[c] = message
+        self.violationTime[c] = time
+
+
+    def run(self, modes: list, segmentLoad, runTimeInSeconds: int, blockHandler) -> None:
+        """ Simulate every row through the powermodes, handing each (row x time) block of state of charge values to blockHandler
+
+            A row that violates a limit stops at that time step, just like Simulation.run() raising would.
+
+        Args:
+            modes (list): Power modes to simulate, in the same format as Simulation.powermodes
+            segmentLoad (callable): Called as segmentLoad(segmentIndex), returns the total current (A), total power (W) and
+                                    energy used each second (Wh), either as floats shared by all rows or as one array entry per row
+            runTimeInSeconds (int): The duration in seconds for which the simulation is run.
+            blockHandler (callable): Called as blockHandler(timeIndex, socBlock, completed) for every block, where socBlock[c, j] is
+                                     the state of charge of row c at log index timeIndex + j, valid only for j < completed[c]
+        """
+        chunkSize = max(1, min(PackBatch.CHUNK_SIZE, PackBatch.MAX_BLOCK_ELEMENTS // max(1, self.count)))
+        timeIndex = 1
+        totalElaspedTime = 1
+
+        for i in range(0, len(modes), 2):
+            timeDuration = modes[i+1]
+            timeStepsToRun = min(timeDuration, runTimeInSeconds - totalElaspedTime)
+
+            if timeStepsToRun > 0:
+                isRecharge = BatteryCell.RECHARGE in modes[i]
+
+                if isRecharge:
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        fastestAllowedRechargeTime = np.trunc(((self.capacity - self.energy) / self.cellMaxPower) * 3600) / self.parallelCount
+                    rechargeStep = (modes[i][BatteryCell.RECHARGE] - (self.energy / self.capacity) * 100) / timeStepsToRun
+
+                    for c in np.flatnonzero(self.alive & ~(fastestAllowedRechargeTime <= timeDuration)):
+                        self.stop(c, f"Requested recharge time of {timeDuration} seconds is too fast!", timeIndex)
+                    for c in np.flatnonzero(self.alive & (rechargeStep + self.stateOfCharge < self.stateOfCharge)):
+                        self.stop(c, f"Requested State of Recharge ({rechargeStep[c] + self.stateOfCharge[c]}%), is less than current state of charge ({round(self.stateOfCharge[c], 2)}%).", timeIndex)
+
+                    step = rechargeStep
+                    carry = self.stateOfCharge.copy()
+
+                    # Same as VectorizedEngine.charging_ampere(), the charger supplies the IR losses
+                    circuitAmpere = -(rechargeStep / 100) * self.capacity * 3600 / self.nominalVoltage
+                else:
+                    totalCurrentDraw, totalPowerDraw, energyUsed = (np.broadcast_to(value, (self.count,)) for value in segmentLoad(i // 2))
+                    cellCurrentDraw = totalCurrentDraw / self.parallelCount
+
+                    for c in np.flatnonzero(self.alive & (totalPowerDraw > self.effectivePowerOutput)):
+                        self.stop(c, f"Warning: Total power draw of {format_watts(totalPowerDraw[c])} Watts, exceeds battery pack capacity of {self.effectivePowerOutput[c]} Watts", timeIndex)
+                    for c in np.flatnonzero(self.alive & (cellCurrentDraw > self.cellMaxAmpere)):
+                        self.stop(c, f"Current draw of {cellCurrentDraw[c]} exceeds maximum limit of {self.cellMaxAmpere[c]} for the battery cell(s)", timeIndex)
+
+                    step = -(energyUsed / (self.seriesCount * self.parallelCount))
+                    carry = self.energy.copy()
+                    circuitAmpere = cellCurrentDraw
+
+                for start in range(0, timeStepsToRun, chunkSize):
+                    columns = min(chunkSize, timeStepsToRun - start)
+
+                    # Sequential cumulative sum along time gives the same values as Simulation.run() adding one step per second
+                    block = np.empty((self.count, columns + 1))
+                    block[:, 0] = carry
+                    block[:, 1:] = step[:, None]
+                    if self.equivalentCircuit:
+                        drawn, heat, pairVoltages = self.circuit_block(circuitAmpere, columns)
+                        if not isRecharge:
+                            block[:, 1:] -= drawn
+                    np.cumsum(block, axis=1, out=block)
+
+                    completed = np.where(self.alive, columns, 0)
+                    if isRecharge:
+                        tooHigh = block[:, 1:] > BatteryCell.MAX_STATE_OF_CHARGE
+                        failed = self.alive & tooHigh.any(axis=1)
+                        completed[failed] = tooHigh[failed].argmax(axis=1)
+                        socBlock = ((self.capacity[:, None] * (block[:, 1:] / 100)) / self.capacity[:, None]) * 100
+                    else:
+                        failed = np.zeros(self.count, dtype=bool)
+                        np.maximum(block, 0.00, out=block)
+                        socBlock = (block[:, 1:] / self.capacity[:, None]) * 100
+
+                    blockHandler(timeIndex + start, socBlock, completed)
+
+                    carry = block[np.arange(self.count), completed]
+                    if self.equivalentCircuit:
+                        stepped = np.flatnonzero(completed > 0)
+                        self.pairVoltage[stepped] = pairVoltages[stepped, :, completed[stepped] - 1]
+                        valid = np.arange(columns)[None, :] < completed[:, None]
+                        self.irLossEnergy += np.where(valid, heat, 0.0).sum(axis=1) * self.seriesCount * self.parallelCount
+                    for c in np.flatnonzero(failed):
+                        self.stop(c, "Can't recharge battery cell above 100%", timeIndex + start + completed[c])
+
+                    if isRecharge:
+                        changed = completed > 0
+                        self.stateOfCharge[changed] = carry[changed]
+                        self.energy[changed] = self.capacity[changed] * (carry[changed] / 100)
+                    else:
+                        self.energy[self.alive] = carry[self.alive]
+                        self.stateOfCharge[self.alive] = (self.energy[self.alive] / self.capacity[self.alive]) * 100
+
+                timeIndex += timeStepsToRun
+
+            totalElaspedTime += timeStepsToRun
+            if totalElaspedTime > runTimeInSeconds:
+                break
+
+
+    def end_state_of_charge(self) -> np.ndarray:
+        """ State of charge of every row, at the end of the run or at its first violation
+
+        Returns:
+            np.ndarray: State of charge in %, NaN for rows that were never built
+        """
+        return np.where(self.built, (self.energy / self.capacity) * 100, np.nan)
+
+
+class ParameterSweep:
+
+    def __init__(self, powerDrawSources: list[Consumption], modes: list):
+        """ Runs the same powermodes against many battery pack configurations at once.
+
+            Every configuration is one row of a (configuration x time) array, so the whole sweep is computed
+            with one NumPy operation per block of time steps, instead of one Simulation.run() per configuration.
+
+        Args:
+            powerDrawSources (list[Consumption]): Submodules to simulate, shared by all configurations.
+            modes (list): Power modes to simulate, in the same format as Simulation.powermodes
+        """
+        self.consumers = powerDrawSources
+        self.powermodes = modes
+        self.experimentDuration = sum(modes[i+1] for i in range(0, len(modes), 2))
+
+
+    @staticmethod
+    def grid(chemistries: list, cellVoltages: list, cellEnergies: list, cRatings: list, packConfigurations: list, efficiencies: list) -> list:
+        """ Build every combination (cartesian product) of the given parameter values
+
+        Args:
+            chemistries (list): Chemistry types, defined as CONSTANTS in BatteryCell.py
+            cellVoltages (list): Initial single cell voltages in Volts
+            cellEnergies (list): Single cell energy capacities in Watt-hours
+            cRatings (list): Single cell C-ratings
+            packConfigurations (list): Series and parallel configurations (e.g. [['2S', '1P'], ['2S', '2P']])
+            efficiencies (list): DC to DC voltage regulator efficiencies in percent
+
+        Returns:
+            list: SweepConfiguration objects
+        """
+        return [SweepConfiguration(*values) for values in itertools.product(chemistries, cellVoltages, cellEnergies, cRatings, packConfigurations, efficiencies)]
+
+
+    def run(self, configurations: list, runTimeInSeconds: int = None, traceIndexes: list = ()) -> SweepResult:
+        """ Simulate every configuration, with the same time stepping, limits, and ValueError messages as Simulation.run()
+
+            A configuration that violates a limit stops at that time step, just like Simulation.run() raising would.
+
+        Args:
+            configurations (list): SweepConfiguration objects, see ParameterSweep.grid()
+            runTimeInSeconds (int, optional): The duration in seconds for which the simulation is run. Defaults to the full powermodes duration.
+            traceIndexes (list, optional): Indexes into configurations to keep a full state of charge trace for. Defaults to none.
+
+        Returns:
+            SweepResult: Per configuration summary, plus the requested traces.
+        """
+        if runTimeInSeconds is None:
+            runTimeInSeconds = self.experimentDuration
+
+        if self.experimentDuration < runTimeInSeconds:
+            raise ValueError(f"Requested simulation time of {runTimeInSeconds}, is more than time defined in the powermodes variable.")
+
+        if any(isinstance(consumer, TraceConsumption) for consumer in self.consumers):
+            raise ValueError("ParameterSweep needs a constant load in every powermode, run a Simulation for every configuration with a TraceConsumption.")
+
+        batch = PackBatch(len(configurations))
+        for c, configuration in enumerate(configurations):
+            try:
+                batch.set_row(c, configuration.build_battery_pack(), configuration.efficiency)
+            except ValueError as e:
+                batch.built[c] = False
+                batch.stop(c, str(e), 0)
+
+        minStateOfCharge = np.where(batch.built, batch.stateOfCharge, np.nan)
+        timeToEmpty = np.full(batch.count, np.nan)
+        traces = {}
+        for c in traceIndexes:
+            traces[c] = np.full(self.experimentDuration, np.nan)
+            if batch.built[c]:
+                traces[c][0] = int(batch.stateOfCharge[c])
+
+        def summarize_block(timeIndex: int, socBlock: np.ndarray, completed: np.ndarray) -> None:
+            nonlocal minStateOfCharge
+            valid = np.arange(socBlock.shape[1])[None, :] < completed[:, None]
+            blockMin = np.where(valid, socBlock, np.inf).min(axis=1)
+            minStateOfCharge = np.where(completed > 0, np.fmin(minStateOfCharge, blockMin), minStateOfCharge)
+
+            empty = valid & (socBlock <= 0)
+            newlyEmpty = np.isnan(timeToEmpty) & empty.any(axis=1)
+            timeToEmpty[newlyEmpty] = timeIndex + empty[newlyEmpty].argmax(axis=1)
+
+            for c, trace in traces.items():
+                trace[timeIndex:timeIndex + completed[c]] = socBlock[c, :completed[c]]
+
+        # Loads are shared by every configuration, so they come straight from the compiled powermodes
+        schedule = compile_schedule(self.consumers, self.powermodes)
+
+        def segment_load(segmentIndex: int) -> tuple:
+            return schedule["totalCurrent"][segmentIndex], schedule["totalPower"][segmentIndex], schedule["energyPerSecond"][segmentIndex]
+
+        batch.run(self.powermodes, segment_load, runTimeInSeconds, summarize_block)
+
+        return SweepResult(configurations, batch.end_state_of_charge(), minStateOfCharge, timeToEmpty, batch.violationTime, batch.violations, traces, batch.irLossEnergy)
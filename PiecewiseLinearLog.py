@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+
+# External libraries
+import numpy as np
+
+
+class StepTimes:
+
+    def __init__(self, timeStep: float, startIndexes: np.ndarray, startTimes: np.ndarray, timesToRun: np.ndarray, length: int):
+        """ Time (in seconds) of every batteryPackPercentageLog entry, worked out on demand instead of stored one per time step
+
+            Drop in replacement for the Simulation.timeLog list, with the same values as Simulation.calculate_time_log().
+
+        Args:
+            timeStep (float): Simulation.timeStep in seconds
+            startIndexes (np.ndarray): Log index of the first time step of every powermode
+            startTimes (np.ndarray): Start time in seconds of every powermode
+            timesToRun (np.ndarray): Time in seconds simulated in every powermode
+            length (int): Number of log entries, including the entry at time 0
+        """
+        self.timeStep = timeStep
+        self.startIndexes = np.asarray(startIndexes, dtype=np.int64)
+        self.startTimes = np.asarray(startTimes, dtype=np.float64)
+        self.timesToRun = np.asarray(timesToRun, dtype=np.float64)
+        self.length = length
+
+
+    def __len__(self):
+        return self.length
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.time_at(np.arange(self.length)[index])
+
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("StepTimes index out of range")
+
+        return float(self.time_at(np.array([index]))[0])
+
+
+    def __array__(self, dtype = None, copy = None) -> np.ndarray:
+        times = self.time_at(np.arange(self.length))
+        return times if dtype is None else times.astype(dtype)
+
+
+    def tolist(self) -> list:
+        return np.asarray(self).tolist()
+
+
+    def time_at(self, indexes: np.ndarray) -> np.ndarray:
+        """ Look up the time of any log entries in O(log n) each, where n is the number of powermodes
+
+        Args:
+            indexes (np.ndarray): Log indexes between 0 and len(self) - 1
+
+        Returns:
+            np.ndarray: Time in seconds of each log entry
+        """
+        indexes = np.asarray(indexes)
+        if len(self.startIndexes) == 0:
+            return np.zeros(indexes.shape)
+
+        mode = np.clip(np.searchsorted(self.startIndexes, indexes, side='right') - 1, 0, len(self.startIndexes) - 1)
+        stepNumber = indexes - self.startIndexes[mode] + 1
+        times = self.startTimes[mode] + np.minimum(stepNumber * self.timeStep, self.timesToRun[mode])
+
+        return np.where(indexes == 0, 0.0, times)
+
+
+class PiecewiseLinearLog:
+
+    def __init__(self, startTimes: np.ndarray, startValues: np.ndarray, slopes: np.ndarray, times: StepTimes, initialValue: float, solvedLength: int, fillValue: float):
+        """ State of charge log stored as straight line pieces instead of one value per time step
+
+            Within a powermode the state of charge changes linearly, so a whole run only needs a few pieces per powermode.
+            Any log entry or any time can be looked up in O(log n), where n is the number of pieces, and expand() gives the
+            same dense list Simulation.run() builds (to floating point rounding).
+
+        Args:
+            startTimes (np.ndarray): Start time in seconds of every piece, sorted
+            startValues (np.ndarray): State of charge (in %) at the start of every piece
+            slopes (np.ndarray): Change in state of charge (in %) per second of every piece
+            times (StepTimes): Time of every log entry
+            initialValue (float): Log entry 0, which Simulation.run() truncates to an integer for the GUI
+            solvedLength (int): Number of log entries the simulation reached, including entry 0
+            fillValue (float): Value of the log entries the simulation never reached
+        """
+        self.startTimes = startTimes
+        self.startValues = startValues
+        self.slopes = slopes
+        self.times = times
+        self.initialValue = initialValue
+        self.solvedLength = solvedLength
+        self.fillValue = fillValue
+
+
+    @classmethod
+    def from_events(cls, eventTimes: list, eventValues: list, times: StepTimes, initialValue: float, solvedLength: int, fillValue: float):
+        """ Build the pieces from a list of (time, value) breakpoints, such as EventSolver.eventTimes and EventSolver.eventStateOfCharge
+
+            Breakpoints that don't change the slope (like voltage snap events) are dropped.
+
+        Args:
+            eventTimes (list): Breakpoint times in seconds, sorted
+            eventValues (list): State of charge (in %) at every breakpoint
+            times (StepTimes): Time of every log entry
+            initialValue (float): Log entry 0
+            solvedLength (int): Number of log entries the simulation reached, including entry 0
+            fillValue (float): Value of the log entries the simulation never reached
+
+        Returns:
+            PiecewiseLinearLog: The compressed log
+        """
+        eventTimes = np.asarray(eventTimes, dtype=np.float64)
+        eventValues = np.asarray(eventValues, dtype=np.float64)
+
+        # Zero length pieces carry no information
+        keep = np.append(np.diff(eventTimes) > 0, True)
+        eventTimes, eventValues = eventTimes[keep], eventValues[keep]
+
+        slopes = np.append(np.diff(eventValues) / np.diff(eventTimes), 0.0)
+        slopeChanges = np.ones(len(slopes), dtype=bool)
+        slopeChanges[1:] = ~np.isclose(slopes[1:], slopes[:-1], rtol=1e-12, atol=0.0)
+
+        return cls(eventTimes[slopeChanges], eventValues[slopeChanges], slopes[slopeChanges], times, initialValue, solvedLength, fillValue)
+
+
+    def __len__(self):
+        return len(self.times)
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.values_at_indexes(np.arange(len(self))[index])
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("PiecewiseLinearLog index out of range")
+
+        return float(self.values_at_indexes(np.array([index]))[0])
+
+
+    def __iter__(self):
+        return iter(self.expand())
+
+
+    def __array__(self, dtype = None, copy = None) -> np.ndarray:
+        values = self.expand()
+        return values if dtype is None else values.astype(dtype)
+
+
+    def tolist(self) -> list:
+        return self.expand().tolist()
+
+
+    @property
+    def nbytes(self) -> int:
+        """ Memory used by the pieces, in bytes
+
+        Returns:
+            int: Bytes used
+        """
+        return self.startTimes.nbytes + self.startValues.nbytes + self.slopes.nbytes
+
+
+    def value_at(self, times: np.ndarray) -> np.ndarray:
+        """ State of charge at any times, in O(log n) each
+
+        Args:
+            times (np.ndarray): Times in seconds since start of simulation
+
+        Returns:
+            np.ndarray: State of charge (in %) at each time
+        """
+        times = np.asarray(times, dtype=np.float64)
+        piece = np.clip(np.searchsorted(self.startTimes, times, side='right') - 1, 0, len(self.startTimes) - 1)
+
+        return self.startValues[piece] + self.slopes[piece] * (times - self.startTimes[piece])
+
+
+    def values_at_indexes(self, indexes: np.ndarray) -> np.ndarray:
+        """ Log entries at any indexes, exactly as the dense batteryPackPercentageLog list would hold them
+
+        Args:
+            indexes (np.ndarray): Log indexes between 0 and len(self) - 1
+
+        Returns:
+            np.ndarray: State of charge (in %) of each log entry
+        """
+        indexes = np.asarray(indexes)
+        values = self.value_at(self.times.time_at(indexes))
+        values = np.where(indexes >= self.solvedLength, self.fillValue, values)
+
+        return np.where(indexes == 0, self.initialValue, values)
+
+
+    def expand(self) -> np.ndarray:
+        """ Expand back to one value per time step
+
+        Returns:
+            np.ndarray: The dense state of charge log
+        """
+        return self.values_at_indexes(np.arange(len(self)))
+
+
+    def resample(self, interval: float, startTime: float = 0, stopTime: float = None) -> tuple:
+        """ Sample the trajectory at a fixed interval, at any resolution
+
+        Args:
+            interval (float): Seconds between samples
+            startTime (float, optional): Time of the first sample in seconds. Defaults to 0.
+            stopTime (float, optional): Samples stop before this time in seconds. Defaults to the end of the log.
+
+        Returns:
+            np.ndarray: Sample times in seconds
+            np.ndarray: State of charge (in %) at each sample time
+        """
+        if stopTime is None:
+            stopTime = self.times[len(self) - 1] + interval / 2
+
+        times = np.arange(startTime, stopTime, interval)
+
+        return times, self.value_at(times)
+
+
+    def breakpoints(self) -> tuple:
+        """ Start of every piece plus the end of the trajectory, which a straight line plot draws without any loss
+
+        Returns:
+            np.ndarray: Breakpoint times in seconds
+            np.ndarray: State of charge (in %) at each breakpoint
+        """
+        endTime = self.times[self.solvedLength - 1]
+        times = np.append(self.startTimes[self.startTimes < endTime], endTime)
+
+        return times, self.value_at(times)
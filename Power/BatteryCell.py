@@ -3,6 +3,10 @@
 # External libraries
 import numpy as np
 
+# Internal libraries
+from Power.VoltageLookup import VoltageLookup
+from Power.ChemistryRegistry import ChemistryRegistry
+
 class BatteryCell:
 
     MAX_STATE_OF_CHARGE = 100.0       # Units are in perentage
@@ -42,6 +46,12 @@ class BatteryCell:
         'PbA':      300
     }
 
+    # VoltageLookup for each chemistry, built the first time a chemistry is used (see voltage_lookup())
+    VOLTAGE_LOOKUP = {}
+
+    # Chemistries defined by data files, added to the CHEM_ dicts above the first time a cell uses them (see load_chemistry())
+    REGISTRY = ChemistryRegistry()
+
     def __init__(self, volts: float, energy: float, cRating: int, CHEMISTRY_TYPE: str):
         """ Initialize a BatteryCell object.
 
@@ -58,10 +68,11 @@ class BatteryCell:
         self.currentAmpere = 0
         self.currentPower = 0
 
-        if CHEMISTRY_TYPE not in BatteryCell.CHEM_VOLTAGE:
-            raise ValueError(f"{CHEMISTRY_TYPE} is an unsupported chemistry. Use 'BatteryCell.LI_FE_P_O4', 'BatteryCell.LI_CO_O2' or 'BatteryCell.LI_M_N2_04'.")
+        if not BatteryCell.load_chemistry(CHEMISTRY_TYPE):
+            raise ValueError(f"{CHEMISTRY_TYPE} is an unsupported chemistry. Use 'BatteryCell.LI_FE_P_O4', 'BatteryCell.LI_CO_O2' or 'BatteryCell.LI_M_N2_04', or register it in 'BatteryCell.REGISTRY'.")
         else:
             self.chemistry = CHEMISTRY_TYPE
+            self.voltageLookup = BatteryCell.voltage_lookup(CHEMISTRY_TYPE)
 
         if cRating < 0:
             raise ValueError("Battery cell C-Rating must be non-negative.")
@@ -89,6 +100,7 @@ class BatteryCell:
         self.temperature = 25.0                         # Units are Celsius
         self.health = 100                               # Units are percentage
         self.rechargeCycleNumber = 0                    # Number of time a cell has be recharged
+        self.equivalentCircuit = None                   # Optional EquivalentCircuit, for voltage sag and IR losses under load
 
         self.currentDrawSet = False
 
@@ -123,6 +135,49 @@ class BatteryCell:
         return self.currentVoltage == other.currentVoltage
 
 
+    @classmethod
+    def load_chemistry(cls, chemistry: str) -> bool:
+        """ Make sure a chemistry is in the CHEM_ dicts, loading it from REGISTRY if it is defined by a data file
+
+        Args:
+            chemistry (str): The chemistry type of a battery cell
+
+        Returns:
+            bool: True if the chemistry is built in or registered
+        """
+        if chemistry in cls.CHEM_VOLTAGE:
+            return True
+        if chemistry not in cls.REGISTRY:
+            return False
+
+        data = cls.REGISTRY.load(chemistry)
+        cls.CHEM_SOC[chemistry] = data.stateOfCharge
+        cls.CHEM_VOLTAGE[chemistry] = data.voltage
+        cls.CHEM_MAX_CYCLES[chemistry] = data.maxCycles
+        cls.VOLTAGE_LOOKUP.pop(chemistry, None)
+
+        return True
+
+
+    @classmethod
+    def voltage_lookup(cls, chemistry: str) -> VoltageLookup:
+        """ Precomputed voltage and state of charge lookups for a chemistry, shared by every cell of that chemistry
+
+        Args:
+            chemistry (str): The chemistry type of a battery cell, defined as a CONSTANT in this BatteryCell.py file.
+
+        Returns:
+            VoltageLookup: Scalar and array lookups into CHEM_SOC and CHEM_VOLTAGE
+        """
+        lookup = cls.VOLTAGE_LOOKUP.get(chemistry)
+        if lookup is None:
+            cls.load_chemistry(chemistry)
+            lookup = VoltageLookup(cls.CHEM_SOC[chemistry], cls.CHEM_VOLTAGE[chemistry])
+            cls.VOLTAGE_LOOKUP[chemistry] = lookup
+
+        return lookup
+
+
     def energy_capacity(self) -> float:
         """ Calculate the energy capacity left in cell based on state of charge
 
@@ -149,12 +204,11 @@ class BatteryCell:
         Returns:
             float: The estimated state of charge in percentage from 0% to 100%
         """
-        voltageString = str(voltage)
-
-        if "." not in voltageString:
+        # Floats always have a decimal place, so only other types (like text from a GUI) are converted to check
+        if not isinstance(voltage, float) and "." not in str(voltage):
             raise ValueError("Voltage must contain at least one decimal place")
         else:
-            return float(np.interp(float(voltage), BatteryCell.CHEM_VOLTAGE[self.chemistry], BatteryCell.CHEM_SOC[self.chemistry]))
+            return float(self.voltageLookup.state_of_charge(float(voltage)))
 
 
     def consume_energy(self, energy: float) -> None:
@@ -170,9 +224,8 @@ class BatteryCell:
         if self.currentEnergy < 0.00:
             self.currentEnergy = 0.00
 
-        # Array index in CHEM_SOC array closest to the current state of charge
-        idx = (np.abs(BatteryCell.CHEM_SOC[self.chemistry] - self.stateOfCharge)).argmin()
-        self.currentVoltage = BatteryCell.CHEM_VOLTAGE[self.chemistry][idx]
+        # Voltage at the CHEM_SOC entry closest to the current state of charge
+        self.currentVoltage = self.voltageLookup.voltage(self.stateOfCharge)
         self.currentPower = self.currentVoltage * self.currentAmpere
 
         self.stateOfCharge = self.state_of_charge()
@@ -197,9 +250,8 @@ class BatteryCell:
         else:
             self.stateOfCharge = finalSoC
             self.currentEnergy = (finalSoC/ 100.0) * self.totalEnergyCapacity
-            # Array index in CHEM_SOC array closest to the desired final state of charge
-            idx = (np.abs(BatteryCell.CHEM_SOC[self.chemistry]- finalSoC)).argmin()
-            self.currentVoltage = BatteryCell.CHEM_VOLTAGE[self.chemistry][idx]
+            # Voltage at the CHEM_SOC entry closest to the desired final state of charge
+            self.currentVoltage = self.voltageLookup.voltage(finalSoC)
             self.currentPower = self.currentVoltage * self.currentAmpere
             self.currentEnergy = self.totalEnergyCapacity * (finalSoC / 100)
             self.health = np.exp((np.log(0.8) / self.CHEM_MAX_CYCLES[self.chemistry]) * self.rechargeCycleNumber)
@@ -41,6 +41,7 @@ class BatteryPack:
         self.maxPackVoltage = self.seriesCount * BatteryCell.CHEM_VOLTAGE[cell.chemistry][-1]
         self.maxPackAmpere = round(self.parallelCount * (cell.maxAmpere), self.SUGGESTED_ROUNDING)
         self.maxPackPower = self.maxPackVoltage * self.maxPackAmpere
+        self.charger = None                 # Optional CCCVCharger, for "RECHARGE" powermodes that charge as fast as it allows
 
 
     @property
@@ -0,0 +1,211 @@
+#!/usr/bin/python3
+
+# External libraries
+import numpy as np
+
+# Internal libraries
+from Power.BatteryCell import BatteryCell
+
+
+class RainflowCounter:
+
+    def __init__(self):
+        """ Streaming rainflow cycle counter (ASTM E1049 four point method) for a state of charge trace
+
+            Values can be added one chunk at a time as a simulation produces them (e.g. from Simulation.iter_run()), in any
+            chunk sizes, with the same result as counting the whole trace at once. Only the turning points of each chunk are
+            found with NumPy and fed through the counter, and only reversals of still open cycles are kept, so memory use
+            doesn't grow with the length of the trace.
+        """
+        self.reversals = []         # Turning points whose cycles haven't closed yet (the residue)
+        self.last = None            # Latest value, a turning point once the trace turns around
+        self.direction = 0          # Sign of the latest slope of the trace, 0 until it first moves
+        self.cycleCounts = {}       # Range of every closed full cycle mapped to how many times it occurred
+
+
+    def add(self, values) -> list:
+        """ Count the cycles a chunk of the trace closes
+
+        Args:
+            values (float or np.ndarray): Next values of the trace, NaN values (log entries never reached) are skipped
+
+        Returns:
+            list: Range of every full cycle closed by these values, in the order they closed
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return []
+
+        if self.last is None:
+            self.reversals.append(float(values[0]))
+            self.last = float(values[0])
+
+        # Flat stretches never turn the trace around, so repeated values are dropped
+        points = np.concatenate(([self.last], values))
+        points = points[np.concatenate(([True], np.diff(points) != 0))]
+        if len(points) == 1:
+            return []
+
+        # A point is a turning point if the slope into it has the opposite sign of the slope out of it
+        slopes = np.sign(np.diff(points))
+        slopesIn = np.concatenate(([self.direction], slopes[:-1]))
+        turning = np.flatnonzero((slopesIn != slopes) & (slopesIn != 0))
+
+        closed = []
+        for value in points[turning].tolist():
+            self.push(value, closed)
+
+        self.last = float(points[-1])
+        self.direction = float(slopes[-1])
+
+        return closed
+
+
+    def push(self, value: float, closed: list) -> None:
+        """ Add one turning point, closing every full cycle it completes
+
+        Args:
+            value (float): The turning point
+            closed (list): List to append the range of every closed cycle to
+        """
+        stack = self.reversals
+        stack.append(value)
+
+        # The middle range of the last four turning points is a full cycle if neither range around it is smaller
+        while len(stack) >= 4:
+            inner = abs(stack[-2] - stack[-3])
+            if inner > abs(stack[-1] - stack[-2]) or inner > abs(stack[-3] - stack[-4]):
+                break
+
+            closed.append(inner)
+            self.cycleCounts[inner] = self.cycleCounts.get(inner, 0) + 1
+            del stack[-3:-1]
+
+
+    def half_cycles(self) -> np.ndarray:
+        """ Ranges of the half cycles left open so far, counted as half cycles if the trace ended now
+
+        Returns:
+            np.ndarray: Range of every open half cycle
+        """
+        if self.last is None:
+            return np.zeros(0)
+
+        points = self.reversals if self.last == self.reversals[-1] else self.reversals + [self.last]
+        return np.abs(np.diff(points))
+
+
+    def cycles(self) -> tuple:
+        """ Every distinct full cycle range closed so far and how many times each occurred
+
+        Returns:
+            np.ndarray: Cycle ranges, sorted
+            np.ndarray: Number of full cycles of each range
+        """
+        ranges = np.array(sorted(self.cycleCounts), dtype=np.float64)
+        return ranges, np.array([self.cycleCounts[r] for r in ranges.tolist()], dtype=np.int64)
+
+
+class CellAging:
+
+    # CHEM_MAX_CYCLES is the cycle life at this depth of discharge, and BatteryCell.recharge() leaves this much health after it
+    REFERENCE_DEPTH = 0.5                   # Unitless fraction of full charge
+    END_OF_LIFE_HEALTH = 80.0               # Units are percentage
+
+    # Woehler curve exponent of every chemistry, cycle life at depth d is CHEM_MAX_CYCLES * (REFERENCE_DEPTH / d) ** exponent
+    DOD_EXPONENT = {
+        'LiFePO4': 1.1,
+        'LiCoO2':  1.7,
+        'LiMN2O4': 1.5,
+        'AGM':     1.3,
+        'PbA':     1.4
+    }
+    DEFAULT_DOD_EXPONENT = 1.5              # For chemistries loaded from BatteryCell.REGISTRY
+
+    # Internal resistance increase at END_OF_LIFE_HEALTH of every chemistry, as a fraction of a new cell's resistance
+    RESISTANCE_GROWTH = {
+        'LiFePO4': 0.3,
+        'LiCoO2':  1.0,
+        'LiMN2O4': 0.8,
+        'AGM':     0.5,
+        'PbA':     0.6
+    }
+    DEFAULT_RESISTANCE_GROWTH = 0.5         # For chemistries loaded from BatteryCell.REGISTRY
+
+    def __init__(self, cell: BatteryCell):
+        """ Cycle aging of one battery cell, driven by the depth of every discharge cycle in its state of charge trace
+
+            Cycles are counted with a RainflowCounter, and every closed cycle adds damage in equivalent CHEM_MAX_CYCLES
+            cycles. Health falls like BatteryCell.recharge() works it out, but from the counted cycles instead of a recharge
+            count, and it is applied to the cell: its capacity fades with its health, and the resistances of its
+            EquivalentCircuit (if it has one) grow.
+
+        Args:
+            cell (BatteryCell): The cell to age in place, its current capacity and resistances are taken as the new cell's
+        """
+        self.cell = cell
+        self.counter = RainflowCounter()
+        self.maxCycles = BatteryCell.CHEM_MAX_CYCLES[cell.chemistry]
+        self.exponent = CellAging.DOD_EXPONENT.get(cell.chemistry, CellAging.DEFAULT_DOD_EXPONENT)
+        self.resistanceGrowth = CellAging.RESISTANCE_GROWTH.get(cell.chemistry, CellAging.DEFAULT_RESISTANCE_GROWTH)
+
+        self.ratedCapacity = cell.totalEnergyCapacity                       # Units are Watt-hours
+        circuit = cell.equivalentCircuit
+        self.ratedSeriesResistance = circuit.seriesResistance if circuit is not None else 0.0
+        self.ratedPairResistance = circuit.pairResistance.copy() if circuit is not None else np.zeros(0)
+        self.damage = 0.0                                                   # Units are equivalent CHEM_MAX_CYCLES cycles
+
+
+    def cycle_damage(self, ranges) -> float:
+        """ Damage of full cycles, in equivalent cycles at REFERENCE_DEPTH
+
+        Args:
+            ranges (list or np.ndarray): State of charge range (in %) of every cycle
+
+        Returns:
+            float: Equivalent reference cycles
+        """
+        depths = np.asarray(ranges, dtype=np.float64) / 100
+
+        return float(np.sum((depths / CellAging.REFERENCE_DEPTH) ** self.exponent))
+
+
+    @property
+    def health(self) -> float:
+        """ Health (in %) after the cycles closed so far, END_OF_LIFE_HEALTH after CHEM_MAX_CYCLES reference cycles """
+        return 100 * (CellAging.END_OF_LIFE_HEALTH / 100) ** (self.damage / self.maxCycles)
+
+
+    def add(self, stateOfCharge) -> list:
+        """ Count the cycles in the next part of the cell's state of charge trace, without changing the cell yet
+
+        Args:
+            stateOfCharge (float or np.ndarray): Next state of charge values (in %)
+
+        Returns:
+            list: State of charge range of every full cycle these values closed
+        """
+        closed = self.counter.add(stateOfCharge)
+        if len(closed) > 0:
+            self.damage += self.cycle_damage(closed)
+
+        return closed
+
+
+    def apply(self) -> None:
+        """ Age the cell to the current health, fading its capacity (keeping its state of charge) and growing its resistances """
+        cell = self.cell
+        health = self.health
+        capacity = self.ratedCapacity * (health / 100)
+
+        cell.currentEnergy *= capacity / cell.totalEnergyCapacity
+        cell.totalEnergyCapacity = capacity
+        cell.health = health
+
+        if cell.equivalentCircuit is not None:
+            growth = 1 + self.resistanceGrowth * (100 - health) / (100 - CellAging.END_OF_LIFE_HEALTH)
+            circuit = cell.equivalentCircuit
+            circuit.seriesResistance = self.ratedSeriesResistance * growth
+            circuit.pairResistance = self.ratedPairResistance * growth
+            circuit.timeConstant = circuit.pairResistance * circuit.pairCapacitance
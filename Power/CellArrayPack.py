@@ -0,0 +1,287 @@
+#!/usr/bin/python3
+
+# Standard libraries
+import math
+from dataclasses import dataclass
+
+# External libraries
+import numpy as np
+
+# Internal libraries
+from Power.BatteryCell import BatteryCell
+from Power.BatteryPack import BatteryPack
+
+
+@dataclass
+class CellArrayTrace:
+    times: np.ndarray                   # Units are seconds since the start of the schedule
+    stateOfCharge: np.ndarray           # Units are percentage, energy left in the whole pack
+    minCellStateOfCharge: np.ndarray    # Units are percentage, weakest cell
+    maxCellStateOfCharge: np.ndarray    # Units are percentage, strongest cell
+    voltage: np.ndarray                 # Units are Volts (battery pack terminals)
+    current: np.ndarray                 # Units are Amps (battery pack, positive when discharging)
+    power: np.ndarray                   # Units are Watts (battery pack terminals)
+
+    def __len__(self):
+        return len(self.times)
+
+
+class CellArrayPack:
+
+    DEFAULT_INTERNAL_RESISTANCE = 0.02      # Units are Ohms, per cell
+    DEFAULT_BALANCING_TOLERANCE = 1.0       # Units are percentage
+
+    def __init__(self, cell: BatteryCell, packConfiguration: list = ['1S', '1P'], internalResistance: float = DEFAULT_INTERNAL_RESISTANCE):
+        """ Battery pack where every cell has its own capacity, energy, health and internal resistance.
+
+            Unlike BatteryPack, cells are not assumed identical, so cell imbalance, weak cells and balancing can be modeled.
+            Every cell property is a (seriesCount, parallelCount) NumPy array, row s being the parallel group at position s
+            of the series string, so even a 100S x 100P pack is a handful of array operations per time step. All cells start as
+            copies of the given cell, change the arrays directly (e.g. pack.capacity[3, 7] *= 0.8) to make them differ.
+
+            Each cell is an open circuit voltage (from its state of charge) behind its internal resistance. The cells of a
+            parallel group share one terminal voltage, so the group current splits by conductance and cells at a higher state
+            of charge supply more of it, and the same pack current flows through every group of the series string.
+
+        Args:
+            cell (BatteryCell): Chemistry, voltage (state of charge), energy, C-rating and health shared by every cell to start with
+            packConfiguration (list, optional): The series and parellel cell configuration of a battery pack. Defaults to ['1S', '1P'].
+            internalResistance (float, optional): Internal resistance of every cell in Ohms. Defaults to DEFAULT_INTERNAL_RESISTANCE.
+
+        Raises:
+            ValueError: If the pack configuration is invalid or the internal resistance is not positive
+        """
+        if internalResistance <= 0:
+            raise ValueError("Battery cell internal resistance must be positive.")
+
+        # BatteryPack checks the configuration and works out the pack limits
+        self.limits = BatteryPack(cell, packConfiguration)
+        self.seriesCount = self.limits.seriesCount
+        self.parallelCount = self.limits.parallelCount
+        self.chemistry = cell.chemistry
+        self.voltageLookup = cell.voltageLookup
+        self.maxAmpere = cell.maxAmpere                                 # Units are Amps, per cell
+
+        shape = (self.seriesCount, self.parallelCount)
+        self.capacity = np.full(shape, float(cell.totalEnergyCapacity))    # Units are Watt-hours, NOMINAL energy capacity of each cell
+        self.health = np.full(shape, float(cell.health))                    # Units are percentage of the nominal capacity still usable
+        self.energy = np.full(shape, float(cell.currentEnergy))             # Units are Watt-hours left in each cell
+        self.resistance = np.full(shape, float(internalResistance))         # Units are Ohms
+        self.cellCurrent = np.zeros(shape)                                  # Units are Amps, positive when discharging
+
+        # Passive balancing bleeds every parallel group above the emptiest one through a resistor, 0 Amps turns it off
+        self.balancingCurrent = 0.0                                     # Units are Amps, per parallel group
+        self.balancingTolerance = CellArrayPack.DEFAULT_BALANCING_TOLERANCE
+
+
+    def __str__(self):
+        """ Output of print() for a CellArrayPack object
+
+        Returns:
+            str: String representation of the CellArrayPack object.
+        """
+        cellSoc = self.cell_state_of_charge
+        return f"CellArrayPack([{self.seriesCount}S, {self.parallelCount}P], SoC={round(self.soc, BatteryPack.SUGGESTED_ROUNDING)}%, Cell SoC={round(float(cellSoc.min()), BatteryPack.SUGGESTED_ROUNDING)} to {round(float(cellSoc.max()), BatteryPack.SUGGESTED_ROUNDING)}%)"
+
+
+    @property
+    def usable_capacity(self) -> np.ndarray:
+        """ Energy capacity of each cell after fading with health, in Watt-hours """
+        return self.capacity * (self.health / 100)
+
+
+    @property
+    def cell_state_of_charge(self) -> np.ndarray:
+        """ State of charge of each cell, in % from 0 to 100 """
+        return (self.energy / self.usable_capacity) * 100
+
+
+    @property
+    def group_state_of_charge(self) -> np.ndarray:
+        """ State of charge of each parallel group of the series string, in % from 0 to 100 """
+        return (self.energy.sum(axis=1) / self.usable_capacity.sum(axis=1)) * 100
+
+
+    @property
+    def soc(self) -> float:
+        """ State of charge of the whole pack, energy left over usable capacity, in % from 0 to 100 """
+        return float(self.energy.sum() / self.usable_capacity.sum()) * 100
+
+
+    def open_circuit_voltage(self) -> np.ndarray:
+        """ Open circuit voltage of each cell, linearly interpolated from the chemistry voltage table (not snapped to it like BatteryCell) so currents change smoothly
+
+        Returns:
+            np.ndarray: Cell voltages in Volts
+        """
+        return np.interp(self.cell_state_of_charge, self.voltageLookup.socTable, self.voltageLookup.voltageTable)
+
+
+    def thevenin_equivalent(self, openCircuitVoltage: np.ndarray) -> tuple:
+        """ Collapse every parallel group, then the series string, into one voltage source behind one resistance
+
+        Args:
+            openCircuitVoltage (np.ndarray): Open circuit voltage of each cell in Volts
+
+        Returns:
+            np.ndarray: Conductance of each cell in Siemens
+            np.ndarray: Open circuit voltage of each parallel group in Volts
+            np.ndarray: Resistance of each parallel group in Ohms
+        """
+        conductance = 1 / self.resistance
+        groupResistance = 1 / conductance.sum(axis=1)
+        groupVoltage = (openCircuitVoltage * conductance).sum(axis=1) * groupResistance
+
+        return conductance, groupVoltage, groupResistance
+
+
+    def current_for_power(self, packPower: float, openCircuitVoltage: np.ndarray = None) -> float:
+        """ Pack current that delivers a power at the pack terminals, the smaller root of I * (V - I * R) = P
+
+        Args:
+            packPower (float): Power drawn at the pack terminals in Watts
+            openCircuitVoltage (np.ndarray, optional): Cell voltages from open_circuit_voltage(), if already known. Defaults to None.
+
+        Returns:
+            float: Pack current in Amps
+
+        Raises:
+            ValueError: If the internal resistance of the pack can't deliver that much power
+        """
+        if openCircuitVoltage is None:
+            openCircuitVoltage = self.open_circuit_voltage()
+        _, groupVoltage, groupResistance = self.thevenin_equivalent(openCircuitVoltage)
+        packVoltage, packResistance = float(groupVoltage.sum()), float(groupResistance.sum())
+
+        discriminant = packVoltage * packVoltage - 4 * packResistance * packPower
+        if discriminant < 0:
+            raise ValueError(f"Power draw of {packPower} W exceeds the {round(packVoltage * packVoltage / (4 * packResistance), BatteryPack.SUGGESTED_ROUNDING)} W the battery pack can deliver through its internal resistance")
+
+        return 2 * packPower / (packVoltage + math.sqrt(discriminant))
+
+
+    def current_for_stored_power(self, storedPower: float, openCircuitVoltage: np.ndarray = None) -> float:
+        """ Pack current that changes the energy stored in the cells at a given rate, losses in the internal resistance excluded
+
+            Stored power is linear in the pack current, sum(Voc * i) = C0 + I * V where C0 >= 0 is lost to currents circulating
+            between cells of a parallel group, so this needs no iteration.
+
+        Args:
+            storedPower (float): Rate the cells lose energy in Watts, negative to charge them
+            openCircuitVoltage (np.ndarray, optional): Cell voltages from open_circuit_voltage(), if already known. Defaults to None.
+
+        Returns:
+            float: Pack current in Amps, negative when charging
+        """
+        if openCircuitVoltage is None:
+            openCircuitVoltage = self.open_circuit_voltage()
+        conductance, groupVoltage, _ = self.thevenin_equivalent(openCircuitVoltage)
+        circulatingPower = float((((openCircuitVoltage - groupVoltage[:, None]) ** 2) * conductance).sum())
+
+        return (storedPower - circulatingPower) / float(groupVoltage.sum())
+
+
+    def step(self, packCurrent: float, seconds: float, openCircuitVoltage: np.ndarray = None) -> tuple:
+        """ Run one time step at a constant pack current, updating the energy of every cell
+
+        Args:
+            packCurrent (float): Pack current in Amps, positive when discharging
+            seconds (float): Length of the time step
+            openCircuitVoltage (np.ndarray, optional): Cell voltages from open_circuit_voltage(), if already known. Defaults to None.
+
+        Returns:
+            float: Pack terminal voltage in Volts
+            float: Pack terminal power in Watts
+
+        Raises:
+            ValueError: If any cell current exceeds the cell limit
+        """
+        if openCircuitVoltage is None:
+            openCircuitVoltage = self.open_circuit_voltage()
+        conductance, groupVoltage, groupResistance = self.thevenin_equivalent(openCircuitVoltage)
+        terminalVoltage = groupVoltage - packCurrent * groupResistance
+        self.cellCurrent = (openCircuitVoltage - terminalVoltage[:, None]) * conductance
+
+        worstCurrent = float(np.abs(self.cellCurrent).max())
+        if worstCurrent > self.maxAmpere:
+            raise ValueError(f"Current draw of {worstCurrent} exceeds maximum limit of {self.maxAmpere} for the battery cell(s)")
+
+        self.energy -= openCircuitVoltage * self.cellCurrent * (seconds / 3600)
+
+        if self.balancingCurrent > 0:
+            groupSoc = self.group_state_of_charge
+            bleeding = groupSoc > groupSoc.min() + self.balancingTolerance
+            # Bleed energy is shared by the cells of a group in proportion to their energy, which keeps them balanced
+            bleedEnergy = np.where(bleeding, terminalVoltage * self.balancingCurrent * (seconds / 3600), 0.0)
+            groupEnergy = self.energy.sum(axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.energy -= np.where(groupEnergy > 0, bleedEnergy / groupEnergy, 0.0)[:, None] * self.energy
+
+        np.clip(self.energy, 0.0, self.usable_capacity, out=self.energy)
+
+        packVoltage = float(terminalVoltage.sum())
+        return packVoltage, packVoltage * packCurrent
+
+
+    def run_schedule(self, schedule: np.ndarray, runTimeInSeconds: float = None, timeStep: float = 1.0) -> CellArrayTrace:
+        """ Simulate a compiled powermodes schedule, one vectorized step over every cell per time step
+
+            Power consuming segments draw their duty cycle averaged power (schedule energyPerSecond) at the pack terminals, like
+            the single cell engines. Recharge segments charge at the rate that brings the energy stored in the pack to the
+            recharge target by the end of the segment.
+
+        Args:
+            schedule (np.ndarray): Compiled powermodes, see PowermodeSchedule.compile_schedule()
+            runTimeInSeconds (float, optional): Stop after this many seconds. Defaults to None (the whole schedule).
+            timeStep (float, optional): Length of every time step in seconds. Defaults to 1.0.
+
+        Returns:
+            CellArrayTrace: The pack state at the start and after every time step
+
+        Raises:
+            ValueError: If a recharge target is above 100% or below the pack state of charge, or a limit is exceeded
+        """
+        endTime = float(schedule["start"][-1] + schedule["duration"][-1]) if len(schedule) > 0 else 0.0
+        if runTimeInSeconds is not None:
+            endTime = min(endTime, float(runTimeInSeconds))
+
+        # Capacity doesn't change during a run, so the state of charge is one multiply per step
+        totalCapacity = float(self.usable_capacity.sum())
+        socPerEnergy = 100 / self.usable_capacity
+        cellSoc = self.energy * socPerEnergy
+        records = [(0.0, self.soc, float(cellSoc.min()), float(cellSoc.max()), float(self.open_circuit_voltage().sum()), 0.0, 0.0)]
+
+        for segment in schedule:
+            start = float(segment["start"])
+            stop = min(start + float(segment["duration"]), endTime)
+            if stop <= start:
+                continue
+
+            if segment["isRecharge"]:
+                target = float(segment["rechargeTarget"])
+                if target > BatteryCell.MAX_STATE_OF_CHARGE:
+                    raise ValueError("Can't recharge battery cell above 100%")
+                if target < self.soc:
+                    raise ValueError(f"Requested State of Recharge ({target}%), is less than current state of charge ({round(self.soc, 2)}%).")
+                targetEnergy = totalCapacity * (target / 100)
+
+            time = start
+            while time < stop:
+                seconds = min(timeStep, stop - time)
+                openCircuitVoltage = np.interp(cellSoc, self.voltageLookup.socTable, self.voltageLookup.voltageTable)
+                if segment["isRecharge"]:
+                    storedPower = (float(self.energy.sum()) - targetEnergy) * 3600 / (stop - time)
+                    packCurrent = self.current_for_stored_power(storedPower, openCircuitVoltage)
+                else:
+                    packCurrent = self.current_for_power(float(segment["energyPerSecond"]) * 3600, openCircuitVoltage)
+
+                packVoltage, packPower = self.step(packCurrent, seconds, openCircuitVoltage)
+                time += seconds
+                cellSoc = self.energy * socPerEnergy
+                records.append((time, float(self.energy.sum()) / totalCapacity * 100, float(cellSoc.min()), float(cellSoc.max()), packVoltage, packCurrent, packPower))
+
+            if stop >= endTime:
+                break
+
+        columns = np.array(records).T
+        return CellArrayTrace(*columns)
@@ -0,0 +1,183 @@
+#!/usr/bin/python3
+
+# Standard libraries
+import math
+from dataclasses import dataclass
+
+# External libraries
+import numpy as np
+
+# Internal libraries
+from Power.BatteryCell import BatteryCell
+
+
+@dataclass(frozen=True)
+class ChargeProfile:
+    startStateOfCharge: float       # Units are percentage
+    targetStateOfCharge: float      # Units are percentage
+    ccRate: float                   # Units are percentage per second, state of charge gained in the constant current phase
+    cvStateOfCharge: float          # Units are percentage, where the charger switches from constant current to constant voltage
+    timeConstant: float             # Units are seconds, of the exponential current decay in the constant voltage phase
+    ccDuration: float               # Units are seconds, of the constant current phase
+    duration: float                 # Units are seconds, until the target is reached, the real minimum recharge time
+
+    def state_of_charge_at(self, times) -> np.ndarray:
+        """ State of charge at any times since the charge started, flat at the target once it is reached
+
+            In the constant current phase the state of charge rises in a straight line. In the constant voltage phase the
+            current falls in proportion to the charge still missing, so the state of charge closes in on 100% exponentially.
+
+        Args:
+            times (float or np.ndarray): Times in seconds since the charge started
+
+        Returns:
+            np.ndarray: State of charge (in %) at each time
+        """
+        times = np.asarray(times, dtype=np.float64)
+        stateOfCharge = self.startStateOfCharge + self.ccRate * np.minimum(times, self.ccDuration)
+
+        if self.timeConstant > 0 and math.isfinite(self.ccDuration):
+            cvStart = self.startStateOfCharge + self.ccRate * self.ccDuration
+            stateOfCharge = np.where(times > self.ccDuration, 100 - (100 - cvStart) * np.exp(-(times - self.ccDuration) / self.timeConstant), stateOfCharge)
+
+        return np.where(times >= self.duration, self.targetStateOfCharge, np.minimum(stateOfCharge, self.targetStateOfCharge))
+
+
+class CCCVCharger:
+
+    # Typical lithium ion charge, switching to constant voltage at about 80% and stopping once the current falls to C/20
+    DEFAULT_CV_STATE_OF_CHARGE = 80.0       # Units are percentage
+    DEFAULT_TERMINATION_C_RATE = 0.05       # Unitless, fraction of the cell capacity in Amp-hours
+
+    def __init__(self, maxPower: float = math.inf, maxCurrent: float = math.inf, cRating: float = None,
+                 cvStateOfCharge: float = DEFAULT_CV_STATE_OF_CHARGE, terminationCRate: float = DEFAULT_TERMINATION_C_RATE):
+        """ Constant current / constant voltage (CC-CV) battery charger, for "RECHARGE" powermodes
+
+            Attach one to BatteryPack.charger and every "RECHARGE" powermode charges the pack as fast as the charger and the
+            cells allow, instead of in a straight line over the whole powermode. The cell state of charge follows a closed
+            form curve (see ChargeProfile), so a whole recharge segment is computed in one shot.
+
+        Args:
+            maxPower (float, optional): Most power the charger delivers to the pack, in Watts. Defaults to no limit.
+            maxCurrent (float, optional): Most current the charger delivers to the pack, in Amps. Defaults to no limit.
+            cRating (float, optional): Charge C-rating of the cells. Defaults to None (the cell's cRating).
+            cvStateOfCharge (float, optional): State of charge (in %) where the constant voltage phase starts. Defaults to DEFAULT_CV_STATE_OF_CHARGE.
+            terminationCRate (float, optional): Current (as a C-rate) the charge stops at, counting the cell as full. Defaults to DEFAULT_TERMINATION_C_RATE.
+
+        Raises:
+            ValueError: If a limit is negative, or the constant voltage state of charge isn't between 0% and 100%
+        """
+        if maxPower < 0 or maxCurrent < 0 or (cRating is not None and cRating < 0) or terminationCRate < 0:
+            raise ValueError("Charger power, current and C-rate limits must be non-negative.")
+
+        if not 0 <= cvStateOfCharge <= BatteryCell.MAX_STATE_OF_CHARGE:
+            raise ValueError("Charger constant voltage state of charge must be between 0% and 100%.")
+
+        self.maxPower = maxPower
+        self.maxCurrent = maxCurrent
+        self.cRating = cRating
+        self.cvStateOfCharge = cvStateOfCharge
+        self.terminationCRate = terminationCRate
+
+
+    def __str__(self) -> str:
+        """ print() output for CCCVCharger objects
+
+        Returns:
+            str: String representation of the CCCVCharger object.
+        """
+        return f"CCCVCharger(W={self.maxPower}, A={self.maxCurrent}, C-Rating={self.cRating}, CV at {self.cvStateOfCharge}%)"
+
+
+    def cc_ampere(self, pack) -> float:
+        """ Constant current phase current through every cell, the lowest of the C-rate, charger current and charger power limits
+
+        Args:
+            pack (BatteryPack): The battery pack being charged
+
+        Returns:
+            float: Current in Amps
+        """
+        cell = pack.cells
+        cRating = cell.cRating if self.cRating is None else self.cRating
+        capacityAmpereHours = cell.totalEnergyCapacity / cell.nominalVoltage
+
+        # The power limit is worked out at the highest pack voltage, so it holds all the way through the charge
+        return min(cRating * capacityAmpereHours, self.maxCurrent / pack.parallelCount, self.maxPower / (pack.parallelCount * pack.seriesCount * cell.maxVoltage))
+
+
+    def profile(self, pack, startStateOfCharge: float, targetStateOfCharge: float) -> ChargeProfile:
+        """ Closed form charge curve of a battery pack from one state of charge to another
+
+        Args:
+            pack (BatteryPack): The battery pack being charged
+            startStateOfCharge (float): State of charge (in %) when the charge starts
+            targetStateOfCharge (float): State of charge (in %) the charge stops at
+
+        Returns:
+            ChargeProfile: Phase durations and the state of charge curve
+
+        Raises:
+            ValueError: If the target is above 100% or below the starting state of charge, with the same messages as BatteryCell.recharge()
+        """
+        if targetStateOfCharge > BatteryCell.MAX_STATE_OF_CHARGE:
+            raise ValueError("Can't recharge battery cell above 100%")
+
+        if targetStateOfCharge < startStateOfCharge:
+            raise ValueError(f"Requested State of Recharge ({targetStateOfCharge}%), is less than current state of charge ({round(startStateOfCharge, 2)}%).")
+
+        cell = pack.cells
+        ccAmpere = self.cc_ampere(pack)
+        ccRate = float((ccAmpere * cell.nominalVoltage / cell.totalEnergyCapacity) * 100 / 3600)
+        if ccRate <= 0:
+            duration = 0.0 if targetStateOfCharge == startStateOfCharge else math.inf
+            return ChargeProfile(startStateOfCharge, targetStateOfCharge, 0.0, self.cvStateOfCharge, math.inf, duration, duration)
+
+        ccEnd = max(startStateOfCharge, min(targetStateOfCharge, self.cvStateOfCharge))
+        ccDuration = (ccEnd - startStateOfCharge) / ccRate
+
+        # Current falls in proportion to the missing charge, from the constant current at cvStateOfCharge down to the termination current
+        timeConstant = (BatteryCell.MAX_STATE_OF_CHARGE - self.cvStateOfCharge) / ccRate
+        terminationAmpere = self.terminationCRate * cell.totalEnergyCapacity / cell.nominalVoltage
+        fullStateOfCharge = 100 - (100 - self.cvStateOfCharge) * min(1.0, terminationAmpere / ccAmpere)
+
+        cvDuration = 0.0
+        reached = min(targetStateOfCharge, fullStateOfCharge)
+        if reached > ccEnd:
+            cvDuration = timeConstant * math.log((100 - ccEnd) / (100 - reached))
+
+        return ChargeProfile(startStateOfCharge, targetStateOfCharge, ccRate, self.cvStateOfCharge, timeConstant, ccDuration, ccDuration + cvDuration)
+
+
+    def minimum_recharge_time(self, pack, targetStateOfCharge: float) -> float:
+        """ Shortest time the charger can bring a battery pack from its current state of charge to a target
+
+        Args:
+            pack (BatteryPack): The battery pack, in its current state
+            targetStateOfCharge (float): State of charge (in %) to reach
+
+        Returns:
+            float: Time in seconds, infinity if the charger can't charge the pack at all
+        """
+        return self.profile(pack, pack.cells.stateOfCharge, targetStateOfCharge).duration
+
+
+    @staticmethod
+    def charge_cell(cell: BatteryCell, stateOfCharge: float) -> None:
+        """ Move a battery cell to a higher state of charge, counting a recharge cycle when the charge passes 50%
+
+            Unlike BatteryCell.recharge(), health and the recharge cycle count only change once per charge that started deeper
+            than 50% depth-of-discharge, however many steps it is split into.
+
+        Args:
+            cell (BatteryCell): The cell to update in place
+            stateOfCharge (float): New state of charge (in %)
+        """
+        if cell.stateOfCharge <= 50 < stateOfCharge:
+            cell.rechargeCycleNumber += 1
+            cell.health = np.exp((np.log(0.8) / BatteryCell.CHEM_MAX_CYCLES[cell.chemistry]) * cell.rechargeCycleNumber)
+
+        cell.stateOfCharge = stateOfCharge
+        cell.currentEnergy = (stateOfCharge / 100) * cell.totalEnergyCapacity
+        cell.currentVoltage = cell.voltageLookup.voltage(stateOfCharge)
+        cell.currentPower = cell.currentVoltage * cell.currentAmpere
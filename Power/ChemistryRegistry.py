@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+
+# Standard libraries
+import os
+import hashlib
+import tempfile
+from dataclasses import dataclass
+
+# External libraries
+import numpy as np
+
+
+@dataclass(frozen=True)
+class ChemistryData:
+    stateOfCharge: np.ndarray   # Units are percentage, evenly spaced from 0 to 100 (read only, memory mapped)
+    voltage: np.ndarray         # Units are Volts, open circuit voltage at each state of charge, never decreasing (read only, memory mapped)
+    maxCycles: int              # Typical cycle life if cycled to less than 50% depth-of-discharge (DOD)
+
+
+class ChemistryRegistry:
+
+    # Data files a chemistry can be loaded from, see register()
+    CSV = ".csv"
+    NPZ = ".npz"
+
+    # Measured curves are resampled onto this state of charge grid (in %), so lookups stay O(1) however many points were measured
+    GRID_RESOLUTION = 0.01
+
+    # Bump when the cached file layout or resampling changes, so stale cache files are never read
+    CACHE_VERSION = 1
+
+    def __init__(self, cacheDirectory: str = None):
+        """ Battery cell chemistries defined by data files, loaded the first time a cell of that chemistry is built
+
+            Registering a chemistry only records where its data is, so startup stays fast however many or however big the
+            curves are. The first load sorts and cleans the measured open circuit voltage curve, resamples it onto an even
+            state of charge grid and saves it to the cache directory as a .npy file. Every later load, in this process or any
+            other (e.g. ParallelSweep workers), memory maps that file, so all processes share one copy through the page cache.
+
+        Args:
+            cacheDirectory (str, optional): Folder for resampled curves. Defaults to None (a folder in the system temp directory).
+        """
+        self.cacheDirectory = cacheDirectory or os.path.join(tempfile.gettempdir(), "PowerAnalysisChemistry")
+        self.sources = {}           # Chemistry name mapped to (data file path, max cycles or None)
+        self.loaded = {}            # Chemistry name mapped to ChemistryData, once loaded
+
+
+    def __contains__(self, chemistry: str) -> bool:
+        return chemistry in self.sources
+
+
+    def register(self, chemistry: str, path: str, maxCycles: int = None) -> None:
+        """ Define a chemistry by an open circuit voltage curve, without reading the file yet
+
+            A .csv file has a header row with 'soc' (in %) and 'voltage' (in Volts) columns, and may have '#' comment lines.
+            A .npz file has 'soc' and 'voltage' arrays, and optionally a 'maxCycles' value.
+
+        Args:
+            chemistry (str): Name cells use for this chemistry, as their CHEMISTRY_TYPE
+            path (str): The .csv or .npz data file
+            maxCycles (int, optional): Cycle life of the chemistry, if its file has none. Defaults to None.
+
+        Raises:
+            ValueError: If the file type is unsupported, or a .csv chemistry has no maxCycles
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in (ChemistryRegistry.CSV, ChemistryRegistry.NPZ):
+            raise ValueError(f"{path} is an unsupported chemistry file. Use a '.csv' or '.npz' file.")
+        if extension == ChemistryRegistry.CSV and maxCycles is None:
+            raise ValueError(f"Chemistry {chemistry} from a .csv file needs a maxCycles value.")
+
+        self.sources[chemistry] = (os.path.abspath(path), maxCycles)
+        self.loaded.pop(chemistry, None)
+
+
+    def register_directory(self, directory: str, maxCycles: int = None) -> list:
+        """ Register every .csv and .npz file in a folder, named after the file (e.g. 'LFP_18650.npz' becomes 'LFP_18650')
+
+        Args:
+            directory (str): Folder of chemistry data files
+            maxCycles (int, optional): Cycle life of every chemistry without its own in its file. Defaults to None.
+
+        Returns:
+            list: Names of the chemistries registered
+        """
+        names = []
+        for fileName in sorted(os.listdir(directory)):
+            name, extension = os.path.splitext(fileName)
+            if extension.lower() in (ChemistryRegistry.CSV, ChemistryRegistry.NPZ):
+                self.register(name, os.path.join(directory, fileName), maxCycles)
+                names.append(name)
+
+        return names
+
+
+    def load(self, chemistry: str) -> ChemistryData:
+        """ Curve of a registered chemistry, read from the cache (memory mapped) or built from its data file the first time
+
+        Args:
+            chemistry (str): Name of a registered chemistry
+
+        Returns:
+            ChemistryData: The resampled curve and cycle life
+
+        Raises:
+            ValueError: If the chemistry isn't registered, has no maxCycles, or its data file is missing columns or has too few points
+        """
+        if chemistry in self.loaded:
+            return self.loaded[chemistry]
+        if chemistry not in self.sources:
+            raise ValueError(f"{chemistry} is not a registered chemistry.")
+
+        path, maxCycles = self.sources[chemistry]
+        cachePath = self.cache_path(path)
+        if not os.path.exists(cachePath):
+            stateOfCharge, voltage = self.read_curve(path)
+            os.makedirs(self.cacheDirectory, exist_ok=True)
+
+            # Write then rename, so another process never maps a half written file
+            descriptor, temporaryPath = tempfile.mkstemp(dir=self.cacheDirectory, suffix=".tmp")
+            with os.fdopen(descriptor, "wb") as file:
+                np.save(file, np.stack((stateOfCharge, voltage)))
+            os.replace(temporaryPath, cachePath)
+
+        curve = np.load(cachePath, mmap_mode='r')
+        if os.path.splitext(path)[1].lower() == ChemistryRegistry.NPZ:
+            # Only the small maxCycles member is read, the curve itself comes from the cache
+            with np.load(path) as data:
+                if "maxCycles" in data:
+                    maxCycles = int(data["maxCycles"])
+        if maxCycles is None:
+            raise ValueError(f"Chemistry file {path} has no maxCycles value, pass one to register().")
+
+        self.loaded[chemistry] = ChemistryData(curve[0], curve[1], maxCycles)
+        return self.loaded[chemistry]
+
+
+    def cache_path(self, path: str) -> str:
+        """ Cache file for a data file, named by a hash of its path, size and modification time, so edits are picked up
+
+        Args:
+            path (str): The .csv or .npz data file
+
+        Returns:
+            str: Path of the resampled .npy file
+        """
+        stat = os.stat(path)
+        key = repr((path, stat.st_size, stat.st_mtime_ns, ChemistryRegistry.GRID_RESOLUTION, ChemistryRegistry.CACHE_VERSION))
+
+        return os.path.join(self.cacheDirectory, hashlib.sha256(key.encode()).hexdigest()[:32] + ".npy")
+
+
+    @staticmethod
+    def read_curve(path: str) -> tuple:
+        """ Read a measured curve and build a monotone interpolant of it on the state of charge grid
+
+            Points are sorted by state of charge, repeated states of charge are averaged, and measurement noise that makes the
+            voltage dip as the state of charge rises is flattened, so the voltage never falls and voltage to state of charge lookups stay monotone.
+
+        Args:
+            path (str): The .csv or .npz data file
+
+        Returns:
+            np.ndarray: State of charge grid (in %) from 0 to 100
+            np.ndarray: Voltage (in Volts) at each grid point
+
+        Raises:
+            ValueError: If the file is missing the 'soc' or 'voltage' column, or has fewer than two distinct states of charge
+        """
+        if os.path.splitext(path)[1].lower() == ChemistryRegistry.CSV:
+            with open(path) as file:
+                lines = [line for line in file if line.strip() and not line.lstrip().startswith('#')]
+            header = [name.strip().lower() for name in lines[0].split(',')] if len(lines) > 0 else []
+            if "soc" not in header or "voltage" not in header:
+                raise ValueError(f"Chemistry file {path} needs 'soc' and 'voltage' columns.")
+            table = np.loadtxt(lines[1:], delimiter=',', ndmin=2)
+            stateOfCharge, voltage = table[:, header.index("soc")], table[:, header.index("voltage")]
+        else:
+            with np.load(path) as data:
+                if "soc" not in data or "voltage" not in data:
+                    raise ValueError(f"Chemistry file {path} needs 'soc' and 'voltage' arrays.")
+                stateOfCharge, voltage = data["soc"], data["voltage"]
+
+        stateOfCharge = np.asarray(stateOfCharge, dtype=np.float64)
+        voltage = np.asarray(voltage, dtype=np.float64)
+        measured = np.isfinite(stateOfCharge) & np.isfinite(voltage)
+        stateOfCharge, voltage = stateOfCharge[measured], voltage[measured]
+
+        points, inverse, counts = np.unique(stateOfCharge, return_inverse=True, return_counts=True)
+        if len(points) < 2:
+            raise ValueError(f"Chemistry file {path} needs at least two distinct states of charge.")
+        averageVoltage = np.bincount(inverse, weights=voltage) / counts
+        monotoneVoltage = np.maximum.accumulate(averageVoltage)
+
+        grid = np.linspace(0.0, 100.0, int(round(100 / ChemistryRegistry.GRID_RESOLUTION)) + 1)
+        return grid, np.interp(grid, points, monotoneVoltage)
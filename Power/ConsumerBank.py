@@ -0,0 +1,300 @@
+#!/usr/bin/python3
+
+# External libraries
+import numpy as np
+
+
+def bank_row(row: int, doc: str, kind = float) -> property:
+    """ Consumption attribute stored in one row of its ConsumerBank, read back as a plain Python value
+
+    Args:
+        row (int): Row of ConsumerBank.data, defined as a CONSTANT in ConsumerBank
+        doc (str): Docstring of the property
+        kind (type, optional): Python type the value is read back as. Defaults to float.
+
+    Returns:
+        property: Read and write property for the Consumption class
+    """
+    def get(consumer):
+        return kind(consumer.bank.data[row, consumer.index])
+
+    def put(consumer, value):
+        consumer.bank.data[row, consumer.index] = value
+
+    return property(get, put, doc=doc)
+
+
+class ConsumerBank:
+
+    # Row of every consumer parameter in ConsumerBank.data, the three draw mode currents in Consumption.*_POWER_DRAW_MODE order
+    VOLTAGE = 0             # Units are Volts
+    MIN_CURRENT = 1         # Units are Amps
+    AVG_CURRENT = 2         # Units are Amps
+    MAX_CURRENT = 3         # Units are Amps
+    DUTY_CYCLE = 4          # Units are percentage
+    CURRENT = 5             # Units are Amps, real time
+    POWER = 6               # Units are Watts, real time
+    DEVICE_ON = 7           # 1.0 if on, 0.0 if off
+    PULSE_PHASE = 8         # Units are percentage of the PWM period, where the on pulse starts (see Simulation.pulsePeriod)
+    ROWS = ("voltage", "minCurrent", "averageCurrent", "maxCurrent", "dutyCycle", "current", "power", "deviceOn", "pulsePhase")
+
+    DEFAULT_CAPACITY = 16   # Consumers allocated up front, doubled whenever the bank fills up
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        """ Parameters and real time state of many consumers, stored as one (parameter x consumer) NumPy array
+
+            Every Consumption object is a view of one column of a bank, so the loads of every powermode and every consumer
+            come out of one matrix operation (see segment_loads()), instead of one Consumption method call per consumer.
+            A Consumption created on its own gets a bank of its own, pass bank= or use adopt() to share one.
+
+        Args:
+            capacity (int, optional): Number of consumers to allocate room for. Defaults to DEFAULT_CAPACITY.
+        """
+        self.data = np.zeros((len(ConsumerBank.ROWS), max(capacity, 1)))
+        self.consumers = []     # Consumption views, in column order
+
+
+    def __len__(self):
+        return len(self.consumers)
+
+
+    def __str__(self):
+        """ print() output for ConsumerBank objects
+
+        Returns:
+            str: String representation of the ConsumerBank object.
+        """
+        return f"ConsumerBank({len(self)} consumers, Max Power={round(float(np.dot(self.voltage, self.maxCurrent)), 3)} W)"
+
+
+    @classmethod
+    def from_consumers(cls, consumers: list):
+        """ Move existing Consumption objects into a new bank, they stay usable as views of it
+
+        Args:
+            consumers (list): Consumption objects, in the column order to use
+
+        Returns:
+            ConsumerBank: The new bank
+        """
+        bank = cls(len(consumers))
+        bank.adopt(consumers)
+
+        return bank
+
+
+    @staticmethod
+    def shared(consumers: list):
+        """ The bank of a list of consumers, if they are all of its consumers in the same order
+
+        Args:
+            consumers (list): Consumption objects
+
+        Returns:
+            ConsumerBank: Their shared bank, or None
+        """
+        if len(consumers) == 0:
+            return None
+
+        bank = getattr(consumers[0], "bank", None)
+        if bank is not None and len(bank.consumers) == len(consumers) and all(a is b for a, b in zip(bank.consumers, consumers)):
+            return bank
+
+        return None
+
+
+    @classmethod
+    def gather(cls, consumers: list):
+        """ Bank holding exactly these consumers in this order, without moving them
+
+        Args:
+            consumers (list): Consumption objects
+
+        Returns:
+            ConsumerBank: Their shared bank (see shared()), otherwise a new bank with a copy of their values
+        """
+        bank = cls.shared(consumers)
+        if bank is not None:
+            return bank
+
+        copy = cls(len(consumers))
+        for consumer in consumers:
+            copy.data[:, copy.allocate()] = consumer.bank.data[:, consumer.index]
+            copy.consumers.append(consumer)
+
+        return copy
+
+
+    def allocate(self) -> int:
+        """ Add one zeroed column, growing the array if it is full
+
+            Growing reallocates ConsumerBank.data, so row views taken before it no longer follow the bank.
+
+        Returns:
+            int: Index of the new column
+        """
+        index = len(self.consumers)
+        if index == self.data.shape[1]:
+            self.data = np.concatenate((self.data, np.zeros_like(self.data)), axis=1)
+        self.data[:, index] = 0.0
+
+        return index
+
+
+    def adopt(self, consumers: list) -> None:
+        """ Move Consumption objects into this bank, copying their parameters and real time state
+
+        Args:
+            consumers (list): Consumption objects, appended in this order
+        """
+        for consumer in consumers:
+            index = self.allocate()
+            self.data[:, index] = consumer.bank.data[:, consumer.index]
+            self.consumers.append(consumer)
+            consumer.bank = self
+            consumer.index = index
+
+
+    @property
+    def voltage(self) -> np.ndarray:
+        """ Zero-copy view: Voltage (in Volts) of every consumer """
+        return self.data[ConsumerBank.VOLTAGE, :len(self)]
+
+
+    @property
+    def minCurrent(self) -> np.ndarray:
+        """ Zero-copy view: MIN_POWER_DRAW_MODE current (in Amps) of every consumer """
+        return self.data[ConsumerBank.MIN_CURRENT, :len(self)]
+
+
+    @property
+    def averageCurrent(self) -> np.ndarray:
+        """ Zero-copy view: AVG_POWER_DRAW_MODE current (in Amps) of every consumer """
+        return self.data[ConsumerBank.AVG_CURRENT, :len(self)]
+
+
+    @property
+    def maxCurrent(self) -> np.ndarray:
+        """ Zero-copy view: MAX_POWER_DRAW_MODE current (in Amps) of every consumer """
+        return self.data[ConsumerBank.MAX_CURRENT, :len(self)]
+
+
+    @property
+    def dutyCycle(self) -> np.ndarray:
+        """ Zero-copy view: Duty cycle (in %) of every consumer """
+        return self.data[ConsumerBank.DUTY_CYCLE, :len(self)]
+
+
+    @property
+    def current(self) -> np.ndarray:
+        """ Zero-copy view: Real time current (in Amps) of every consumer """
+        return self.data[ConsumerBank.CURRENT, :len(self)]
+
+
+    @property
+    def power(self) -> np.ndarray:
+        """ Zero-copy view: Real time power (in Watts) of every consumer """
+        return self.data[ConsumerBank.POWER, :len(self)]
+
+
+    @property
+    def deviceOn(self) -> np.ndarray:
+        """ Whether every consumer is turned on """
+        return self.data[ConsumerBank.DEVICE_ON, :len(self)] != 0
+
+
+    @property
+    def pulsePhase(self) -> np.ndarray:
+        """ Zero-copy view: PWM pulse phase (in % of the period) of every consumer """
+        return self.data[ConsumerBank.PULSE_PHASE, :len(self)]
+
+
+    def mode_currents(self, drawModes: np.ndarray) -> np.ndarray:
+        """ Current of every consumer in every powermode
+
+        Args:
+            drawModes (np.ndarray): (powermode x consumer) Consumption power draw modes
+
+        Returns:
+            np.ndarray: (powermode x consumer) current in Amps
+
+        Raises:
+            ValueError: If a power draw mode is unknown
+        """
+        drawModes = np.asarray(drawModes)
+        if np.any((drawModes < 0) | (drawModes > ConsumerBank.MAX_CURRENT - ConsumerBank.MIN_CURRENT)):
+            raise ValueError("Invalid power draw mode, use either MIN_POWER_DRAW_MODE, AVG_POWER_DRAW_MODE, or MAX_POWER_DRAW_MODE")
+
+        return self.data[ConsumerBank.MIN_CURRENT + drawModes, np.arange(len(self))]
+
+
+    def segment_loads(self, drawModes: np.ndarray) -> tuple:
+        """ Total load of every powermode, in one matrix operation over all consumers
+
+            Consumers are added up one after another (a cumulative sum), in the same order and with the same arithmetic as
+            Consumption.turn_on() followed by Consumption.real_time_energy(1), so the totals are bit identical.
+
+        Args:
+            drawModes (np.ndarray): (powermode x consumer) Consumption power draw modes
+
+        Returns:
+            np.ndarray: Total current draw in Amps of every powermode
+            np.ndarray: Total power draw in Watts of every powermode (ignoring duty cycle)
+            np.ndarray: Total energy used each second in Watt-hours of every powermode
+        """
+        drawModes = np.atleast_2d(drawModes)
+        if len(self) == 0:
+            return np.zeros(len(drawModes)), np.zeros(len(drawModes)), np.zeros(len(drawModes))
+
+        return ConsumerBank.total_loads(self.voltage, self.mode_currents(drawModes), self.dutyCycle, axis=1)
+
+
+    @staticmethod
+    def total_loads(voltage: np.ndarray, current: np.ndarray, dutyCycle: np.ndarray, axis: int = -1) -> tuple:
+        """ Add up the current, power and energy per second of many consumers, one consumer after another along one axis
+
+            Shared by segment_loads() and MonteCarlo, which samples the currents and duty cycles, so both add up loads the same way.
+
+        Args:
+            voltage (np.ndarray): Voltage (in Volts) of every consumer, broadcast against current
+            current (np.ndarray): Current draw (in Amps) of every consumer, consumers along axis
+            dutyCycle (np.ndarray): Duty cycle (in %) of every consumer, broadcast against current
+            axis (int, optional): Axis of current the consumers are on. Defaults to -1.
+
+        Returns:
+            np.ndarray: Total current draw in Amps
+            np.ndarray: Total power draw in Watts (ignoring duty cycle)
+            np.ndarray: Total energy used each second in Watt-hours
+        """
+        power = voltage * current
+        energy = power * (dutyCycle / 100.0) * (1.0 / 3600)
+        if current.shape[axis] == 0:
+            return tuple(np.zeros(np.sum(current, axis=axis).shape) for _ in range(3))
+
+        return tuple(np.cumsum(total, axis=axis).take(-1, axis=axis) for total in (current, power, energy))
+
+
+    def turn_on(self, drawModes: np.ndarray) -> None:
+        """ Turn on every consumer in its power draw mode at once, like Consumption.turn_on()
+
+        Args:
+            drawModes (np.ndarray): Consumption power draw mode of every consumer
+        """
+        current = self.mode_currents(drawModes)
+        self.data[ConsumerBank.DEVICE_ON, :len(self)] = 1.0
+        self.data[ConsumerBank.CURRENT, :len(self)] = current
+        self.data[ConsumerBank.POWER, :len(self)] = self.voltage * current
+
+
+    def energy(self, timeInSeconds: float) -> np.ndarray:
+        """ Energy used by every consumer over a time period, like Consumption.real_time_energy()
+
+        Args:
+            timeInSeconds (float): The duration in seconds
+
+        Returns:
+            np.ndarray: Energy in Watt-hours (Wh) of every consumer, zero for consumers turned off
+        """
+        energyPerSecond = self.voltage * self.current * (self.dutyCycle / 100.0) * (1.0 / 3600)
+
+        return np.where(self.deviceOn, energyPerSecond * timeInSeconds, 0.0)
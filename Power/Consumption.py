@@ -1,12 +1,27 @@
 #!/usr/bin/python3
 
+# Internal libraries
+from Power.ConsumerBank import ConsumerBank, bank_row
+
+
 class Consumption:
 
     MIN_POWER_DRAW_MODE = 0
     AVG_POWER_DRAW_MODE = 1
     MAX_POWER_DRAW_MODE = 2
 
-    def __init__(self, name: str, volts: float, minAmps: float, avgAmps: float, maxAmps: float, duty: float):
+    # Values live in a column of a ConsumerBank, so every Consumption object is a view of its bank
+    voltage = bank_row(ConsumerBank.VOLTAGE, "The required voltage (in Volts) of the power draw module.")
+    minCurrent = bank_row(ConsumerBank.MIN_CURRENT, "Current draw (in Amps) in MIN_POWER_DRAW_MODE.")
+    averageCurrent = bank_row(ConsumerBank.AVG_CURRENT, "Current draw (in Amps) in AVG_POWER_DRAW_MODE.")
+    maxCurrent = bank_row(ConsumerBank.MAX_CURRENT, "Current draw (in Amps) in MAX_POWER_DRAW_MODE.")
+    dutyCycle = bank_row(ConsumerBank.DUTY_CYCLE, "The on duty cycle (in %) of the power draw module.")
+    current = bank_row(ConsumerBank.CURRENT, "Real time current draw (in Amps).")
+    power = bank_row(ConsumerBank.POWER, "Real time power draw (in Watts).")
+    deviceOn = bank_row(ConsumerBank.DEVICE_ON, "Whether the power draw module is turned on.", bool)
+    pulsePhase = bank_row(ConsumerBank.PULSE_PHASE, "Where the on pulse starts (in % of the PWM period), when duty cycles are pulsed.")
+
+    def __init__(self, name: str, volts: float, minAmps: float, avgAmps: float, maxAmps: float, duty: float, bank: ConsumerBank = None):
         """ Initializes a Consumption object with it turned on by default.
 
         Args:
@@ -16,6 +31,7 @@ class Consumption:
             avgAmps (float): The average current draw of a power draw Consumption object when on.
             maxAmps (float): The maximum current draw of a power draw Consumption object when on.
             duty (float): The on duty cycle of a power draw Consumption object.
+            bank (ConsumerBank, optional): Bank to store the values in. Defaults to None (a bank of its own).
         """
         self.name = name
 
@@ -24,11 +40,14 @@ class Consumption:
             raise ValueError("Minimum, average, and maximum current draw values must be non-negative")
         elif minAmps > avgAmps or avgAmps > maxAmps or minAmps > maxAmps:
             raise ValueError("Minimum current draw must be less than average current draw, which must be less than maximum current draw")
-        else:
-            self.minCurrent = minAmps
-            self.averageCurrent = avgAmps
-            self.maxCurrent = maxAmps
 
+        self.bank = ConsumerBank(1) if bank is None else bank
+        self.index = self.bank.allocate()
+        self.bank.consumers.append(self)
+
+        self.minCurrent = minAmps
+        self.averageCurrent = avgAmps
+        self.maxCurrent = maxAmps
 
         # Real time volts and amps
         self.voltage = volts                        # Units are Volts (V)
@@ -67,15 +86,10 @@ class Consumption:
         Returns:
             float: The total energy consumed in Watt-hours (Wh)
         """
-        totalEnergyConsumed = 0.0
-
         if not self.deviceOn:
             return 0.0
 
-        for timestep in range(timeInSeconds):
-            totalEnergyConsumed += self.voltage * self.current * (self.dutyCycle / 100.0) * (1.0 / 3600)
-
-        return totalEnergyConsumed
+        return self.voltage * self.current * (self.dutyCycle / 100.0) * (1.0 / 3600) * timeInSeconds
 
 
     def turn_on(self, mode):
@@ -111,3 +125,17 @@ class Consumption:
 
         self.dutyCycle = dutyCycle
         self.power = self.voltage * self.current * (self.dutyCycle / 100.0)
+
+
+    def set_pulse_phase(self, pulsePhase: float):
+        """ Sets where the on pulse starts when a Simulation models duty cycles as PWM pulses (see Simulation.pulsePeriod)
+
+            Staggering the phases of several consumers keeps their pulses from overlapping, which lowers the peak current.
+
+        Args:
+            pulsePhase (float): Start of the on pulse, in percent (0-100%) of the PWM period
+        """
+        if pulsePhase < 0 or pulsePhase > 100:
+            raise ValueError("Pulse phase must be between 0 and 100")
+
+        self.pulsePhase = pulsePhase
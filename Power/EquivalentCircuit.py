@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+
+# Standard libraries
+import math
+
+# External libraries
+import numpy as np
+
+
+def rc_response(pairVoltage, steadyVoltage, timeConstant, pairConductance, stepStarts, stepEnds) -> tuple:
+    """ Exact response of RC pairs to a constant current, at any number of step boundaries in one vectorized call
+
+        Under a constant current I the voltage across an RC pair relaxes exponentially towards I * R, so
+        v(t) = vInf + (v0 - vInf) * exp(-t / tau) holds exactly for any step length. The integrals of I * v and v^2 / R over
+        every step have closed forms too, so no accuracy is lost with long time steps. Arguments broadcast, with the step
+        boundaries on the last axis.
+
+    Args:
+        pairVoltage (np.ndarray): Voltage across every RC pair at time 0, in Volts
+        steadyVoltage (np.ndarray): Current times pair resistance, the voltage every RC pair relaxes to, in Volts
+        timeConstant (np.ndarray): Resistance times capacitance of every RC pair, in seconds
+        pairConductance (np.ndarray): One over the resistance of every RC pair, in Siemens
+        stepStarts (np.ndarray): Start of every step, in seconds since time 0
+        stepEnds (np.ndarray): End of every step, in seconds since time 0
+
+    Returns:
+        np.ndarray: Voltage across every RC pair at the end of every step, in Volts
+        np.ndarray: Integral of v over every step, in Volt-seconds (times the current for the energy drawn from the cell)
+        np.ndarray: Integral of v^2 / R over every step, in Joules (the heat given off by the pair resistor)
+    """
+    offset = pairVoltage - steadyVoltage
+    decayStart, decayEnd = np.exp(-stepStarts / timeConstant), np.exp(-stepEnds / timeConstant)
+    stepLengths = stepEnds - stepStarts
+
+    voltageIntegral = steadyVoltage * stepLengths + offset * timeConstant * (decayStart - decayEnd)
+    squareIntegral = (steadyVoltage * steadyVoltage * stepLengths
+                      + 2 * steadyVoltage * offset * timeConstant * (decayStart - decayEnd)
+                      + offset * offset * (timeConstant / 2) * (decayStart * decayStart - decayEnd * decayEnd))
+
+    return steadyVoltage + offset * decayEnd, voltageIntegral, squareIntegral * pairConductance
+
+
+class EquivalentCircuit:
+
+    # A series resistance with up to two RC pairs, a Thevenin (1RC) or dual polarization (2RC) model
+    MAX_RC_PAIRS = 2
+
+    def __init__(self, seriesResistance: float, rcPairs: list = ()):
+        """ Equivalent circuit of one battery cell, the open circuit voltage behind a series resistance and RC pairs
+
+            Attach one to BatteryCell.equivalentCircuit to model voltage sag under load and the energy lost in the cell's
+            internal resistance. The loop and vectorized engines then draw the extra energy from the cell and log the
+            terminal voltage and IR losses (see SimulationLog.TERMINAL_VOLTAGE and SimulationLog.IR_LOSS).
+
+        Args:
+            seriesResistance (float): Ohmic resistance of the cell in Ohms
+            rcPairs (list, optional): (resistance in Ohms, capacitance in Farads) of each RC pair. Defaults to none (series resistance only).
+
+        Raises:
+            ValueError: If a resistance is negative, an RC pair resistance or capacitance isn't positive, or there are too many RC pairs
+        """
+        if seriesResistance < 0:
+            raise ValueError("Series resistance must be non-negative.")
+
+        if len(rcPairs) > EquivalentCircuit.MAX_RC_PAIRS:
+            raise ValueError(f"An equivalent circuit has at most {EquivalentCircuit.MAX_RC_PAIRS} RC pairs (1RC or 2RC model).")
+
+        if any(resistance <= 0 or capacitance <= 0 for resistance, capacitance in rcPairs):
+            raise ValueError("RC pair resistance and capacitance must be positive.")
+
+        self.seriesResistance = float(seriesResistance)
+        self.pairResistance = np.array([float(resistance) for resistance, _ in rcPairs])
+        self.pairCapacitance = np.array([float(capacitance) for _, capacitance in rcPairs])
+        self.timeConstant = self.pairResistance * self.pairCapacitance      # Units are seconds
+        self.pairVoltage = np.zeros(len(rcPairs))                           # Units are Volts, the state that carries between steps
+
+
+    def __str__(self) -> str:
+        """ print() output for EquivalentCircuit objects
+
+        Returns:
+            str: String representation of the EquivalentCircuit object.
+        """
+        pairs = ", ".join(f"{resistance} Ohm || {capacitance} F" for resistance, capacitance in zip(self.pairResistance.tolist(), self.pairCapacitance.tolist()))
+        return f"EquivalentCircuit(R0={self.seriesResistance} Ohm{', ' + pairs if pairs else ''})"
+
+
+    def copy(self):
+        """ Independent circuit with the same parameters and state, for another cell
+
+        Returns:
+            EquivalentCircuit: The copy
+        """
+        circuit = EquivalentCircuit(self.seriesResistance, list(zip(self.pairResistance.tolist(), self.pairCapacitance.tolist())))
+        circuit.pairVoltage = self.pairVoltage.copy()
+
+        return circuit
+
+
+    @property
+    def polarization(self) -> float:
+        """ Voltage across all RC pairs together, in Volts """
+        return float(self.pairVoltage.sum())
+
+
+    def terminal_voltage(self, openCircuitVoltage, current, polarization = None):
+        """ Cell voltage at its terminals, below the open circuit voltage while discharging and above it while charging
+
+        Args:
+            openCircuitVoltage (float or np.ndarray): Open circuit voltage in Volts
+            current (float or np.ndarray): Cell current in Amps, positive when discharging
+            polarization (float or np.ndarray, optional): Voltage across all RC pairs. Defaults to None (the present state).
+
+        Returns:
+            float or np.ndarray: Terminal voltage in Volts
+        """
+        if polarization is None:
+            polarization = self.polarization
+
+        return openCircuitVoltage - current * self.seriesResistance - polarization
+
+
+    def step(self, current: float, seconds: float) -> tuple:
+        """ Advance the RC pairs through one step at a constant current
+
+        Args:
+            current (float): Cell current in Amps, positive when discharging
+            seconds (float): Length of the step
+
+        Returns:
+            float: Energy (in Watt-hours) the cell supplies on top of the load, its current times the internal voltage drop
+            float: Energy (in Watt-hours) turned into heat in the internal resistances
+        """
+        drawn = current * current * self.seriesResistance * seconds
+        heat = drawn
+
+        for k in range(len(self.pairVoltage)):
+            steadyVoltage = current * self.pairResistance[k]
+            timeConstant = self.timeConstant[k]
+            offset = self.pairVoltage[k] - steadyVoltage
+            decayed = 1 - math.exp(-seconds / timeConstant)
+            doubleDecayed = 1 - math.exp(-2 * seconds / timeConstant)
+
+            drawn += current * (steadyVoltage * seconds + offset * timeConstant * decayed)
+            heat += (steadyVoltage * steadyVoltage * seconds + 2 * steadyVoltage * offset * timeConstant * decayed
+                     + offset * offset * (timeConstant / 2) * doubleDecayed) / self.pairResistance[k]
+            self.pairVoltage[k] = steadyVoltage + offset * (1 - decayed)
+
+        return drawn / 3600, heat / 3600
+
+
+    def response(self, current: float, stepLengths: np.ndarray) -> tuple:
+        """ Advance the RC pairs through a block of steps at one constant current, in one vectorized call
+
+        Args:
+            current (float): Cell current in Amps, positive when discharging
+            stepLengths (np.ndarray): Length in seconds of every step
+
+        Returns:
+            np.ndarray: Voltage across all RC pairs at the end of every step, in Volts
+            np.ndarray: Energy (in Watt-hours) the cell supplies on top of the load in every step
+            np.ndarray: Energy (in Watt-hours) turned into heat in the internal resistances in every step
+        """
+        stepEnds = np.cumsum(stepLengths)
+        stepStarts = stepEnds - stepLengths
+        drawn = current * current * self.seriesResistance * stepLengths
+        heat = drawn.copy()
+        polarization = np.zeros(len(stepLengths))
+
+        if len(self.pairVoltage) > 0:
+            column = (slice(None), None)
+            pairVoltages, voltageIntegral, pairHeat = rc_response(self.pairVoltage[column], current * self.pairResistance[column], self.timeConstant[column],
+                                                                  1 / self.pairResistance[column], stepStarts, stepEnds)
+            polarization = pairVoltages.sum(axis=0)
+            drawn += current * voltageIntegral.sum(axis=0)
+            heat += pairHeat.sum(axis=0)
+            if len(stepLengths) > 0:
+                self.pairVoltage = pairVoltages[:, -1].copy()
+
+        return polarization, drawn / 3600, heat / 3600
@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+
+# Standard libraries
+import os
+
+# External libraries
+import numpy as np
+
+
+class TraceConsumption:
+
+    # Power draw modes of a TraceConsumption in a "powermodes" dict, after Consumption.MAX_POWER_DRAW_MODE
+    TRACE_DRAW_MODE = 3     # Plays the recorded current
+    OFF_DRAW_MODE = 4       # Draws nothing, the trace keeps its alignment
+    DRAW_MODES = (TRACE_DRAW_MODE, OFF_DRAW_MODE)
+
+    # Where trace time zero is
+    ALIGN_TO_SIMULATION = "SIMULATION"      # Start of the powermodes, the trace keeps running through every powermode
+    ALIGN_TO_POWERMODE = "POWERMODE"        # Start of every powermode, the trace restarts in every powermode
+
+    # Samples read from the file at once, bounding memory use whatever the trace length
+    MAX_WINDOW_SAMPLES = 2**20
+
+    def __init__(self, name: str, volts: float, path: str, sampleRate: float, loop: bool = True, alignment: str = ALIGN_TO_SIMULATION,
+                 startTime: float = 0.0, scale: float = 1.0, dtype = np.float32, headerBytes: int = 0):
+        """ Consumer whose current draw is a recorded trace (e.g. a 1 kHz bench measurement), memory mapped from a file
+
+            The file is never loaded into RAM, every simulation step reads only the samples it covers, at most
+            MAX_WINDOW_SAMPLES at a time. Each sample is the current from its time until the next sample, so the current of
+            a simulation step is the exact mean of the trace over the step, whatever the step and sample rate.
+
+        Args:
+            name (str): Human readable name of the power draw module used when printing using print().
+            volts (float): The required voltage of the power draw module.
+            path (str): A 1D .npy file, or a raw binary file of dtype samples
+            sampleRate (float): Samples per second, in Hertz
+            loop (bool, optional): Repeat the trace when it runs out, instead of drawing nothing. Defaults to True.
+            alignment (str, optional): Where trace time zero is, ALIGN_TO_SIMULATION or ALIGN_TO_POWERMODE. Defaults to ALIGN_TO_SIMULATION.
+            startTime (float, optional): Trace time in seconds at time zero, to skip the start of a recording. Defaults to 0.0.
+            scale (float, optional): Amps per sample unit (e.g. 0.001 for a trace in mA). Defaults to 1.0.
+            dtype (optional): Sample type of a raw binary file. Defaults to np.float32.
+            headerBytes (int, optional): Bytes to skip at the start of a raw binary file. Defaults to 0.
+
+        Raises:
+            ValueError: If the trace is empty or not 1D, the sample rate isn't positive, the start time is negative, or the alignment is unknown
+        """
+        if sampleRate <= 0:
+            raise ValueError("Trace sample rate must be positive.")
+
+        if startTime < 0:
+            raise ValueError("Trace start time must be non-negative.")
+
+        if alignment not in (TraceConsumption.ALIGN_TO_SIMULATION, TraceConsumption.ALIGN_TO_POWERMODE):
+            raise ValueError(f"{alignment} is an unsupported trace alignment. Use 'TraceConsumption.ALIGN_TO_SIMULATION' or 'TraceConsumption.ALIGN_TO_POWERMODE'.")
+
+        if path.endswith(".npy"):
+            samples = np.load(path, mmap_mode="r")
+        else:
+            samples = np.memmap(path, dtype=dtype, mode="r", offset=headerBytes)
+
+        if samples.ndim != 1 or len(samples) == 0:
+            raise ValueError(f"{path} must hold a non-empty 1D trace.")
+
+        self.name = name
+        self.voltage = volts                        # Units are Volts (V)
+        self.path = path
+        self.samples = samples                      # Memory mapped, never read as a whole
+        self.sampleRate = sampleRate                # Units are Hertz (Hz)
+        self.loop = loop
+        self.alignment = alignment
+        self.startTime = startTime                  # Units are seconds
+        self.scale = scale                          # Units are Amps per sample unit
+
+        # Real time values, the mean of the latest simulation step
+        self.current = 0.0                          # Units are Amps (A)
+        self.power = 0.0                            # Units are Watts (W)
+        self.deviceOn = True                        # Units are Boolean (True/False)
+
+
+    def __str__(self):
+        """ Returns a string representation of a TraceConsumption object.
+        """
+        return f"{self.name}(voltage={self.voltage}, trace={os.path.basename(self.path)}, {len(self.samples)} samples at {self.sampleRate} Hz, loop={self.loop}, on={self.deviceOn})"
+
+
+    @property
+    def duration(self) -> float:
+        """ Length of the trace in seconds """
+        return len(self.samples) / self.sampleRate
+
+
+    def fingerprint(self) -> tuple:
+        """ Everything that affects the current draw, to tell if a cached or checkpointed result is still valid
+
+        Returns:
+            tuple: Hashable description of the trace consumer, including the file size and modification time
+        """
+        stat = os.stat(self.path)
+
+        return (self.name, self.voltage, os.path.abspath(self.path), stat.st_size, stat.st_mtime_ns, self.sampleRate,
+                self.loop, self.alignment, self.startTime, self.scale)
+
+
+    def turn_on(self, mode):
+        """ Turns the trace on or off for a powermode, like Consumption.turn_on()
+
+        Args:
+            mode (int): TRACE_DRAW_MODE or OFF_DRAW_MODE
+        """
+        if mode == TraceConsumption.TRACE_DRAW_MODE:
+            self.deviceOn = True
+        elif mode == TraceConsumption.OFF_DRAW_MODE:
+            self.turn_off()
+        else:
+            raise ValueError("Invalid power draw mode for a trace, use either TRACE_DRAW_MODE or OFF_DRAW_MODE")
+
+
+    def turn_off(self):
+        """ Turns off the module and sets the current draw (and thus power) to zero.
+        """
+        self.deviceOn = False
+        self.current = 0.0
+        self.power = 0.0
+
+
+    def real_time_power(self):
+        """ Calculates the power consumption of the latest simulation step.
+
+        Returns:
+            float: The current power consumption in Watts (W).
+        """
+        if not self.deviceOn:
+            return 0.0
+
+        return self.voltage * self.current
+
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """ Samples from start up to end in Amps, looped or zero after the end of the trace
+
+        Args:
+            start (int): First sample index, counted from the start of the trace, may be past its end
+            end (int): Sample index to stop before
+
+        Returns:
+            np.ndarray: end - start currents in Amps
+        """
+        traceLength = len(self.samples)
+        current = np.zeros(end - start)
+        if not self.loop:
+            stop = min(end, traceLength)
+            if start < stop:
+                current[:stop - start] = self.samples[start:stop]
+        else:
+            position = start
+            while position < end:
+                offset = position % traceLength
+                count = min(traceLength - offset, end - position)
+                current[position - start:position - start + count] = self.samples[offset:offset + count]
+                position += count
+
+        current *= self.scale
+
+        return current
+
+
+    def integral(self, positions: np.ndarray) -> np.ndarray:
+        """ Charge drawn from the first position to every position, streaming the trace through in windows
+
+        Args:
+            positions (np.ndarray): Sorted trace positions, in samples (seconds times sampleRate)
+
+        Returns:
+            np.ndarray: Charge in Amp-samples from positions[0] to every position
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        whole = np.floor(positions).astype(np.int64)
+        charge = np.empty(len(positions))
+        first = int(whole[0])
+        last = int(np.ceil(positions[-1]))
+
+        running = 0.0
+        done = 0
+        for windowStart in range(first, max(last, first + 1), TraceConsumption.MAX_WINDOW_SAMPLES):
+            windowEnd = min(windowStart + TraceConsumption.MAX_WINDOW_SAMPLES, last)
+            current = np.append(self.read(windowStart, windowEnd), 0.0)
+            prefix = np.empty(len(current))
+            prefix[0] = running
+            np.cumsum(current[:-1], out=prefix[1:])
+            prefix[1:] += running
+
+            count = len(positions) if windowEnd >= last else int(np.searchsorted(positions, windowEnd, side="left"))
+            index = whole[done:count] - windowStart
+            charge[done:count] = prefix[index] + (positions[done:count] - whole[done:count]) * current[index]
+            done = count
+            running = float(prefix[-1])
+
+        return charge - charge[0]
+
+
+    def step_currents(self, traceTime: float, stepLengths: np.ndarray) -> np.ndarray:
+        """ Mean current of every simulation step, integrating the trace over each step
+
+        Args:
+            traceTime (float): Time in seconds since trace time zero (see alignment) at the start of the first step
+            stepLengths (np.ndarray): Length in seconds of every step
+
+        Returns:
+            np.ndarray: Mean current in Amps of every step
+
+        Raises:
+            ValueError: If a step is not longer than 0 seconds, its mean current would divide by zero
+        """
+        stepLengths = np.asarray(stepLengths, dtype=np.float64)
+        if not np.all(stepLengths > 0):
+            raise ValueError("Every trace time step must be longer than 0 seconds.")
+
+        edges = np.empty(len(stepLengths) + 1)
+        edges[0] = self.startTime + traceTime
+        np.cumsum(stepLengths, out=edges[1:])
+        edges[1:] += edges[0]
+
+        return np.diff(self.integral(edges * self.sampleRate)) / (stepLengths * self.sampleRate)
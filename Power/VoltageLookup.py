@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+
+# External libraries
+import numpy as np
+
+
+class VoltageLookup:
+
+    def __init__(self, socTable: np.ndarray, voltageTable: np.ndarray):
+        """ Precomputed open circuit voltage lookups for one battery cell chemistry
+
+            Finding the CHEM_SOC entry nearest a state of charge with np.abs(socTable - soc).argmin() scans the whole table
+            on every call. Instead the state of charge range is split into equal bins, narrow enough that at most one table
+            entry falls inside any bin, so a bin index and one comparison either side find the same entry in O(1).
+
+        Args:
+            socTable (np.ndarray): Increasing states of charge (in %), see BatteryCell.CHEM_SOC
+            voltageTable (np.ndarray): Cell voltage (in Volts) at each state of charge, see BatteryCell.CHEM_VOLTAGE
+
+        Raises:
+            ValueError: If the tables differ in length, have fewer than two entries, or the states of charge are not increasing
+        """
+        self.socTable = np.asarray(socTable, dtype=np.float64)
+        self.voltageTable = np.asarray(voltageTable)
+        if len(self.socTable) != len(self.voltageTable) or len(self.socTable) < 2:
+            raise ValueError("State of charge and voltage tables must be the same length, with at least two entries.")
+
+        gaps = np.diff(self.socTable)
+        if gaps.min() <= 0:
+            raise ValueError("State of charge table must be strictly increasing.")
+
+        # Half the smallest gap keeps the table entry below any state of charge within one step of its bin's entry
+        self.binWidth = float(gaps.min()) / 2
+        self.binCount = int(np.ceil((self.socTable[-1] - self.socTable[0]) / self.binWidth)) + 1
+        binStarts = self.socTable[0] + np.arange(self.binCount) * self.binWidth
+        self.lowerIndexes = np.searchsorted(self.socTable, binStarts, side='right') - 1
+
+        # Plain Python copies for the scalar path, where indexing a list is much faster than indexing an array
+        self.socList = self.socTable.tolist()
+        self.lowerList = self.lowerIndexes.tolist()
+        self.voltageList = self.voltageTable.tolist()
+        self.lastIndex = len(self.socList) - 1
+
+
+    def nearest_index(self, stateOfCharge: float) -> int:
+        """ Same result as np.abs(socTable - stateOfCharge).argmin() in O(1), including ties going to the lower index
+
+        Args:
+            stateOfCharge (float): State of charge (in %) to look up
+
+        Returns:
+            int: Array index into the state of charge and voltage tables
+        """
+        table = self.socList
+        if stateOfCharge <= table[0]:
+            return 0
+        if stateOfCharge >= table[-1]:
+            return self.lastIndex
+
+        b = int((stateOfCharge - table[0]) / self.binWidth)
+        lower = self.lowerList[b if b < self.binCount else self.binCount - 1]
+        if table[lower + 1] <= stateOfCharge:
+            lower += 1
+        elif table[lower] > stateOfCharge:
+            lower -= 1
+
+        # Strictly inside the table here, so lower + 1 exists
+        if stateOfCharge - table[lower] <= table[lower + 1] - stateOfCharge:
+            return lower
+
+        return lower + 1
+
+
+    def nearest_indexes(self, statesOfCharge: np.ndarray) -> np.ndarray:
+        """ Vectorized nearest_index() for every element of an array
+
+        Args:
+            statesOfCharge (np.ndarray): States of charge (in %) to look up
+
+        Returns:
+            np.ndarray: Array indexes into the state of charge and voltage tables
+        """
+        statesOfCharge = np.asarray(statesOfCharge, dtype=np.float64)
+        table = self.socTable
+        bins = np.clip(((statesOfCharge - table[0]) / self.binWidth).astype(np.int64), 0, self.binCount - 1)
+        lower = self.lowerIndexes[bins]
+        lower = np.where(table[np.minimum(lower + 1, self.lastIndex)] <= statesOfCharge, np.minimum(lower + 1, self.lastIndex), lower)
+        lower = np.where((lower > 0) & (table[lower] > statesOfCharge), lower - 1, lower)
+
+        lower = np.clip(lower, 0, self.lastIndex - 1)
+        useLower = np.abs(table[lower] - statesOfCharge) <= np.abs(table[lower + 1] - statesOfCharge)
+
+        return np.where(useLower, lower, lower + 1)
+
+
+    def voltage(self, stateOfCharge: float) -> float:
+        """ Cell voltage at the table entry nearest a state of charge, as BatteryCell snaps it
+
+        Args:
+            stateOfCharge (float): State of charge (in %)
+
+        Returns:
+            float: Cell voltage in Volts
+        """
+        return self.voltageList[self.nearest_index(stateOfCharge)]
+
+
+    def voltages(self, statesOfCharge: np.ndarray) -> np.ndarray:
+        """ Vectorized voltage() for a whole state of charge trajectory in one call
+
+        Args:
+            statesOfCharge (np.ndarray): States of charge (in %)
+
+        Returns:
+            np.ndarray: Cell voltage in Volts at each state of charge
+        """
+        return self.voltageTable[self.nearest_indexes(statesOfCharge)]
+
+
+    def state_of_charge(self, voltages) -> np.ndarray:
+        """ Estimated state of charge by linear interpolation of the voltage table, for one voltage or an array of them
+
+        Args:
+            voltages (float or np.ndarray): Cell voltages in Volts
+
+        Returns:
+            np.ndarray: State of charge (in %) at each voltage
+        """
+        return np.interp(voltages, self.voltageTable, self.socTable)
@@ -1,7 +1,8 @@
 from .BatteryPack import BatteryPack
 from .Consumption import Consumption
+from .ConsumerBank import ConsumerBank
 from .BatteryCell import BatteryCell
 
 VERSION = "1.0.0"
 
-__all__ = ["BatteryPack", "BatteryCell", "Consumption", "VERSION"]
+__all__ = ["BatteryPack", "BatteryCell", "Consumption", "ConsumerBank", "VERSION"]
@@ -0,0 +1,290 @@
+#!/usr/bin/python3
+
+# External libraries
+import numpy as np
+
+# Internal libraries
+from Power.Consumption import Consumption
+from Power.ConsumerBank import ConsumerBank
+from Power.TraceConsumption import TraceConsumption
+from Power.BatteryCell import BatteryCell
+
+# Value of drawModes in a recharge segment, where no consumer is turned on
+NO_DRAW_MODE = -1
+DRAW_MODES = (Consumption.MIN_POWER_DRAW_MODE, Consumption.AVG_POWER_DRAW_MODE, Consumption.MAX_POWER_DRAW_MODE)
+
+
+def schedule_dtype(consumerCount: int) -> np.dtype:
+    """ NumPy structured type of one compiled powermode segment
+
+    Args:
+        consumerCount (int): Number of consumers in the simulation
+
+    Returns:
+        np.dtype: Structured type with one field per segment property
+    """
+    return np.dtype([("start", np.float64),                         # Units are seconds since the start of the powermodes
+                     ("duration", np.float64),                      # Units are seconds
+                     ("isRecharge", np.bool_),
+                     ("rechargeTarget", np.float64),                # Units are percentage, NaN for power consuming segments
+                     ("totalCurrent", np.float64),                  # Units are Amps, of all consumers together
+                     ("totalPower", np.float64),                    # Units are Watts, of all consumers together (ignoring duty cycle, like Simulation.run())
+                     ("energyPerSecond", np.float64),               # Units are Watt-hours used by all consumers together every second
+                     ("drawModes", np.int8, (consumerCount,))])     # Consumption power draw mode of every consumer, in Simulation.consumers order
+
+
+def format_watts(watts: float) -> str:
+    """ Power draw as printed in the "Total power draw of ... Watts" ValueError
+
+        The compiled loads are always floats, whole numbers are printed without a decimal point, the way Simulation.run()
+        printed the sum of whole number consumer volts and amps before the loads were compiled.
+
+    Args:
+        watts (float): Power in Watts
+
+    Returns:
+        str: The power, e.g. "12" or "12.5"
+    """
+    watts = float(watts)
+
+    return str(int(watts)) if watts.is_integer() else str(watts)
+
+
+def compile_schedule(consumers: list, powermodes: list) -> np.ndarray:
+    """ Turn a "powermodes" list into one structured array row per segment, so engines never look up dicts or Consumption objects per time step
+
+        Loads are added up by ConsumerBank.segment_loads(), in the same order and with the same arithmetic as Consumption.turn_on()
+        followed by Consumption.real_time_energy(), so the compiled values are bit identical.
+
+    Args:
+        consumers (list): Consumption objects of the simulation
+        powermodes (list): Power modes in the Simulation.powermodes format, alternating mode dicts and durations in seconds
+
+    Returns:
+        np.ndarray: One row per segment, see schedule_dtype()
+
+    Raises:
+        ValueError: If a duration is negative, a powermode names an unknown consumer, leaves a consumer out, or uses an unknown power draw mode
+    """
+    if len(powermodes) % 2 != 0:
+        raise ValueError("Powermodes must alternate power mode dicts and durations in seconds.")
+
+    schedule = np.zeros(len(powermodes) // 2, dtype=schedule_dtype(len(consumers)))
+    simulated = set(consumers)
+    start = 0
+
+    for i in range(0, len(powermodes), 2):
+        powermode, duration, segment = powermodes[i], powermodes[i+1], schedule[i // 2]
+        if duration < 0:
+            raise ValueError(f"Powermode {i // 2} has a negative duration of {duration} seconds.")
+
+        segment["start"] = start
+        segment["duration"] = duration
+        start += duration
+
+        if BatteryCell.RECHARGE in powermode:
+            if len(powermode) != 1:
+                raise ValueError(f"Powermode {i // 2} mixes '{BatteryCell.RECHARGE}' with consumers.")
+
+            segment["isRecharge"] = True
+            segment["rechargeTarget"] = powermode[BatteryCell.RECHARGE]
+            segment["drawModes"] = NO_DRAW_MODE
+            continue
+
+        unknown = [key for key in powermode if key not in simulated]
+        if len(unknown) > 0:
+            raise ValueError(f"Powermode {i // 2} uses {', '.join(str(key) for key in unknown)}, which is not a simulated consumer.")
+
+        drawModes = [powermode.get(consumer) for consumer in consumers]
+        for consumer, mode in zip(consumers, drawModes):
+            if mode is None:
+                raise ValueError(f"Powermode {i // 2} has no power draw mode for {consumer.name}.")
+            if isinstance(consumer, TraceConsumption):
+                if mode not in TraceConsumption.DRAW_MODES:
+                    raise ValueError("Invalid power draw mode for a trace, use either TRACE_DRAW_MODE or OFF_DRAW_MODE")
+            elif mode not in DRAW_MODES:
+                raise ValueError("Invalid power draw mode, use either MIN_POWER_DRAW_MODE, AVG_POWER_DRAW_MODE, or MAX_POWER_DRAW_MODE")
+
+        segment["drawModes"] = drawModes
+
+    # Loads of every power consuming segment and every consumer in one (segment x consumer) matrix operation, traces vary
+    # within a segment so they are left out (see trace_loads())
+    consuming = ~schedule["isRecharge"]
+    columns = [c for c, consumer in enumerate(consumers) if not isinstance(consumer, TraceConsumption)]
+    drawModes = schedule["drawModes"][consuming]
+    if len(columns) < len(consumers):
+        drawModes = drawModes[:, columns]
+    loads = ConsumerBank.gather([consumers[c] for c in columns]).segment_loads(drawModes)
+    schedule["rechargeTarget"][consuming] = np.nan
+    schedule["totalCurrent"][consuming], schedule["totalPower"][consuming], schedule["energyPerSecond"][consuming] = loads
+
+    return schedule
+
+
+def validate_schedule(schedule: np.ndarray, generator, voltageRegulatorEfficiency: int) -> None:
+    """ Check every power consuming segment against the battery pack limits at once, before running anything
+
+    Args:
+        schedule (np.ndarray): Compiled powermodes, see compile_schedule()
+        generator (BatteryPack): The battery pack that supplies the power
+        voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+
+    Raises:
+        ValueError: If any segment draws more power than the battery pack supplies, or more current than a cell supplies
+    """
+    consuming = schedule[~schedule["isRecharge"]]
+    effectivePowerOutput = generator.maxPackPower * (voltageRegulatorEfficiency / 100)
+
+    overPower = consuming["totalPower"] > effectivePowerOutput
+    if overPower.any():
+        raise ValueError(f"Warning: Total power draw of {format_watts(consuming['totalPower'][overPower][0])} Watts, exceeds battery pack capacity of {effectivePowerOutput} Watts")
+
+    cellCurrentDraw = consuming["totalCurrent"] / generator.parallelCount
+    overCurrent = cellCurrentDraw > generator.cells.maxAmpere
+    if overCurrent.any():
+        raise ValueError(f"Current draw of {cellCurrentDraw[overCurrent][0]} exceeds maximum limit of {generator.cells.maxAmpere} for the battery cell(s)")
+
+
+def apply_draw_modes(consumers: list, segment) -> None:
+    """ Turn on every consumer in the power draw mode of a compiled power consuming segment, once per segment
+
+    Args:
+        consumers (list): Consumption objects of the simulation, in the order the schedule was compiled with
+        segment (np.void): One row of a compiled schedule
+    """
+    bank = ConsumerBank.shared(consumers)
+    if bank is not None:
+        bank.turn_on(segment["drawModes"])
+        return
+
+    for consumer, mode in zip(consumers, segment["drawModes"].tolist()):
+        consumer.turn_on(mode)
+
+
+def has_traces(schedule: np.ndarray) -> bool:
+    """ Whether any segment of a compiled schedule plays a TraceConsumption, for engines that need a constant load per segment
+
+    Args:
+        schedule (np.ndarray): Compiled powermodes, see compile_schedule()
+
+    Returns:
+        bool: True if any consumer is in TRACE_DRAW_MODE
+    """
+    return bool(np.any(schedule["drawModes"] == TraceConsumption.TRACE_DRAW_MODE))
+
+
+def trace_loads(consumers: list, segment, stepLengths: np.ndarray, segmentTime: float = 0.0) -> tuple:
+    """ Current and power of every TraceConsumption playing in a power consuming segment, at every time step
+
+        Updates every playing trace consumer's current and power to the last time step's.
+
+    Args:
+        consumers (list): Consumption and TraceConsumption objects of the simulation, in the order the schedule was compiled with
+        segment (np.void): One row of a compiled schedule
+        stepLengths (np.ndarray): Length in seconds of every time step
+        segmentTime (float, optional): Seconds since the segment started at the start of the first time step. Defaults to 0.0.
+
+    Returns:
+        np.ndarray: Total trace current in Amps at every time step, or None if no trace plays in this segment
+        np.ndarray: Total trace power in Watts at every time step, or None
+    """
+    totalCurrent = None
+    totalPower = None
+    for consumer, mode in zip(consumers, segment["drawModes"].tolist()):
+        if mode != TraceConsumption.TRACE_DRAW_MODE:
+            continue
+
+        traceTime = segmentTime
+        if consumer.alignment == TraceConsumption.ALIGN_TO_SIMULATION:
+            traceTime += float(segment["start"])
+
+        current = consumer.step_currents(traceTime, stepLengths)
+        power = consumer.voltage * current
+        consumer.current = float(current[-1])
+        consumer.power = float(power[-1])
+
+        totalCurrent = current if totalCurrent is None else totalCurrent + current
+        totalPower = power if totalPower is None else totalPower + power
+
+    return totalCurrent, totalPower
+
+
+def pulse_waveform(consumers: list, segment) -> tuple:
+    """ One PWM period of the total load of a power consuming segment, every consumer on for its duty cycle from its pulse phase
+
+        The load only changes at pulse edges, so a period is a few flat pieces, however many consumers there are.
+
+    Args:
+        consumers (list): Consumption and TraceConsumption objects of the simulation, in the order the schedule was compiled with
+        segment (np.void): One row of a compiled schedule
+
+    Returns:
+        np.ndarray: Edges of the pieces, as fractions of the period from 0 to 1
+        np.ndarray: Total current draw in Amps of every piece
+        np.ndarray: Total power draw in Watts of every piece
+    """
+    columns = [c for c, consumer in enumerate(consumers) if not isinstance(consumer, TraceConsumption)]
+    bank = ConsumerBank.gather([consumers[c] for c in columns])
+    if len(bank) == 0:
+        return np.array([0.0, 1.0]), np.zeros(1), np.zeros(1)
+
+    current = bank.mode_currents(segment["drawModes"][columns])
+    duty = bank.dutyCycle / 100
+    start = (bank.pulsePhase / 100) % 1.0
+    edges = np.unique(np.concatenate(([0.0, 1.0], start, (start + duty) % 1.0)))
+
+    # (piece x consumer) on or off, tested in the middle of every piece
+    middle = (edges[:-1] + edges[1:]) / 2
+    isOn = ((middle[:, None] - start) % 1.0) < duty
+
+    return edges, np.dot(isOn, current), np.dot(isOn, bank.voltage * current)
+
+
+def pulse_loads(consumers: list, segment, pulsePeriod: float, stepLengths: np.ndarray, segmentTime: float = 0.0) -> tuple:
+    """ Load of a power consuming segment at every time step, with duty cycles modelled as PWM pulses instead of averaged
+
+        One period of the load (see pulse_waveform()) is integrated once, then folded over the time steps: the integral up
+        to any time is the number of whole periods before it times the integral of a period, plus the integral of the part
+        of a period left over. Millisecond pulses cost no more than hour long ones, and every step is integrated exactly.
+        Pulse time zero is the start of the powermodes, so the pulses keep their rhythm from one powermode to the next.
+
+    Args:
+        consumers (list): Consumption and TraceConsumption objects of the simulation, in the order the schedule was compiled with
+        segment (np.void): One row of a compiled schedule
+        pulsePeriod (float): Length of one PWM period in seconds
+        stepLengths (np.ndarray): Length in seconds of every time step
+        segmentTime (float, optional): Seconds since the segment started at the start of the first time step. Defaults to 0.0.
+
+    Returns:
+        np.ndarray: Mean current draw in Amps over every time step
+        np.ndarray: Mean of the current draw squared in Amps^2 over every time step, for the heat in the cell resistance
+        np.ndarray: Mean power draw in Watts over every time step
+        float: Peak current draw in Amps, when the most pulses overlap
+        float: Peak power draw in Watts
+
+    Raises:
+        ValueError: If a time step is not longer than 0 seconds, its mean load would divide by zero
+    """
+    if not np.all(stepLengths > 0):
+        raise ValueError("Every pulsed time step must be longer than 0 seconds.")
+
+    edges, current, power = pulse_waveform(consumers, segment)
+    widths = np.diff(edges) * pulsePeriod
+
+    stepEdges = np.empty(len(stepLengths) + 1)
+    stepEdges[0] = float(segment["start"]) + segmentTime
+    np.cumsum(stepLengths, out=stepEdges[1:])
+    stepEdges[1:] += stepEdges[0]
+
+    # Periods are counted from the one the first step starts in, so the integrals stay small
+    stepEdges -= np.floor(stepEdges[0] / pulsePeriod) * pulsePeriod
+    periods = np.floor(stepEdges / pulsePeriod)
+    leftOver = np.clip(stepEdges / pulsePeriod - periods, 0.0, 1.0)
+
+    means = []
+    for level in (current, current * current, power):
+        periodIntegral = np.concatenate(([0.0], np.cumsum(level * widths)))
+        integral = periods * periodIntegral[-1] + np.interp(leftOver, edges, periodIntegral)
+        means.append(np.diff(integral) / stepLengths)
+
+    return means[0], means[1], means[2], float(current.max()), float(power.max())
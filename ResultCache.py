@@ -0,0 +1,346 @@
+#!/usr/bin/python3
+
+# Standard libraries
+import os
+import shutil
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+
+# External libraries
+import numpy as np
+
+# Internal libraries
+from Simulation import Simulation
+from SimulationLog import SimulationLog
+from Checkpoint import CellState, Checkpoint
+from Power.BatteryCell import BatteryCell
+from Power.TraceConsumption import TraceConsumption
+
+
+@dataclass
+class CacheStats:
+    memoryHits: int = 0
+    diskHits: int = 0
+    misses: int = 0
+    evictions: int = 0          # Entries dropped from either tier to stay under its size limit
+
+    @property
+    def hits(self) -> int:
+        return self.memoryHits + self.diskHits
+
+
+    @property
+    def hitRate(self) -> float:
+        """ Fraction of lookups answered from the cache, 0 before the first lookup """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+
+@dataclass
+class CachedRun:
+    stateOfCharge: np.ndarray   # batteryPackPercentageLog
+    timeLog: np.ndarray
+    logData: np.ndarray         # SimulationLog.data, or None for a list log
+    modeIndex: np.ndarray       # SimulationLog.modeIndex, or None for a list log
+    final: Checkpoint           # Battery cell and consumer state at the end of the run
+    error: str                  # ValueError message the run stopped with, or None
+
+
+class ResultCache:
+
+    DEFAULT_MAX_ENTRIES = 64
+    DEFAULT_MAX_DISK_BYTES = 256 * 1024 * 1024
+
+    def __init__(self, maxEntries: int = DEFAULT_MAX_ENTRIES, directory: str = None, maxDiskBytes: int = DEFAULT_MAX_DISK_BYTES):
+        """ Remembers the results of simulation runs, keyed by a hash of every input, so identical runs are never computed twice
+
+            Entries live in an in memory least recently used tier and, if a directory is given, in .npz files on disk that
+            outlive the process. Entries are keyed by Simulation.MODEL_VERSION, so bumping it invalidates every older entry.
+
+        Args:
+            maxEntries (int, optional): Most runs kept in memory. Defaults to DEFAULT_MAX_ENTRIES.
+            directory (str, optional): Folder for the disk tier. Defaults to None (memory only).
+            maxDiskBytes (int, optional): Largest total size of the disk tier, the least recently used files are deleted past it. Defaults to DEFAULT_MAX_DISK_BYTES.
+
+        Raises:
+            ValueError: If a size limit is negative
+        """
+        if maxEntries < 0 or maxDiskBytes < 0:
+            raise ValueError("ResultCache size limits must be non-negative.")
+
+        self.maxEntries = maxEntries
+        self.maxDiskBytes = maxDiskBytes
+        self.memory = OrderedDict()
+        self.stats = CacheStats()
+
+        self.directory = None
+        if directory is not None:
+            self.directory = os.path.join(directory, f"v{Simulation.MODEL_VERSION}")
+            os.makedirs(self.directory, exist_ok=True)
+            self.remove_stale_versions(directory)
+
+
+    def remove_stale_versions(self, directory: str) -> None:
+        """ Delete disk tier folders written by any other Simulation.MODEL_VERSION
+
+        Args:
+            directory (str): Folder holding one subfolder per model version
+        """
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.startswith("v") and os.path.isdir(path) and path != self.directory:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+    @staticmethod
+    def key(sim: Simulation, runTimeInSeconds: int, voltageRegulatorEfficiency: int, engine: str) -> str:
+        """ Stable hash of everything that affects the result of a run, identical across processes and sessions
+
+        Args:
+            sim (Simulation): The simulation about to run, in its starting state
+            runTimeInSeconds (int): The duration in seconds for which the simulation is run.
+            voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+            engine (str): Simulation engine, defined as a CONSTANT in Simulation.py
+
+        Returns:
+            str: Hex digest of the inputs
+        """
+        cell = sim.generator.cells
+        cellInputs = (cell.chemistry, cell.currentVoltage, cell.stateOfCharge, cell.currentEnergy, cell.totalEnergyCapacity,
+                      cell.cRating, cell.health, cell.rechargeCycleNumber)
+        if cell.equivalentCircuit is not None:
+            circuit = cell.equivalentCircuit
+            cellInputs += (circuit.seriesResistance, tuple(circuit.pairResistance.tolist()), tuple(circuit.pairCapacitance.tolist()), tuple(circuit.pairVoltage.tolist()))
+        packInputs = (sim.generator.seriesCount, sim.generator.parallelCount)
+        if sim.generator.charger is not None:
+            charger = sim.generator.charger
+            packInputs += (charger.maxPower, charger.maxCurrent, charger.cRating, charger.cvStateOfCharge, charger.terminationCRate)
+        consumerInputs = tuple(consumer.fingerprint() if isinstance(consumer, TraceConsumption) else
+                               (consumer.name, consumer.voltage, consumer.minCurrent, consumer.averageCurrent, consumer.maxCurrent, consumer.dutyCycle)
+                               for consumer in sim.consumers)
+
+        modeInputs = []
+        for i in range(0, len(sim.powermodes), 2):
+            if BatteryCell.RECHARGE in sim.powermodes[i]:
+                modeInputs.append((BatteryCell.RECHARGE, sim.powermodes[i][BatteryCell.RECHARGE], sim.powermodes[i+1]))
+            else:
+                modeInputs.append((tuple(sim.powermodes[i].get(consumer) for consumer in sim.consumers), sim.powermodes[i+1]))
+
+        logType = sim.logType if sim.logType is None or isinstance(sim.logType, str) else np.dtype(sim.logType).name
+        runInputs = (Simulation.MODEL_VERSION, runTimeInSeconds, voltageRegulatorEfficiency, engine, sim.timeStep, sim.maxSocChangePerStep, sim.minAdaptiveTimeStep, logType)
+        if sim.pulsePeriod is not None:
+            runInputs += (sim.pulsePeriod, tuple(consumer.pulsePhase for consumer in sim.consumers if not isinstance(consumer, TraceConsumption)))
+
+        # repr() of ints, floats and strings is exact and doesn't depend on the process, unlike hash()
+        return hashlib.sha256(repr((runInputs, cellInputs, packInputs, consumerInputs, tuple(modeInputs))).encode()).hexdigest()
+
+
+    def run(self, sim: Simulation, runTimeInSeconds: int, voltageRegulatorEfficiency: int, engine: str = Simulation.LOOP_ENGINE) -> list:
+        """ Drop in replacement for Simulation.run(), which returns the stored result instead when the same run was done before
+
+            On a hit the logs, battery cell and consumers are left exactly as the run would leave them, and a run that stopped
+            with a ValueError raises it again. Piecewise linear logs aren't cached and always run.
+
+        Args:
+            sim (Simulation): The simulation to run
+            runTimeInSeconds (int): The duration in seconds for which the simulation is run.
+            voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+            engine (str, optional): Simulation engine, defined as a CONSTANT in Simulation.py. Defaults to Simulation.LOOP_ENGINE.
+
+        Returns:
+            list: Battery charge state data calculated during a simulation run.
+
+        Raises:
+            ValueError: If the battery pack can't supply or accept the requested power, just as Simulation.run().
+        """
+        if sim.logType == Simulation.PIECEWISE_LINEAR_LOG:
+            return sim.run(runTimeInSeconds, voltageRegulatorEfficiency, engine)
+
+        key = ResultCache.key(sim, runTimeInSeconds, voltageRegulatorEfficiency, engine)
+        entry = self.lookup(key)
+
+        if entry is None:
+            self.stats.misses += 1
+            error = None
+            try:
+                sim.run(runTimeInSeconds, voltageRegulatorEfficiency, engine)
+            except ValueError as e:
+                error = str(e)
+
+            entry = ResultCache.capture(sim, error)
+            self.store(key, entry)
+        else:
+            ResultCache.restore(sim, entry)
+
+        if entry.error is not None:
+            raise ValueError(entry.error)
+
+        return sim.batteryPackPercentageLog
+
+
+    def lookup(self, key: str) -> CachedRun:
+        """ Find a stored run in memory, then on disk, counting the hit
+
+        Args:
+            key (str): ResultCache.key() of the run
+
+        Returns:
+            CachedRun: The stored run, or None
+        """
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.stats.memoryHits += 1
+            return self.memory[key]
+
+        entry = self.load(key)
+        if entry is not None:
+            self.stats.diskHits += 1
+            self.remember(key, entry)
+
+        return entry
+
+
+    def store(self, key: str, entry: CachedRun) -> None:
+        """ Add a run to both tiers, evicting the least recently used entries past the size limits
+
+        Args:
+            key (str): ResultCache.key() of the run
+            entry (CachedRun): The run to store
+        """
+        self.remember(key, entry)
+
+        if self.directory is not None:
+            self.save(key, entry)
+
+
+    def remember(self, key: str, entry: CachedRun) -> None:
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+
+        while len(self.memory) > self.maxEntries:
+            self.memory.popitem(last=False)
+            self.stats.evictions += 1
+
+
+    def invalidate(self) -> None:
+        """ Forget every stored run, in memory and on disk """
+        self.memory.clear()
+
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                os.remove(os.path.join(self.directory, name))
+
+
+    @staticmethod
+    def capture(sim: Simulation, error: str) -> CachedRun:
+        """ Copy the results of a finished run into read only arrays
+
+        Args:
+            sim (Simulation): The simulation that just ran
+            error (str): ValueError message the run stopped with, or None
+
+        Returns:
+            CachedRun: The run to store
+        """
+        def frozen(values) -> np.ndarray:
+            values = np.array(values)
+            values.flags.writeable = False
+            return values
+
+        logData = frozen(sim.log.data) if sim.log is not None else None
+        modeIndex = frozen(sim.log.modeIndex) if sim.log is not None else None
+        final = Checkpoint.capture(sim, len(sim.powermodes), len(sim.timeLog), 0)
+
+        return CachedRun(frozen(np.asarray(sim.batteryPackPercentageLog, dtype=np.float64)), frozen(sim.timeLog), logData, modeIndex, final, error)
+
+
+    @staticmethod
+    def restore(sim: Simulation, entry: CachedRun) -> None:
+        """ Leave a simulation exactly as the stored run left it, with its own copy of the logs
+
+        Args:
+            sim (Simulation): The simulation to update in place
+            entry (CachedRun): The stored run
+        """
+        sim.timeLog = entry.timeLog.tolist()
+
+        if entry.logData is None:
+            sim.log = None
+            sim.batteryPackPercentageLog = entry.stateOfCharge.tolist()
+        else:
+            sim.log = SimulationLog(entry.logData.shape[1], entry.logData.dtype, entry.logData.shape[0] > len(SimulationLog.CHANNELS))
+            sim.log.data[:] = entry.logData
+            sim.log.modeIndex[:] = entry.modeIndex
+            sim.batteryPackPercentageLog = sim.log.stateOfCharge
+
+        entry.final.restore(sim)
+
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npz")
+
+
+    def save(self, key: str, entry: CachedRun) -> None:
+        """ Write a run to the disk tier, then delete the least recently used files until it fits in maxDiskBytes
+
+        Args:
+            key (str): ResultCache.key() of the run
+            entry (CachedRun): The run to store
+        """
+        scalarFields = [field for field in CellState.__dataclass_fields__ if field != "pairVoltages"]
+        arrays = {"stateOfCharge": entry.stateOfCharge,
+                  "timeLog": entry.timeLog,
+                  "cell": np.array([getattr(entry.final.cell, field) for field in scalarFields], dtype=np.float64),
+                  "pairVoltages": np.array(entry.final.cell.pairVoltages, dtype=np.float64),
+                  "consumers": np.array(entry.final.consumers, dtype=np.float64).reshape(-1, 3),
+                  "error": np.array("" if entry.error is None else entry.error)}
+        if entry.logData is not None:
+            arrays["logData"] = entry.logData
+            arrays["modeIndex"] = entry.modeIndex
+
+        # Write then rename, so another process never reads a half written file
+        temporaryPath = self.path(key) + ".tmp"
+        with open(temporaryPath, "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(temporaryPath, self.path(key))
+
+        files = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".npz")]
+        files.sort(key=os.path.getmtime)
+        totalBytes = sum(os.path.getsize(file) for file in files)
+        for file in files:
+            if totalBytes <= self.maxDiskBytes:
+                break
+            totalBytes -= os.path.getsize(file)
+            os.remove(file)
+            self.stats.evictions += 1
+
+
+    def load(self, key: str) -> CachedRun:
+        """ Read a run from the disk tier, marking it as recently used
+
+        Args:
+            key (str): ResultCache.key() of the run
+
+        Returns:
+            CachedRun: The stored run, or None if it isn't on disk
+        """
+        if self.directory is None or not os.path.exists(self.path(key)):
+            return None
+
+        with np.load(self.path(key), allow_pickle=False) as arrays:
+            cellValues = arrays["cell"].tolist()
+            fields = list(CellState.__dataclass_fields__)
+            cellValues[fields.index("rechargeCycleNumber")] = int(cellValues[fields.index("rechargeCycleNumber")])
+            cellValues[fields.index("currentDrawSet")] = bool(cellValues[fields.index("currentDrawSet")])
+            cellValues.append(tuple(arrays["pairVoltages"].tolist()) if "pairVoltages" in arrays else ())
+            consumers = tuple((current, power, bool(deviceOn)) for current, power, deviceOn in arrays["consumers"].tolist())
+            final = Checkpoint(0, len(arrays["timeLog"]), 0, CellState(*cellValues), consumers)
+            error = str(arrays["error"]) or None
+
+            entry = CachedRun(arrays["stateOfCharge"], arrays["timeLog"], arrays["logData"] if "logData" in arrays else None,
+                              arrays["modeIndex"] if "modeIndex" in arrays else None, final, error)
+
+        os.utime(self.path(key))
+
+        return entry
@@ -3,10 +3,21 @@
 # Standard libraries
 import math
 
+# External libraries
+import numpy as np
+
 # Internal libraries
 from Power.Consumption import Consumption
 from Power.BatteryPack import BatteryPack
 from Power.BatteryCell import BatteryCell
+from Power.TraceConsumption import TraceConsumption
+from VectorizedEngine import run_vectorized, iter_vectorized, charging_ampere, segment_step_load
+from EventSolver import run_event_driven, run_piecewise_linear
+from AdaptiveTimeStep import run_adaptive, MIN_TIME_STEP
+from SimulationLog import SimulationLog
+from PiecewiseLinearLog import PiecewiseLinearLog, StepTimes
+from PowermodeSchedule import compile_schedule, validate_schedule, apply_draw_modes, has_traces, format_watts
+from ChargeTrajectory import ChargeTrajectory
 
 class Simulation:
 
@@ -17,22 +28,57 @@ class Simulation:
     TEN_MINUTE_IN_SECONDS = int(ONE_HOUR_IN_SECONDS / 6)
     FIVE_MINUTE_IN_SECONDS = int(ONE_HOUR_IN_SECONDS / 12)
 
-    def __init__(self, powerDrawSources: list[Consumption], powerGenerationSource: BatteryPack, modes: list):
+    # Simulation engines that can be passed to Simulation.run()
+    LOOP_ENGINE = "LOOP"                # Original second by second Python loop
+    VECTORIZED_ENGINE = "VECTORIZED"    # One NumPy array computation per powermode segment (see VectorizedEngine.py)
+    EVENT_ENGINE = "EVENT"              # Jumps between state changes and interpolates the log (see EventSolver.py)
+
+    DEFAULT_CHUNK_SIZE = 4096           # Time steps per chunk yielded by Simulation.iter_run()
+    PROGRESS_INTERVAL = 4096            # Most time steps computed between two progress() calls of Simulation.run_incremental()
+
+    # Pass as timeStep to let Simulation.run() choose its own step sizes (see AdaptiveTimeStep.py)
+    ADAPTIVE_TIME_STEP = 0
+    DEFAULT_MAX_SOC_CHANGE_PER_STEP = 0.01  # Units are state of charge percentage
+
+    # Pass as logType to store batteryPackPercentageLog as straight line pieces (see PiecewiseLinearLog.py)
+    PIECEWISE_LINEAR_LOG = "PIECEWISE_LINEAR"
+
+    # Bump whenever a code change alters simulation results, so every ResultCache entry from older code is discarded
+    MODEL_VERSION = 1
+
+    def __init__(self, powerDrawSources: list[Consumption], powerGenerationSource: BatteryPack, modes: list, timeStep: float = ONE_SECOND, maxSocChangePerStep: float = DEFAULT_MAX_SOC_CHANGE_PER_STEP, logType = None):
         """ Simulates the power consumption and generation of a system over a given time period.
 
         Args:
             powerDrawSources (Consumption): A list of submodules to simulate.
             powerGenerationSource (BatteryPack): The battery pack to simulate.
             modes (list): Power modes to simulate even indexes are Dictionaries and old modes are Intergers
+            timeStep (float, optional): Length of one simulation step in seconds, or ADAPTIVE_TIME_STEP. Defaults to ONE_SECOND.
+            maxSocChangePerStep (float, optional): Largest state of charge change (in %) allowed per adaptive step. Defaults to DEFAULT_MAX_SOC_CHANGE_PER_STEP.
+            logType (optional): np.float32 or np.float64 to also record every channel in a SimulationLog, or PIECEWISE_LINEAR_LOG. Defaults to None (state of charge list only).
 
-        Returns:
-            float: The total energy consumed by the submodule in Watt-hours (Wh).
+        Raises:
+            ValueError: If the time step or maxSocChangePerStep is negative, or a piecewise linear log is combined with adaptive time steps.
         """
+        if timeStep < 0:
+            raise ValueError("Simulation time step must be positive, or Simulation.ADAPTIVE_TIME_STEP.")
+
+        if maxSocChangePerStep <= 0:
+            raise ValueError("Largest state of charge change per adaptive step must be positive.")
+
+        if logType == Simulation.PIECEWISE_LINEAR_LOG and timeStep == Simulation.ADAPTIVE_TIME_STEP:
+            raise ValueError("A piecewise linear log needs a fixed time step.")
+
         self.consumers = powerDrawSources
         self.generator = powerGenerationSource
         self.powermodes = modes
+        self.timeStep = timeStep
+        self.maxSocChangePerStep = maxSocChangePerStep
+        self.minAdaptiveTimeStep = MIN_TIME_STEP    # Units are seconds, shortest adaptive step, lower it below one second to follow fast transients
+        self.logType = logType
+        self.pulsePeriod = None                     # Units are seconds, set to model duty cycles as PWM pulses instead of averaged
         self.experimentDuration = self.calculate_duration(modes)
-        self.batteryPackPercentageLog = [BatteryCell.MAX_STATE_OF_CHARGE] * self.experimentDuration
+        self.allocate_logs(BatteryCell.MAX_STATE_OF_CHARGE)
 
 
     def initialize_data(self, voltageInput: float):
@@ -41,7 +87,128 @@ class Simulation:
         Args:
             voltageInput (float): Initial voltage from GUI (and thus state of charge) to start the simulation.
         """
-        self.batteryPackPercentageLog = [self.generator.cells.state_of_charge_from_voltage(voltageInput)] * self.experimentDuration
+        self.allocate_logs(self.generator.cells.state_of_charge_from_voltage(voltageInput))
+
+
+    def allocate_logs(self, stateOfCharge: float):
+        """ Preallocate the time log, the battery charge state log and (if self.logType is set) the multi-channel SimulationLog
+
+            With a SimulationLog, batteryPackPercentageLog is a zero-copy view of its state of charge channel.
+            With a piecewise linear log, neither the time log nor the battery charge state log store one value per time step.
+
+        Args:
+            stateOfCharge (float): State of charge (in %) to fill the battery charge state log with
+        """
+        # Checkpoints of the last Simulation.run_incremental(), which only apply to the logs allocated here
+        self.checkpoints = []
+        self.checkpointSettings = None
+        self.checkpointFingerprints = []
+
+        if self.logType == Simulation.PIECEWISE_LINEAR_LOG:
+            self.log = None
+            self.timeLog = self.step_times()
+            self.batteryPackPercentageLog = PiecewiseLinearLog.from_events([0.0], [stateOfCharge], self.timeLog, stateOfCharge, len(self.timeLog), stateOfCharge)
+            return
+
+        self.timeLog = self.calculate_time_log()
+
+        if self.logType is None:
+            self.log = None
+            self.batteryPackPercentageLog = [stateOfCharge] * len(self.timeLog)
+        else:
+            self.log = SimulationLog(len(self.timeLog), self.logType, self.generator.cells.equivalentCircuit is not None)
+            self.log.stateOfCharge[:] = stateOfCharge
+            self.batteryPackPercentageLog = self.log.stateOfCharge
+
+
+    def step_count(self, timeToRun: float) -> tuple:
+        """ Count the simulation steps of self.timeStep seconds needed for part of a powermode, with a shorter last step if needed
+
+            Keeps every powermode boundary exactly on a simulation step boundary.
+
+        Args:
+            timeToRun (float): Time in seconds to split into steps
+
+        Returns:
+            int: Number of steps
+            float: Length in seconds of the last step
+        """
+        if timeToRun <= 0:
+            return 0, 0
+
+        ratio = timeToRun / self.timeStep
+        fullSteps = round(ratio) if math.isclose(ratio, round(ratio)) else math.floor(ratio)
+
+        if not math.isclose(ratio, fullSteps):
+            return fullSteps + 1, timeToRun - fullSteps * self.timeStep
+
+        return fullSteps, self.timeStep
+
+
+    def step_lengths(self, timeToRun: float) -> list:
+        """ Split part of a powermode into simulation steps, see Simulation.step_count()
+
+        Args:
+            timeToRun (float): Time in seconds to split into steps
+
+        Returns:
+            list: Length in seconds of each step
+        """
+        stepCount, lastStepLength = self.step_count(timeToRun)
+        if stepCount == 0:
+            return []
+
+        return [self.timeStep] * (stepCount - 1) + [lastStepLength]
+
+
+    def calculate_time_log(self) -> list:
+        """ Calculate the time (in seconds) of every batteryPackPercentageLog entry of a full length run
+
+            For a one second time step this is simply [0, 1, 2, ..., experimentDuration - 1]. Adaptive runs build their time log while running.
+
+        Returns:
+            list: Time of each log entry in seconds
+        """
+        timeLog = [0]
+        if self.timeStep == Simulation.ADAPTIVE_TIME_STEP:
+            return timeLog
+
+        totalElaspedTime = self.timeStep
+        segmentStart = 0
+        for i in range(0, len(self.powermodes), 2):
+            timeToRun = min(self.powermodes[i+1], self.experimentDuration - totalElaspedTime)
+            stepLengths = self.step_lengths(timeToRun)
+            timeLog += [segmentStart + min((k + 1) * self.timeStep, timeToRun) for k in range(len(stepLengths))]
+
+            segmentStart += max(timeToRun, 0)
+            totalElaspedTime += timeToRun
+
+        return timeLog
+
+
+    def step_times(self) -> StepTimes:
+        """ Same times as Simulation.calculate_time_log(), stored as one entry per powermode instead of one per time step
+
+        Returns:
+            StepTimes: Time of each log entry in seconds
+        """
+        startIndexes, startTimes, timesToRun = [], [], []
+        logIndex = 1
+        totalElaspedTime = self.timeStep
+        segmentStart = 0
+        for i in range(0, len(self.powermodes), 2):
+            timeToRun = min(self.powermodes[i+1], self.experimentDuration - totalElaspedTime)
+            stepCount, _ = self.step_count(timeToRun)
+            if stepCount > 0:
+                startIndexes.append(logIndex)
+                startTimes.append(segmentStart)
+                timesToRun.append(timeToRun)
+                logIndex += stepCount
+
+            segmentStart += max(timeToRun, 0)
+            totalElaspedTime += timeToRun
+
+        return StepTimes(self.timeStep, startIndexes, startTimes, timesToRun, logIndex)
 
 
     def calculate_duration(self, modes: list) -> int:
@@ -60,6 +227,42 @@ class Simulation:
         return totalDuration
 
 
+    def compile_schedule(self, voltageRegulatorEfficiency: int = None) -> np.ndarray:
+        """ Compile the powermodes into a NumPy structured array, one row per powermode (see PowermodeSchedule.py)
+
+        Args:
+            voltageRegulatorEfficiency (int, optional): If given, also check every powermode against the battery pack limits up front. Defaults to None.
+
+        Returns:
+            np.ndarray: Start, duration, recharge target, total current, total power and energy per second of every powermode
+
+        Raises:
+            ValueError: If the powermodes are malformed, or exceed the battery pack limits
+        """
+        schedule = compile_schedule(self.consumers, self.powermodes)
+        if voltageRegulatorEfficiency is not None:
+            validate_schedule(schedule, self.generator, voltageRegulatorEfficiency)
+
+        return schedule
+
+
+    def charge_trajectory(self) -> ChargeTrajectory:
+        """ State of charge over the whole powermodes, worked out in closed form from the battery cell's current state (see ChargeTrajectory.py)
+
+            Answers "state of charge at time T" and "time until X% state of charge" in O(log n) each, without a Simulation.run().
+
+        Returns:
+            ChargeTrajectory: The state of charge trajectory
+
+        Raises:
+            ValueError: If the powermodes are malformed, a recharge segment can't be done, or duty cycles are pulsed
+        """
+        if self.pulsePeriod is not None:
+            raise ValueError("A charge trajectory needs a constant load in every powermode, not pulsed duty cycles.")
+
+        return ChargeTrajectory.from_schedule(self.compile_schedule(), self.generator)
+
+
     def valid_dc_dc_voltage_regulator_efficiency(self, efficiencyInput: int) -> bool:
         """ Validate the efficiency of a DC to DC voltage regulator between battery pack and all submodules
 
@@ -81,52 +284,131 @@ class Simulation:
         return isValid
 
 
-    def run(self, runTimeInSeconds: int, voltageRegulatorEfficiency: int) -> list:
+    def _require_dense_fixed_step(self, feature: str, engine: str) -> None:
+        """ Check that a run can model a feature only the LOOP_ENGINE and VECTORIZED_ENGINE support
+
+        Args:
+            feature (str): Name of the feature, which starts the error message
+            engine (str): Simulation engine the run uses, defined as a CONSTANT in Simulation.py
+
+        Raises:
+            ValueError: If the log is piecewise linear, the time step is adaptive or the engine is the EVENT_ENGINE
+        """
+        if self.logType == Simulation.PIECEWISE_LINEAR_LOG or self.timeStep == Simulation.ADAPTIVE_TIME_STEP or engine == Simulation.EVENT_ENGINE:
+            raise ValueError(f"{feature} needs the LOOP_ENGINE or VECTORIZED_ENGINE, a fixed time step and a dense log.")
+
+
+    def run(self, runTimeInSeconds: int, voltageRegulatorEfficiency: int, engine: str = LOOP_ENGINE) -> list:
         """ Runs the simulation and collects data on battery charge state
 
         Args:
             runTimeInSeconds (int): The duration in seconds for which the simulation is run.
             voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator (see Simulation.valid_dc_dc_voltage_regulator_efficiency() for valid values)
+            engine (str, optional): Simulation engine to use, defined as a CONSTANT in Simulation.py. Defaults to LOOP_ENGINE.
 
         Returns:
             list: Battery charge state data calculated during a simulation run.
+
+        Raises:
+            ValueError: If the engine is unknown, or the battery pack can't supply or accept the requested power.
         """
+        circuit = self.generator.cells.equivalentCircuit
+        if circuit is not None:
+            self._require_dense_fixed_step("A battery cell with an equivalent circuit", engine)
+
+        charger = self.generator.charger
+        if charger is not None:
+            self._require_dense_fixed_step("A battery pack with a charger", engine)
+
+        if any(isinstance(consumer, TraceConsumption) for consumer in self.consumers):
+            self._require_dense_fixed_step("A TraceConsumption", engine)
+
+        if self.pulsePeriod is not None:
+            self._require_dense_fixed_step("Pulsed duty cycles", engine)
+
+        if self.pulsePeriod is not None and self.pulsePeriod <= 0:
+            raise ValueError("Pulse period must be positive.")
+
+        if self.logType == Simulation.PIECEWISE_LINEAR_LOG:
+            # Only the event driven solver produces straight line pieces directly
+            return run_piecewise_linear(self, runTimeInSeconds, voltageRegulatorEfficiency)
+
+        if self.timeStep == Simulation.ADAPTIVE_TIME_STEP:
+            # Adaptive runs choose their own step sizes, so every engine gives the same result
+            return run_adaptive(self, runTimeInSeconds, voltageRegulatorEfficiency)
+
+        if engine == Simulation.VECTORIZED_ENGINE:
+            return run_vectorized(self, runTimeInSeconds, voltageRegulatorEfficiency)
+        elif engine == Simulation.EVENT_ENGINE:
+            return run_event_driven(self, runTimeInSeconds, voltageRegulatorEfficiency)
+        elif engine != Simulation.LOOP_ENGINE:
+            raise ValueError(f"{engine} is an unsupported simulation engine. Use 'Simulation.LOOP_ENGINE', 'Simulation.VECTORIZED_ENGINE' or 'Simulation.EVENT_ENGINE'.")
+
         if self.experimentDuration < runTimeInSeconds:
             raise ValueError(f"Requested simulation time of {runTimeInSeconds}, is more than time defined in the powermodes variable.")
 
         # Set 1st data point of graph based on GUI text box voltage input to log State of Charge before sim starts
         self.batteryPackPercentageLog[0] = int(self.generator.cells.stateOfCharge)
+        if self.log is not None:
+            self.log.record(0, int(self.generator.cells.stateOfCharge), self.generator.cells.currentVoltage, self.generator.current_volts_amps_power, 0, SimulationLog.NO_MODE)
+
         timeIndex = 1
-        totalElaspedTime = 1
+        totalElaspedTime = self.timeStep
+        schedule = compile_schedule(self.consumers, self.powermodes)
+        variableLoad = has_traces(schedule) or self.pulsePeriod is not None
+        cellsInPack = self.generator.seriesCount * self.generator.parallelCount
 
         # Every even index in the powermodes list data structure defines a time length in seconds or recharge percentage
         for i in range(0, len(self.powermodes), 2):
+            segment = schedule[i // 2]
             timeDuration = self.powermodes[i+1]
+            isRecharge = bool(segment["isRecharge"])
+            totalPowerDraw = 0 if isRecharge else float(segment["totalPower"])
+            energyPerCell = 0 if isRecharge else float(segment["energyPerSecond"]) / cellsInPack
 
             # Allow "For Loop" to exit early, if "runTimeInSecond"s is reached, before "timeDuration" defined in a powermodes ends.
             # Causes the simulation to stop based on higher priority GUI time input, instead of powermode durations.
-            timeStepsToRun = min(timeDuration, runTimeInSeconds - totalElaspedTime)
+            timeToRun = min(timeDuration, runTimeInSeconds - totalElaspedTime)
             rechargeStep = 0
+            circuitAmpere = 0.0
+            irLoss = 0.0
             fastestAllowedRechargeTime= int(((self.generator.cells.totalEnergyCapacity - self.generator.cells.currentEnergy) / (self.generator.cells.maxPower)) * 3600) / self.generator.parallelCount
+            stepLengths = self.step_lengths(timeToRun)
+            stepLoad = None
 
-            for t in range(timeStepsToRun):
+            for t, stepLength in enumerate(stepLengths):
                 #print(f"Time: {timeStepsToRun}")
-                # Reset variables for next iteration of all power consumers
-                totalCurrentDraw = 0
-                energyUsed = 0
-
                 # Determine if "powermodes" data structure defines a charging or power consuming cycle
-                if "RECHARGE" in self.powermodes[i]:
+                if isRecharge:
                     requestedRechargeTime = self.powermodes[i+1]
-                    print(f"Requested Time: {requestedRechargeTime}")
                     #print(f"Min Time: {minTimeToRecharge} &&  Requested Time: {requestedRechargeTime}")
 
                     if t == 0:
-                        rechargeStep = (self.powermodes[i]["RECHARGE"] - self.generator.cells.state_of_charge()) / timeStepsToRun
-                        print(f"Recharge Step: {rechargeStep}")
-
-                    if fastestAllowedRechargeTime <= requestedRechargeTime:
-                        self.generator.cells.recharge(rechargeStep + self.generator.cells.stateOfCharge)
+                        # State of charge gained per second
+                        rechargeStep = (float(segment["rechargeTarget"]) - self.generator.cells.state_of_charge()) / timeToRun
+
+                        # Charging current into every cell (negative), the charger supplies the IR losses on top
+                        circuitAmpere = -charging_ampere(self.generator.cells, rechargeStep)
+
+                        if charger is not None:
+                            chargeProfile = charger.profile(self.generator, self.generator.cells.stateOfCharge, float(segment["rechargeTarget"]))
+                            chargeTime = 0.0
+
+                    if charger is not None:
+                        if chargeProfile.duration > requestedRechargeTime:
+                            raise ValueError(f"Requested recharge time of {requestedRechargeTime} seconds is too fast! The charger needs {math.ceil(chargeProfile.duration)} seconds.")
+
+                        # The charge follows the charger's closed form curve, as fast as it allows, then holds at the target
+                        chargeTime += stepLength
+                        previousStateOfCharge = self.generator.cells.stateOfCharge
+                        charger.charge_cell(self.generator.cells, float(chargeProfile.state_of_charge_at(chargeTime)))
+                        if circuit is not None:
+                            circuitAmpere = -charging_ampere(self.generator.cells, (self.generator.cells.stateOfCharge - previousStateOfCharge) / stepLength)
+                            _, irLoss = circuit.step(circuitAmpere, stepLength)
+                    elif fastestAllowedRechargeTime <= requestedRechargeTime:
+                        self.generator.cells.recharge(rechargeStep * stepLength + self.generator.cells.stateOfCharge)
+                        if circuit is not None:
+                            _, irLoss = circuit.step(circuitAmpere, stepLength)
                         #if timeIndex % 25 == 0 or timeIndex % 50 == 0:
                         #    print(f"Charging from {self.generator.cells.stateOfCharge} to {self.powermodes[i]['RECHARGE']} at time = {timeIndex}")
                         # TODO: SoC(t) = SoC{max} - (SoC{max} - SoC{0}) e^(-t/tau)
@@ -136,34 +418,186 @@ class Simulation:
                         raise ValueError(f"Requested recharge time of {requestedRechargeTime} seconds is too fast!")
 
                 else:
-                    totalPowerDraw = 0
-
-                    for consumer in self.consumers:
-                        consumer.turn_on(self.powermodes[i][consumer])
-                        totalCurrentDraw += consumer.current
-                        totalPowerDraw += consumer.power
-                        energyUsed += consumer.real_time_energy(Simulation.ONE_SECOND)
-
-                    effectivePowerOutput = self.generator.maxPackPower * (voltageRegulatorEfficiency / 100)
-                    if totalPowerDraw > effectivePowerOutput:
-                        raise ValueError(f"Warning: Total power draw of {totalPowerDraw} Watts, exceeds battery pack capacity of {effectivePowerOutput} Watts")
+                    if t == 0 and self.pulsePeriod is None:
+                        # The load is constant within a segment, so consumers and limits only need updating once
+                        apply_draw_modes(self.consumers, segment)
+
+                        effectivePowerOutput = self.generator.maxPackPower * (voltageRegulatorEfficiency / 100)
+                        if totalPowerDraw > effectivePowerOutput:
+                            raise ValueError(f"Warning: Total power draw of {format_watts(totalPowerDraw)} Watts, exceeds battery pack capacity of {effectivePowerOutput} Watts")
+
+                        #print(f"Update Ampere Draw: {totalCurrentDraw / self.generator.parallelCount}")
+                        self.generator.cells.update_ampere(float(segment["totalCurrent"]) / self.generator.parallelCount)
+                        circuitAmpere = self.generator.cells.currentAmpere
+
+                    # Recorded traces and pulsed duty cycles change the load every step, every step is checked before the segment runs
+                    if t == 0 and variableLoad:
+                        stepLoad = segment_step_load(self, segment, np.array(stepLengths, dtype=np.float64), 0.0, voltageRegulatorEfficiency)
+
+                    stepEnergy = energyPerCell * stepLength
+                    rippleLoss = 0.0
+                    if stepLoad is not None:
+                        self.generator.cells.update_ampere(float(stepLoad[0][t]))
+                        circuitAmpere = float(stepLoad[4][t])
+                        totalPowerDraw = float(stepLoad[1][t])
+                        stepEnergy = float(stepLoad[2][t])
+                        if circuit is not None and stepLoad[3] is not None:
+                            # Pulses heat the series resistance by their mean squared current, not their mean current squared
+                            rippleLoss = circuit.seriesResistance * float(stepLoad[3][t]) * stepLength / 3600
 
-                    #print(f"Update Ampere Draw: {totalCurrentDraw / self.generator.parallelCount}")
-                    self.generator.cells.update_ampere(totalCurrentDraw / self.generator.parallelCount)
                     #print(f"Energy Used Per Cell: {energyUsed / (self.generator.seriesCount * self.generator.parallelCount)}")
-                    self.generator.cells.consume_energy(energyUsed / (self.generator.seriesCount * self.generator.parallelCount))
+                    if circuit is None:
+                        self.generator.cells.consume_energy(stepEnergy)
+                    else:
+                        # The cell also supplies the energy lost across its own internal resistance
+                        drawn, irLoss = circuit.step(circuitAmpere, stepLength)
+                        drawn += rippleLoss
+                        irLoss += rippleLoss
+                        self.generator.cells.consume_energy(stepEnergy + drawn)
 
                 self.batteryPackPercentageLog[timeIndex] = self.generator.cells.state_of_charge()
+                if self.log is not None:
+                    terminalVoltsLoss = None
+                    if circuit is not None:
+                        terminalVoltsLoss = (self.generator.seriesCount * circuit.terminal_voltage(self.generator.cells.currentVoltage, circuitAmpere),
+                                             irLoss * 3600 / stepLength * cellsInPack)
+                    self.log.record(timeIndex, self.batteryPackPercentageLog[timeIndex], self.generator.cells.currentVoltage, self.generator.current_volts_amps_power, totalPowerDraw, i // 2, terminalVoltsLoss)
                 #print(f"Battery Pack Percentage: {self.batteryPackPercentageLog[timeIndex]}")
                 timeIndex += 1
 
-            totalElaspedTime += timeStepsToRun
+            totalElaspedTime += timeToRun
             if totalElaspedTime > runTimeInSeconds:
                 break
 
         return self.batteryPackPercentageLog
 
 
+    def segment_fingerprints(self, runTimeInSeconds: int) -> list:
+        """ Describe every powermode by everything that affects its result, to find which powermodes changed between runs
+
+        Args:
+            runTimeInSeconds (int): The duration in seconds for which the simulation is run.
+
+        Returns:
+            list: One hashable fingerprint per powermode
+        """
+        fingerprints = []
+        totalElaspedTime = self.timeStep
+        for i in range(0, len(self.powermodes), 2):
+            timeToRun = min(self.powermodes[i+1], runTimeInSeconds - totalElaspedTime)
+            if BatteryCell.RECHARGE in self.powermodes[i]:
+                mode = (BatteryCell.RECHARGE, self.powermodes[i][BatteryCell.RECHARGE])
+            else:
+                mode = tuple((self.powermodes[i].get(consumer), consumer.fingerprint()) if isinstance(consumer, TraceConsumption) else
+                             (self.powermodes[i].get(consumer), consumer.voltage, consumer.minCurrent, consumer.averageCurrent, consumer.maxCurrent, consumer.dutyCycle, consumer.pulsePhase)
+                             for consumer in self.consumers)
+
+            fingerprints.append((mode, self.powermodes[i+1], timeToRun))
+            totalElaspedTime += timeToRun
+
+        return fingerprints
+
+
+    def run_incremental(self, runTimeInSeconds: int, voltageRegulatorEfficiency: int, progress = None) -> list:
+        """ Runs the simulation again after powermodes changed, restarting from the checkpoint before the first changed powermode
+
+            Every run starts from the same battery cell state (the state before the first run_incremental() call), instead of
+            wherever the previous run left the cell. Powermodes before the first change are not recomputed, so editing the end
+            of a long schedule is near instant. Results are identical to a full VECTORIZED_ENGINE run, except that with an
+            EquivalentCircuit and a progress callback they only match to floating point rounding.
+
+        Args:
+            runTimeInSeconds (int): The duration in seconds for which the simulation is run.
+            voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+            progress (callable, optional): Called as progress(timeIndex) at least every PROGRESS_INTERVAL time steps, see run_vectorized(). Defaults to None.
+
+        Returns:
+            list: Battery charge state data calculated during a simulation run.
+
+        Raises:
+            ValueError: If the time step is adaptive or the log is piecewise linear, or the battery pack can't supply or accept the requested power.
+        """
+        if self.timeStep == Simulation.ADAPTIVE_TIME_STEP or self.logType == Simulation.PIECEWISE_LINEAR_LOG:
+            raise ValueError("Simulation.run_incremental() needs a fixed time step and a dense log.")
+
+        fingerprints = self.segment_fingerprints(runTimeInSeconds)
+        settings = (self.generator, voltageRegulatorEfficiency, self.timeStep, self.logType, self.pulsePeriod, tuple(self.consumers))
+
+        if len(self.checkpoints) == 0 or self.checkpointSettings != settings:
+            # Anything but a powermode change invalidates every checkpoint, except the starting state of the same battery pack
+            sameGenerator = len(self.checkpoints) > 0 and self.checkpointSettings[0] is self.generator
+            self.checkpoints = self.checkpoints[:1] if sameGenerator else []
+            unchangedSegments = 0
+        else:
+            unchangedSegments = 0
+            while unchangedSegments < min(len(fingerprints), len(self.checkpointFingerprints)) and fingerprints[unchangedSegments] == self.checkpointFingerprints[unchangedSegments]:
+                unchangedSegments += 1
+
+            if fingerprints == self.checkpointFingerprints and self.checkpoints[-1].segmentIndex == len(self.powermodes):
+                self.checkpoints[-1].restore(self)
+                return self.batteryPackPercentageLog
+
+        # Latest checkpoint before the first changed powermode, if it is not the very start
+        self.checkpoints = [checkpoint for checkpoint in self.checkpoints if checkpoint.segmentIndex <= 2 * unchangedSegments]
+        start = self.checkpoints[-1] if self.checkpoints else None
+        if start is not None and start.segmentIndex == 0:
+            start.restore(self)
+            start = None
+
+        # Durations changed, so log entries after the checkpoint move, but the ones before it stay valid
+        if [f[1:] for f in fingerprints] != [f[1:] for f in self.checkpointFingerprints]:
+            self.experimentDuration = sum(self.powermodes[i+1] for i in range(0, len(self.powermodes), 2))
+            self.resize_logs(start.timeIndex if start is not None else 0)
+
+        self.checkpointSettings = settings
+        self.checkpointFingerprints = fingerprints
+
+        return run_vectorized(self, runTimeInSeconds, voltageRegulatorEfficiency, start, self.checkpoints, progress)
+
+
+    def resize_logs(self, keepCount: int):
+        """ Reallocate the logs for the current powermodes, keeping their first entries
+
+        Args:
+            keepCount (int): Number of log entries to keep
+        """
+        self.timeLog = self.calculate_time_log()
+        fillCount = len(self.timeLog) - keepCount
+
+        if self.log is None:
+            self.batteryPackPercentageLog = self.batteryPackPercentageLog[:keepCount] + [BatteryCell.MAX_STATE_OF_CHARGE] * fillCount
+        else:
+            oldLog = self.log
+            self.log = SimulationLog(len(self.timeLog), oldLog.data.dtype, oldLog.equivalentCircuit)
+            self.log.data[:, :keepCount] = oldLog.data[:, :keepCount]
+            self.log.modeIndex[:keepCount] = oldLog.modeIndex[:keepCount]
+            self.log.stateOfCharge[keepCount:] = BatteryCell.MAX_STATE_OF_CHARGE
+            self.batteryPackPercentageLog = self.log.stateOfCharge
+
+
+    def iter_run(self, runTimeInSeconds: int, voltageRegulatorEfficiency: int, chunkSize: int = DEFAULT_CHUNK_SIZE):
+        """ Runs the simulation as a generator, yielding time, state of charge, pack voltage, current and power as they are computed
+
+            Only one chunk is held in memory at a time and batteryPackPercentageLog is left untouched, so year long runs can be
+            piped straight into a file writer, a reducer or the plot. Use chunkSize=1 to receive one sample at a time.
+
+        Args:
+            runTimeInSeconds (int): The duration in seconds for which the simulation is run.
+            voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+            chunkSize (int, optional): Number of time steps per chunk. Defaults to DEFAULT_CHUNK_SIZE.
+
+        Yields:
+            SimulationChunk: The next chunkSize time steps, the first one being the state before the simulation starts
+
+        Raises:
+            ValueError: If the time step is adaptive, or the battery pack can't supply or accept the requested power.
+        """
+        if self.timeStep == Simulation.ADAPTIVE_TIME_STEP:
+            raise ValueError("Simulation.iter_run() needs a fixed time step, use Simulation.run() for adaptive time steps.")
+
+        yield from iter_vectorized(self, runTimeInSeconds, voltageRegulatorEfficiency, chunkSize)
+
+
     def print_all_sim_objects(self, adjective: str):
         """ Prints all sub-objects instances within a Simulation.py object with their respective classes names.
 
@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+
+# External libraries
+import numpy as np
+
+
+class SimulationLog:
+
+    # Row of every channel in SimulationLog.data
+    STATE_OF_CHARGE = 0     # Units are percentage
+    CELL_VOLTAGE = 1        # Units are Volts (single cell)
+    PACK_VOLTAGE = 2        # Units are Volts
+    PACK_CURRENT = 3        # Units are Amps
+    PACK_POWER = 4          # Units are Watts
+    LOAD = 5                # Units are Watts, total power draw of all consumers
+    CHANNELS = ("stateOfCharge", "cellVoltage", "packVoltage", "packCurrent", "packPower", "load")
+
+    # Extra rows, only allocated when the battery cell has an EquivalentCircuit
+    TERMINAL_VOLTAGE = 6    # Units are Volts, battery pack voltage at its terminals (under load)
+    IR_LOSS = 7             # Units are Watts, heat given off by the internal resistance of every cell in the pack
+    CIRCUIT_CHANNELS = ("terminalVoltage", "irLoss")
+
+    # Value of modeIndex before the simulation starts, and for time steps never reached
+    NO_MODE = -1
+
+    def __init__(self, length: int, dtype = np.float32, equivalentCircuit: bool = False):
+        """ Columnar log of every simulation channel, preallocated as one (channel x time step) NumPy array
+
+            Every channel is a contiguous row of self.data, so the channel attributes are zero-copy views and the
+            whole log can be handed to other libraries through the buffer protocol. Time steps never reached are NaN.
+
+        Args:
+            length (int): Number of time steps to log, usually len(Simulation.timeLog)
+            dtype (optional): np.float32 or np.float64. Defaults to np.float32 (26 bytes per time step for all channels).
+            equivalentCircuit (bool, optional): Also allocate the CIRCUIT_CHANNELS. Defaults to False.
+
+        Raises:
+            ValueError: If the dtype isn't a supported floating point type
+        """
+        if np.dtype(dtype) not in (np.dtype(np.float32), np.dtype(np.float64)):
+            raise ValueError(f"{dtype} is an unsupported log type. Use np.float32 or np.float64.")
+
+        self.equivalentCircuit = equivalentCircuit
+        channelCount = len(SimulationLog.CHANNELS) + (len(SimulationLog.CIRCUIT_CHANNELS) if equivalentCircuit else 0)
+        self.data = np.full((channelCount, length), np.nan, dtype=dtype)
+        self.modeIndex = np.full(length, SimulationLog.NO_MODE, dtype=np.int16)    # Index of the active powermode, 0 for powermodes[0:2]
+
+
+    def __len__(self):
+        return self.data.shape[1]
+
+
+    @property
+    def stateOfCharge(self) -> np.ndarray:
+        """ Zero-copy view: Cell state of charge (in %) at every time step """
+        return self.data[SimulationLog.STATE_OF_CHARGE]
+
+
+    @property
+    def cellVoltage(self) -> np.ndarray:
+        """ Zero-copy view: Cell voltage (in Volts) at every time step """
+        return self.data[SimulationLog.CELL_VOLTAGE]
+
+
+    @property
+    def packVoltage(self) -> np.ndarray:
+        """ Zero-copy view: Battery pack voltage (in Volts) at every time step """
+        return self.data[SimulationLog.PACK_VOLTAGE]
+
+
+    @property
+    def packCurrent(self) -> np.ndarray:
+        """ Zero-copy view: Battery pack current (in Amps) at every time step """
+        return self.data[SimulationLog.PACK_CURRENT]
+
+
+    @property
+    def packPower(self) -> np.ndarray:
+        """ Zero-copy view: Battery pack power (in Watts) at every time step """
+        return self.data[SimulationLog.PACK_POWER]
+
+
+    @property
+    def load(self) -> np.ndarray:
+        """ Zero-copy view: Total power draw (in Watts) of all consumers at every time step """
+        return self.data[SimulationLog.LOAD]
+
+
+    @property
+    def terminalVoltage(self) -> np.ndarray:
+        """ Zero-copy view: Battery pack terminal voltage (in Volts) at every time step, the same as packVoltage without an EquivalentCircuit """
+        return self.data[SimulationLog.TERMINAL_VOLTAGE] if self.equivalentCircuit else self.packVoltage
+
+
+    @property
+    def irLoss(self) -> np.ndarray:
+        """ Zero-copy view: Power (in Watts) lost in the internal resistance of the battery pack at every time step (new zeros without an EquivalentCircuit) """
+        return self.data[SimulationLog.IR_LOSS] if self.equivalentCircuit else np.zeros(len(self), dtype=self.data.dtype)
+
+
+    def __array__(self, dtype = None, copy = None) -> np.ndarray:
+        return self.data if dtype is None else self.data.astype(dtype)
+
+
+    def __buffer__(self, flags: int) -> memoryview:
+        return memoryview(self.data)
+
+
+    def to_buffer(self) -> memoryview:
+        """ Export the (channel x time step) array through the buffer protocol, without copying
+
+        Returns:
+            memoryview: C contiguous view of self.data
+        """
+        return memoryview(self.data)
+
+
+    @property
+    def bytes_per_sample(self) -> int:
+        """ Memory used by one time step of every channel, in bytes
+
+        Returns:
+            int: Bytes per time step
+        """
+        return self.data.itemsize * self.data.shape[0] + self.modeIndex.itemsize
+
+
+    def record(self, index: int, stateOfCharge: float, cellVoltage: float, packVoltsAmpsPower: tuple, load: float, modeIndex: int, terminalVoltsLoss: tuple = None) -> None:
+        """ Log every channel of one time step
+
+        Args:
+            index (int): Time step to write
+            stateOfCharge (float): Cell state of charge (in %)
+            cellVoltage (float): Cell voltage (in Volts)
+            packVoltsAmpsPower (tuple): Battery pack voltage, current and power, see BatteryPack.current_volts_amps_power
+            load (float): Total power draw of all consumers (in Watts)
+            modeIndex (int): Index of the active powermode
+            terminalVoltsLoss (tuple, optional): Battery pack terminal voltage and IR loss. Defaults to None (the pack voltage and no loss).
+        """
+        if self.equivalentCircuit:
+            terminalVoltsLoss = terminalVoltsLoss if terminalVoltsLoss is not None else (packVoltsAmpsPower[0], 0.0)
+            self.data[:, index] = (stateOfCharge, cellVoltage, *packVoltsAmpsPower, load, *terminalVoltsLoss)
+        else:
+            self.data[:, index] = (stateOfCharge, cellVoltage, *packVoltsAmpsPower, load)
+        self.modeIndex[index] = modeIndex
+
+
+    def record_block(self, start: int, stateOfCharge: np.ndarray, cellVoltage: np.ndarray, seriesCount: int, parallelCount: int, cellAmpere: float, load: float, modeIndex: int,
+                     terminalVoltage: np.ndarray = None, irLoss: np.ndarray = None) -> None:
+        """ Log a block of time steps, working out the battery pack channels like BatteryPack.current_volts_amps_power
+
+        Args:
+            start (int): First time step to write
+            stateOfCharge (np.ndarray): Cell state of charge (in %) at every time step
+            cellVoltage (np.ndarray): Cell voltage (in Volts) at every time step
+            seriesCount (int): Number of cells in series
+            parallelCount (int): Number of cells in parallel
+            cellAmpere (float or np.ndarray): Current (in Amps) drawn from every cell, at every time step if it varies
+            load (float or np.ndarray): Total power draw of all consumers (in Watts), at every time step if it varies
+            modeIndex (int): Index of the active powermode
+            terminalVoltage (np.ndarray, optional): Cell terminal voltage (in Volts) at every time step. Defaults to None (the cell voltage).
+            irLoss (np.ndarray, optional): Power (in Watts) lost in the internal resistance of the pack at every time step. Defaults to None (no loss).
+        """
+        stop = start + len(stateOfCharge)
+        packVoltage = seriesCount * np.asarray(cellVoltage, dtype=np.float64)
+        packCurrent = parallelCount * cellAmpere
+
+        self.data[SimulationLog.STATE_OF_CHARGE, start:stop] = stateOfCharge
+        self.data[SimulationLog.CELL_VOLTAGE, start:stop] = cellVoltage
+        self.data[SimulationLog.PACK_VOLTAGE, start:stop] = packVoltage
+        self.data[SimulationLog.PACK_CURRENT, start:stop] = packCurrent
+        self.data[SimulationLog.PACK_POWER, start:stop] = packVoltage * packCurrent
+        self.data[SimulationLog.LOAD, start:stop] = load
+        self.modeIndex[start:stop] = modeIndex
+
+        if self.equivalentCircuit:
+            self.data[SimulationLog.TERMINAL_VOLTAGE, start:stop] = packVoltage if terminalVoltage is None else seriesCount * np.asarray(terminalVoltage, dtype=np.float64)
+            self.data[SimulationLog.IR_LOSS, start:stop] = 0.0 if irLoss is None else irLoss
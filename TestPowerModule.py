@@ -1,9 +1,69 @@
 #!/usr/bin/python3#
 
+# Standard libraries
+import os
+import sys
+import tempfile
+
+# External libraries
+import numpy as np
+
 # Internal libraries under test
+from Simulation import Simulation
+from ParameterSweep import ParameterSweep, SweepConfiguration
+from ParallelSweep import ParallelSweep
+from MonteCarlo import MonteCarlo, Distribution
+from SimulationLog import SimulationLog
+from PiecewiseLinearLog import PiecewiseLinearLog
+from ResultCache import ResultCache
+from LifetimeStudy import LifetimeStudy
+from PackOptimizer import PackOptimizer
+from BackgroundRun import BackgroundRunner, RunCancelled
+from PowermodeSchedule import compile_schedule, pulse_loads
+from Downsample import downsample, MIN_MAX, LTTB
 from Power.Consumption import Consumption
 from Power.BatteryPack import BatteryPack
 from Power.BatteryCell import BatteryCell
+from Power.CellArrayPack import CellArrayPack
+from Power.ChemistryRegistry import ChemistryRegistry
+from Power.EquivalentCircuit import EquivalentCircuit
+from Power.CellAging import RainflowCounter, CellAging
+from Power.Charger import CCCVCharger
+from Power.ConsumerBank import ConsumerBank
+from Power.TraceConsumption import TraceConsumption
+
+
+def build_simulation(recharge: float = 99.0, timeStep: float = Simulation.ONE_SECOND, logType = None, equivalentCircuit: EquivalentCircuit = None) -> Simulation:
+    """ Build a fresh two consumer simulation with a discharge, idle, and recharge power mode """
+    motor = Consumption("Motor", 4, 0, 2, 3.125, 50)
+    cpu = Consumption("CPU", 2, 0, 2, 3.125, 100)
+    powerModes = [{motor: Consumption.MAX_POWER_DRAW_MODE,
+                   cpu: Consumption.AVG_POWER_DRAW_MODE}, 1200 * Simulation.ONE_SECOND,
+                  {motor: Consumption.MIN_POWER_DRAW_MODE,
+                   cpu: Consumption.MIN_POWER_DRAW_MODE}, 600 * Simulation.ONE_SECOND,
+                  {BatteryCell.RECHARGE: recharge},       900 * Simulation.ONE_SECOND]
+    batteryPack = BatteryPack(BatteryCell(3.65, 9, 2, BatteryCell.LI_FE_P_O4), ['2S', '2P'])
+    batteryPack.cells.equivalentCircuit = equivalentCircuit
+
+    return Simulation([motor, cpu], batteryPack, powerModes, timeStep, logType=logType)
+
+
+def run_dense_engines(build) -> dict:
+    """ Run a fresh simulation from build() with each engine that needs a dense log, check they agree and the EVENT_ENGINE refuses it """
+    sims = {}
+    for engine in (Simulation.LOOP_ENGINE, Simulation.VECTORIZED_ENGINE):
+        sims[engine] = build()
+        sims[engine].run(2700, 90, engine)
+    assert np.abs(sims[Simulation.LOOP_ENGINE].log.data - sims[Simulation.VECTORIZED_ENGINE].log.data).max() < 1e-9
+
+    try:
+        sims[Simulation.LOOP_ENGINE].run(2700, 90, Simulation.EVENT_ENGINE)
+        assert False, "Should have raised ValueError"
+    except ValueError:
+        pass  # test passes
+
+    return sims
+
 
 if __name__ == "__main__":
     batteryCell = BatteryCell(2.10, 5.0, 10, BatteryCell.AGM)
@@ -77,3 +137,514 @@ if __name__ == "__main__":
         assert False, "Expected ValueError: Minimum current draw must be less than average current draw, which must be less than maximum current draw"
     except ValueError:
         pass  # test passes
+
+
+    # The vectorized engine must reproduce the second by second loop exactly, including the final battery cell state
+    loopSim = build_simulation()
+    loopLog = loopSim.run(loopSim.experimentDuration, 95, Simulation.LOOP_ENGINE)
+    vectorSim = build_simulation()
+    vectorLog = vectorSim.run(vectorSim.experimentDuration, 95, Simulation.VECTORIZED_ENGINE)
+    assert loopLog == vectorLog
+    assert loopSim.generator.cells.currentVoltage == vectorSim.generator.cells.currentVoltage
+    assert loopSim.generator.cells.rechargeCycleNumber == vectorSim.generator.cells.rechargeCycleNumber
+
+    try:
+        build_simulation().run(2700, 10, Simulation.VECTORIZED_ENGINE)
+        assert False, "Expected ValueError: Total power draw exceeds battery pack capacity"
+    except ValueError:
+        pass  # test passes
+
+    # The event driven engine jumps between state changes, so it only matches the loop to floating point rounding
+    eventSim = build_simulation()
+    eventLog = eventSim.run(eventSim.experimentDuration, 95, Simulation.EVENT_ENGINE)
+    assert max(abs(a - b) for a, b in zip(loopLog, eventLog)) < 1e-9
+    assert loopSim.generator.cells.currentVoltage == eventSim.generator.cells.currentVoltage
+    # Whether a recharge to exactly 100% fails in the loop depends on rounding, so the event driven engine refuses it outright
+    try:
+        fullRechargeSim = build_simulation(recharge=100.0)
+        fullRechargeSim.run(fullRechargeSim.experimentDuration, 95, Simulation.EVENT_ENGINE)
+        assert False, "Should have raised ValueError"
+    except ValueError as e:
+        assert str(e).startswith("The EVENT_ENGINE can't recharge to exactly 100%")
+
+    # Every row of a batched sweep must match its own Simulation.run(), including the first limit violation
+    sweepSim = build_simulation()
+    sweep = ParameterSweep(sweepSim.consumers, sweepSim.powermodes)
+    configurations = [SweepConfiguration(BatteryCell.LI_FE_P_O4, 3.65, 9, 2, ['2S', '2P'], 95),
+                      SweepConfiguration(BatteryCell.LI_FE_P_O4, 3.65, 9, 2, ['2S', '2P'], 10),
+                      SweepConfiguration(BatteryCell.LI_FE_P_O4, 9.99, 9, 2, ['2S', '2P'], 95)]
+    result = sweep.run(configurations, traceIndexes=[0])
+    assert list(result.traces[0]) == loopLog
+    assert result.endStateOfCharge[0] == loopSim.generator.cells.state_of_charge()
+    assert result.violations[0] is None
+    assert result.violations[1].startswith("Warning: Total power draw") and result.violationTime[1] == 1
+    assert result.violations[2].endswith("Valid range is 2.8 to 3.65.") and result.violationTime[2] == 0
+
+    # The process pool runner must return the same summary as the batched sweep, in the same order
+    progress = []
+    parallelResult = ParallelSweep(sweepSim.consumers, sweepSim.powermodes, maxWorkers=2, chunkSize=1).run(configurations, progressCallback=lambda done, total: progress.append(done), traceIndexes=[0])
+    assert progress[-1] == len(configurations)
+    assert parallelResult.violations == result.violations
+    assert list(parallelResult.violationTime) == list(result.violationTime)
+    assert np.array_equal(parallelResult.endStateOfCharge, result.endStateOfCharge, equal_nan=True) and np.array_equal(parallelResult.timeToEmpty, result.timeToEmpty, equal_nan=True)
+    assert list(parallelResult.traces) == [0] and list(parallelResult.traces[0]) == loopLog
+    untracedResult = ParallelSweep(sweepSim.consumers, sweepSim.powermodes, maxWorkers=2).run(configurations)
+    assert untracedResult.traces == {} and list(untracedResult.violationTime) == list(result.violationTime)
+    assert np.array_equal(untracedResult.minStateOfCharge, result.minStateOfCharge, equal_nan=True)
+    try:
+        ParallelSweep(sweepSim.consumers, sweepSim.powermodes).run(configurations, engine=Simulation.PIECEWISE_LINEAR_LOG)
+        assert False, "Should have raised ValueError"
+    except ValueError:
+        pass  # test passes
+
+    # Monte Carlo with no uncertainty collapses every percentile band onto the deterministic run, and a seed makes it reproducible
+    monteCarloSim = build_simulation()
+    monteCarlo = MonteCarlo(monteCarloSim.consumers, monteCarloSim.generator, monteCarloSim.powermodes, 95)
+    bands = monteCarlo.run(20)
+    assert list(bands.p5[1:]) == loopLog[1:] and list(bands.p95[1:]) == loopLog[1:]
+    assert bands.probabilityOfDepletion == 0.0
+
+    monteCarlo.vary("maxCurrent", Distribution(Distribution.NORMAL, (3.125, 0.5)), monteCarloSim.consumers[0])
+    monteCarlo.vary(MonteCarlo.CELL_CAPACITY, Distribution(Distribution.UNIFORM, (8.0, 9.0)))
+    firstBands = monteCarlo.run(500, seed=7, bandInterval=60)
+    secondBands = monteCarlo.run(500, seed=7, bandInterval=60)
+    assert list(firstBands.p50) == list(secondBands.p50)
+    assert all(low <= high for low, high in zip(firstBands.p5, firstBands.p95))
+
+    # Longer time steps keep every powermode boundary on a step, and every engine agrees on them
+    minuteSim = build_simulation(timeStep=60)
+    minuteLog = minuteSim.run(minuteSim.experimentDuration, 95)
+    assert len(minuteLog) == len(minuteSim.timeLog) == 45 and minuteSim.timeLog[20] == 1200
+    assert minuteLog == build_simulation(timeStep=60).run(minuteSim.experimentDuration, 95, Simulation.VECTORIZED_ENGINE)
+    assert max(abs(a - b) for a, b in zip(minuteLog, build_simulation(timeStep=60).run(minuteSim.experimentDuration, 95, Simulation.EVENT_ENGINE))) < 1e-9
+    assert build_simulation().timeLog == list(range(loopSim.experimentDuration))
+
+    # Adaptive steps log far fewer points than one second steps, on the same trajectory
+    adaptiveSim = build_simulation(timeStep=Simulation.ADAPTIVE_TIME_STEP)
+    adaptiveSim.maxSocChangePerStep = 0.5
+    adaptiveLog = adaptiveSim.run(adaptiveSim.experimentDuration, 95)
+    assert len(adaptiveLog) == len(adaptiveSim.timeLog) < len(loopLog) / 10
+    assert 1200 in adaptiveSim.timeLog and 1800 in adaptiveSim.timeLog and adaptiveSim.timeLog[-1] == loopSim.timeLog[-1]
+    assert abs(adaptiveLog[adaptiveSim.timeLog.index(1800)] - loopLog[1800]) < 1e-9
+    assert abs(adaptiveLog[-1] - loopLog[-1]) < 1e-9
+
+    # A shorter minimum lets heavy loads take sub-second adaptive steps
+    fineSim = build_simulation(timeStep=Simulation.ADAPTIVE_TIME_STEP)
+    fineSim.maxSocChangePerStep = 0.001
+    fineSim.minAdaptiveTimeStep = 0.1
+    fineLog = fineSim.run(fineSim.experimentDuration, 95)
+    assert min(b - a for a, b in zip(fineSim.timeLog, fineSim.timeLog[1:])) < 1 and abs(fineLog[-1] - loopLog[-1]) < 1e-9
+
+    # Streaming the simulation in chunks gives the same state of charge as the full log, one fixed size chunk at a time
+    streamSim = build_simulation()
+    chunks = list(streamSim.iter_run(streamSim.experimentDuration, 95, chunkSize=1000))
+    assert [len(chunk) for chunk in chunks] == [1000, 1000, 700]
+    assert [soc for chunk in chunks for soc in chunk.stateOfCharge.tolist()] == loopLog
+    assert chunks[-1].times[-1] == loopSim.timeLog[-1]
+    assert chunks[-1].power[-1] == streamSim.generator.current_volts_amps_power[BatteryPack.POWER]
+
+    try:
+        list(build_simulation().iter_run(loopSim.experimentDuration, 10))
+        assert False, "Expected ValueError: Total power draw exceeds battery pack capacity"
+    except ValueError:
+        pass  # test passes
+
+    # The multi-channel log records every channel, identically from every exact engine, and shares memory with batteryPackPercentageLog
+    channelSim = build_simulation(logType=np.float64)
+    channelLog = channelSim.run(channelSim.experimentDuration, 95)
+    assert channelLog.base is channelSim.log.data and channelLog.tolist() == loopLog
+    vectorizedChannelSim = build_simulation(logType=np.float64)
+    vectorizedChannelSim.run(vectorizedChannelSim.experimentDuration, 95, Simulation.VECTORIZED_ENGINE)
+    assert np.array_equal(channelSim.log.data, vectorizedChannelSim.log.data) and np.array_equal(channelSim.log.modeIndex, vectorizedChannelSim.log.modeIndex)
+    assert channelSim.log.packPower[-1] == channelSim.generator.current_volts_amps_power[BatteryPack.POWER]
+    assert list(channelSim.log.modeIndex[[0, 1, 1200, 1201, 1800, 1801]]) == [SimulationLog.NO_MODE, 0, 0, 1, 1, 2]
+    assert channelSim.log.load[1] == 4 * 3.125 + 2 * 2 and channelSim.log.load[-1] == 0
+
+    # Recording six channels in float32 still takes less memory per sample than the original list of Python floats
+    compactLog = build_simulation(logType=np.float32).log
+    assert compactLog.bytes_per_sample < sys.getsizeof(1.0) + 8
+    assert memoryview(compactLog.to_buffer()).shape == (len(SimulationLog.CHANNELS), loopSim.experimentDuration)
+
+    # A piecewise linear log stores a few straight line pieces, yet expands back to the dense log
+    piecewiseSim = build_simulation(logType=Simulation.PIECEWISE_LINEAR_LOG)
+    piecewiseLog = piecewiseSim.run(piecewiseSim.experimentDuration, 95)
+    assert isinstance(piecewiseLog, PiecewiseLinearLog) and len(piecewiseLog) == len(loopLog)
+    assert len(piecewiseLog.startTimes) <= 6 and piecewiseLog.nbytes < 200
+    assert max(abs(a - b) for a, b in zip(piecewiseLog.expand(), loopLog)) < 1e-9
+    assert piecewiseLog[0] == loopLog[0] and abs(piecewiseLog[-1] - loopLog[-1]) < 1e-9
+    assert max(abs(a - b) for a, b in zip(piecewiseLog[100:2000:7], loopLog[100:2000:7])) < 1e-9
+    assert list(piecewiseSim.timeLog[1195:1205]) == loopSim.timeLog[1195:1205]
+    resampledTimes, resampledValues = piecewiseLog.resample(0.5, 10, 20)
+    assert len(resampledTimes) == 20 and abs(resampledValues[2] - loopLog[11]) < 1e-9
+
+    # Editing the last powermode only recomputes that powermode, and gives the same log as a full run
+    incrementalSim = build_simulation(logType=np.float64)
+    incrementalSim.run_incremental(incrementalSim.experimentDuration, 95)
+    assert [checkpoint.segmentIndex for checkpoint in incrementalSim.checkpoints] == [0, 2, 4, 6]
+    firstCheckpoints = list(incrementalSim.checkpoints)
+    assert incrementalSim.run_incremental(incrementalSim.experimentDuration, 95).tolist() == loopLog
+    assert incrementalSim.generator.cells.stateOfCharge == loopSim.generator.cells.stateOfCharge
+    incrementalSim.powermodes[4] = {BatteryCell.RECHARGE: 95.0}
+    incrementalLog = incrementalSim.run_incremental(incrementalSim.experimentDuration, 95)
+    assert incrementalSim.checkpoints[:3] == firstCheckpoints[:3] and incrementalSim.checkpoints[3] != firstCheckpoints[3]
+    editedSim = build_simulation(recharge=95.0, logType=np.float64)
+    editedSim.run(editedSim.experimentDuration, 95, Simulation.VECTORIZED_ENGINE)
+    assert np.array_equal(incrementalSim.log.data, editedSim.log.data) and abs(incrementalLog[-1] - 95.0) < 1e-9
+    assert incrementalSim.generator.cells.stateOfCharge == editedSim.generator.cells.stateOfCharge
+
+    # A repeated run comes from the cache, leaving the simulation exactly as the run would, and a new model version misses
+    with tempfile.TemporaryDirectory() as cacheDirectory:
+        resultCache = ResultCache(maxEntries=1, directory=cacheDirectory)
+        resultCache.run(build_simulation(), loopSim.experimentDuration, 95)
+        cachedSim = build_simulation()
+        assert resultCache.run(cachedSim, cachedSim.experimentDuration, 95) == loopLog
+        assert vars(cachedSim.generator.cells) == vars(loopSim.generator.cells)
+        resultCache.run(build_simulation(recharge=98.0), loopSim.experimentDuration, 95)
+        assert resultCache.stats.memoryHits == 1 and resultCache.stats.misses == 2 and resultCache.stats.evictions == 1
+        assert ResultCache(directory=cacheDirectory).run(build_simulation(), loopSim.experimentDuration, 95) == loopLog
+        assert len(os.listdir(os.path.join(cacheDirectory, f"v{Simulation.MODEL_VERSION}"))) == 2
+
+        currentKey = ResultCache.key(build_simulation(), loopSim.experimentDuration, 95, Simulation.LOOP_ENGINE)
+        Simulation.MODEL_VERSION += 1
+        assert ResultCache.key(build_simulation(), loopSim.experimentDuration, 95, Simulation.LOOP_ENGINE) != currentKey
+        ResultCache(directory=cacheDirectory)
+        assert os.listdir(cacheDirectory) == [f"v{Simulation.MODEL_VERSION}"]
+        Simulation.MODEL_VERSION -= 1
+
+    # The compiled schedule holds every powermode's load, and catches malformed or over power powermodes before running
+    schedule = build_simulation().compile_schedule(95)
+    assert list(schedule["start"]) == [0, 1200, 1800] and list(schedule["isRecharge"]) == [False, False, True]
+    assert schedule["totalPower"][0] == 4 * 3.125 + 2 * 2 and schedule["rechargeTarget"][2] == 99.0
+    assert list(schedule["drawModes"][0]) == [Consumption.MAX_POWER_DRAW_MODE, Consumption.AVG_POWER_DRAW_MODE]
+    strangerSim = build_simulation()
+    strangerSim.powermodes[0][Consumption("Heater", 12, 0, 1, 2, 100)] = Consumption.MAX_POWER_DRAW_MODE
+    try:
+        strangerSim.compile_schedule()
+        assert False, "Expected ValueError: Powermode 0 uses a consumer the simulation doesn't have"
+    except ValueError:
+        pass  # test passes
+    overPowerSim = build_simulation()
+    overPowerSim.consumers[0].maxCurrent = 30
+    try:
+        overPowerSim.compile_schedule(95)
+        assert False, "Expected ValueError: Total power draw exceeds battery pack capacity"
+    except ValueError:
+        pass  # test passes
+
+    # Closed form queries give the simulated state of charge, and the first time it falls to a threshold, without running
+    trajectory = build_simulation().charge_trajectory()
+    assert max(abs(trajectory.state_of_charge_at(t) - loopLog[t]) for t in range(1, 1801, 7)) < 1e-9
+    firstBelow = next(t for t, soc in enumerate(loopLog) if 0 < t and soc <= 95)
+    assert firstBelow - 1 <= trajectory.time_to_state_of_charge(95) <= firstBelow
+    assert trajectory.time_to_state_of_charge(100) == 0 and trajectory.time_to_state_of_charge(1) == float("inf")
+    assert list(trajectory.time_to_state_of_charge([99, 1]) < float("inf")) == [True, False]
+
+    # The pack optimizer bisects to the fewest parallel cells per series count, matching a brute force search of every pack
+    sizingSim = build_simulation()
+    optimizer = PackOptimizer(sizingSim.consumers, sizingSim.powermodes[:4])
+    smallCell = SweepConfiguration(BatteryCell.LI_FE_P_O4, 3.65, 0.5, 10, ['1S', '1P'], 95)
+    sizing = optimizer.optimize(smallCell, 50, maxSeries=4, maxParallel=16)
+    bruteForce = {s: next((p for p in range(1, 17) if optimizer.completes_mission(SweepConfiguration(BatteryCell.LI_FE_P_O4, 3.65, 0.5, 10, [f"{s}S", f"{p}P"], 95), 50)), None) for s in range(1, 5)}
+    assert sizing.minimumParallel == bruteForce and sizing.evaluations < 4 * 16
+    assert sizing.smallest.cellCount == min(s * p for s, p in bruteForce.items() if p is not None)
+    assert all(a.packEnergy < b.packEnergy and a.powerMargin < b.powerMargin for a, b in zip(sizing.front, sizing.front[1:]))
+
+    # Progress comes at least every PROGRESS_INTERVAL time steps, and a run stopped part way through a powermode carries on from its start
+    blockSim = build_simulation(logType=np.float64)
+    blockSim.PROGRESS_INTERVAL = 100
+    progressTimes = []
+    def stop_in_second_powermode(timeIndex: int) -> None:
+        progressTimes.append(timeIndex)
+        if timeIndex == 1501:
+            raise RunCancelled()
+    try:
+        blockSim.run_incremental(blockSim.experimentDuration, 95, stop_in_second_powermode)
+        assert False, "Should have raised RunCancelled"
+    except RunCancelled:
+        pass  # test passes
+    assert progressTimes[:3] == [1, 101, 201] and max(np.diff(progressTimes)) == 100
+    assert [checkpoint.segmentIndex for checkpoint in blockSim.checkpoints] == [0, 2]
+    blockSim.run_incremental(blockSim.experimentDuration, 95, progressTimes.append)
+    assert blockSim.log.stateOfCharge.tolist() == loopLog
+
+    # Background runs can be cancelled at any time, and a new run carries on to the same result as a run in the foreground
+    runner = BackgroundRunner()
+    backgroundSim = build_simulation()
+    runner.start(backgroundSim, backgroundSim.experimentDuration, 95)
+    runner.cancel(wait=True)
+    assert runner.poll().done and (runner.poll().cancelled or runner.poll().fraction == 1.0)
+    runner.start(backgroundSim, backgroundSim.experimentDuration, 95).result()
+    assert runner.poll().done and not runner.poll().cancelled and runner.poll().fraction == 1.0
+    assert backgroundSim.batteryPackPercentageLog == loopLog
+    runner.shutdown()
+
+    # Downsampling keeps a long trace to about two points per pixel, without losing a short dip or the ends of the line
+    traceTimes = np.arange(200000, dtype=np.float64)
+    traceValues = np.full(len(traceTimes), 80.0)
+    traceValues[123457] = 3.0
+    for method in (MIN_MAX, LTTB):
+        shownTimes, shownValues = downsample(traceTimes, traceValues, 500, method=method)
+        assert len(shownTimes) <= 2 * 500 + 2 and shownValues.min() == 3.0
+        assert shownTimes[0] == 0 and shownTimes[-1] == traceTimes[-1]
+    zoomedTimes, _ = downsample(traceTimes, traceValues, 500, timeRange=(1000.5, 1100.5))
+    assert zoomedTimes[0] == 1000 and zoomedTimes[-1] == 1101 and len(zoomedTimes) == 102
+    assert list(downsample([0, 1, 2], [1, 2, 3], 500)[1]) == [1, 2, 3]
+    try:
+        downsample(traceTimes, traceValues, 500, method="MEAN")
+        assert False, "Should have raised ValueError"
+    except ValueError:
+        pass  # test passes
+
+    # Voltage lookup tables give the same CHEM_SOC entry as a full argmin scan, one value at a time or a whole trajectory at once
+    lookup = BatteryCell.voltage_lookup(BatteryCell.LI_FE_P_O4)
+    socTable = BatteryCell.CHEM_SOC[BatteryCell.LI_FE_P_O4]
+    lookupPoints = np.concatenate((np.linspace(-1, 101, 2041), socTable, (socTable[:-1] + socTable[1:]) / 2))
+    nearest = [int(np.abs(socTable - soc).argmin()) for soc in lookupPoints]
+    assert [lookup.nearest_index(float(soc)) for soc in lookupPoints] == nearest
+    assert list(lookup.nearest_indexes(lookupPoints)) == nearest
+    assert list(lookup.voltages(lookupPoints)) == [lookup.voltage(float(soc)) for soc in lookupPoints]
+    assert lookup.state_of_charge(3.30) == 75.0 and list(lookup.state_of_charge([2.80, 3.65])) == [0.0, 100.0]
+
+    # A pack of identical cells with next to no internal resistance follows the single cell model, and reaches recharge targets exactly
+    cellArraySim = build_simulation()
+    cellArrayPack = CellArrayPack(cellArraySim.generator.cells, ['2S', '2P'], 1e-6)
+    cellArrayTrace = cellArrayPack.run_schedule(cellArraySim.compile_schedule())
+    assert np.abs(cellArrayTrace.stateOfCharge - cellArraySim.charge_trajectory().state_of_charge_at(cellArrayTrace.times)).max() < 1e-4
+    assert abs(cellArrayTrace.stateOfCharge[-1] - 99.0) < 1e-9
+
+    # A weak cell supplies less of its parallel group's current, and passive balancing pulls the series groups together
+    weakPack = CellArrayPack(BatteryCell(3.30, 9, 2, BatteryCell.LI_FE_P_O4), ['4S', '2P'])
+    weakPack.capacity[1, 1] *= 0.5
+    weakPack.energy[1, 1] *= 0.5
+    weakPack.energy[3] *= 0.9
+    weakPack.balancingCurrent = 0.5
+    weakTrace = weakPack.run_schedule(compile_schedule([], [{}, 600, {}, 3600]))
+    assert weakTrace.maxCellStateOfCharge[0] - weakTrace.minCellStateOfCharge[0] == 7.5
+    assert weakTrace.maxCellStateOfCharge[-1] - weakTrace.minCellStateOfCharge[-1] <= CellArrayPack.DEFAULT_BALANCING_TOLERANCE
+    for second in range(60):
+        weakPack.step(weakPack.current_for_power(20.0), 1.0)
+    assert 0 < weakPack.cellCurrent[1, 1] < weakPack.cellCurrent[1, 0]
+
+    # Chemistries load lazily from measured curves, resampled into a monotone grid that every later load memory maps
+    with tempfile.TemporaryDirectory() as chemistryDirectory:
+        measuredSoc = np.linspace(0, 100, 2001)
+        measuredVoltage = np.interp(measuredSoc, [0, 10, 90, 100], [2.5, 3.2, 3.4, 3.6]) + 0.003 * np.sin(measuredSoc * 7)
+        with open(os.path.join(chemistryDirectory, "Measured.csv"), "w") as chemistryFile:
+            chemistryFile.write("# Measured open circuit voltage\nsoc,voltage\n" + "".join(f"{soc},{volts}\n" for soc, volts in zip(measuredSoc, measuredVoltage)))
+        np.savez(os.path.join(chemistryDirectory, "Linear.npz"), soc=[0.0, 100.0], voltage=[3.0, 4.0], maxCycles=1200)
+
+        registry = ChemistryRegistry(os.path.join(chemistryDirectory, "cache"))
+        assert registry.register_directory(chemistryDirectory, maxCycles=2000) == ["Linear", "Measured"]
+        assert not os.path.exists(registry.cacheDirectory)
+        measured = registry.load("Measured")
+        assert isinstance(measured.voltage, np.memmap) and np.all(np.diff(measured.voltage) >= 0) and measured.maxCycles == 2000
+        assert registry.load("Linear").maxCycles == 1200 and len(os.listdir(registry.cacheDirectory)) == 2
+        sharedRegistry = ChemistryRegistry(registry.cacheDirectory)
+        sharedRegistry.register("Measured", os.path.join(chemistryDirectory, "Measured.csv"), 2000)
+        assert np.array_equal(sharedRegistry.load("Measured").voltage, measured.voltage) and len(os.listdir(registry.cacheDirectory)) == 2
+
+        BatteryCell.REGISTRY.cacheDirectory = registry.cacheDirectory
+        BatteryCell.REGISTRY.register("TestLinear", os.path.join(chemistryDirectory, "Linear.npz"))
+        linearCell = BatteryCell(3.5, 9, 2, "TestLinear")
+        assert abs(linearCell.stateOfCharge - 50.0) < 1e-9 and BatteryCell.CHEM_MAX_CYCLES["TestLinear"] == 1200
+        try:
+            registry.register("Spreadsheet", os.path.join(chemistryDirectory, "Measured.xlsx"))
+            assert False, "Should have raised ValueError"
+        except ValueError:
+            pass  # test passes
+
+    # An equivalent circuit with no resistance changes nothing, a real one sags the terminal voltage, loses energy as heat,
+    # integrates long steps exactly, and gives the same results in every engine that supports it
+    idealCircuitSim = build_simulation(logType=np.float64, equivalentCircuit=EquivalentCircuit(0.0))
+    idealCircuitSim.run(2700, 90, Simulation.VECTORIZED_ENGINE)
+    noCircuitSim = build_simulation(logType=np.float64)
+    noCircuitSim.run(2700, 90, Simulation.VECTORIZED_ENGINE)
+    assert np.array_equal(idealCircuitSim.log.stateOfCharge, noCircuitSim.log.stateOfCharge)
+    assert np.array_equal(idealCircuitSim.log.terminalVoltage, noCircuitSim.log.packVoltage)
+
+    circuitSims = run_dense_engines(lambda: build_simulation(logType=np.float64, equivalentCircuit=EquivalentCircuit(0.05, [(0.02, 1000.0), (0.03, 20000.0)])))
+    loopCircuitLog = circuitSims[Simulation.LOOP_ENGINE].log
+    assert loopCircuitLog.stateOfCharge[1799] < noCircuitSim.log.stateOfCharge[1799]
+    assert np.all(loopCircuitLog.terminalVoltage[1:1201] < loopCircuitLog.packVoltage[1:1201]) and np.all(loopCircuitLog.irLoss[1:1201] > 0)
+    assert loopCircuitLog.terminalVoltage[1201] - loopCircuitLog.packVoltage[1201] > loopCircuitLog.terminalVoltage[1200] - loopCircuitLog.packVoltage[1200]
+    assert loopCircuitLog.bytes_per_sample == noCircuitSim.log.bytes_per_sample + 2 * 8
+
+    longStepCircuit, shortStepCircuit = EquivalentCircuit(0.05, [(0.02, 1000.0)]), EquivalentCircuit(0.05, [(0.02, 1000.0)])
+    longStepLoss = longStepCircuit.step(2.0, 600.0)
+    shortStepLosses = [shortStepCircuit.step(2.0, 1.0) for second in range(600)]
+    assert abs(longStepLoss[0] - sum(loss[0] for loss in shortStepLosses)) < 1e-12 and abs(longStepLoss[1] - sum(loss[1] for loss in shortStepLosses)) < 1e-12
+    assert abs(longStepCircuit.polarization - shortStepCircuit.polarization) < 1e-12
+
+    circuitSweep = ParameterSweep(noCircuitSim.consumers, noCircuitSim.powermodes)
+    circuitResult = circuitSweep.run([SweepConfiguration(cellEnergy=9, cRating=2, packConfiguration=['2S', '2P'], efficiency=90, equivalentCircuit=EquivalentCircuit(0.05, [(0.02, 1000.0), (0.03, 20000.0)]))], 2700, [0])
+    assert np.abs(circuitResult.traces[0] - circuitSims[Simulation.VECTORIZED_ENGINE].log.stateOfCharge).max() < 1e-9 and circuitResult.irLossEnergy[0] > 0
+
+    # Rainflow counting matches the ASTM E1049 example, and gives the same cycles however the trace is split into chunks
+    rainflow = RainflowCounter()
+    rainflow.add([-2, 1, -3, 5, -1, 3, -4, 4, -2])
+    assert rainflow.cycleCounts == {4.0: 1} and sorted(rainflow.half_cycles().tolist()) == [3.0, 4.0, 6.0, 8.0, 8.0, 9.0]
+    randomWalk = np.cumsum(np.random.default_rng(0).normal(size=5000))
+    wholeTrace, chunkedTrace = RainflowCounter(), RainflowCounter()
+    wholeTrace.add(randomWalk)
+    for chunkStart in range(0, len(randomWalk), 97):
+        chunkedTrace.add(randomWalk[chunkStart:chunkStart + 97])
+    assert wholeTrace.cycleCounts == chunkedTrace.cycleCounts and np.array_equal(wholeTrace.half_cycles(), chunkedTrace.half_cycles())
+
+    # A year of repeated missions fades capacity and grows resistance, deep cycles wearing the cell faster than shallow ones
+    agingSim = build_simulation(equivalentCircuit=EquivalentCircuit(0.05, [(0.02, 1000.0)]))
+    lifetime = LifetimeStudy(agingSim.consumers, agingSim.generator, agingSim.powermodes, 90).run(LifetimeStudy.ONE_YEAR_IN_SECONDS)
+    assert lifetime.violation is None and len(lifetime.health) == int(np.ceil(LifetimeStudy.ONE_YEAR_IN_SECONDS / 2700))
+    assert np.all(np.diff(lifetime.health) <= 0) and lifetime.health[-1] < 100 and lifetime.capacity[-1] < 9
+    assert agingSim.generator.cells.equivalentCircuit.seriesResistance > 0.05 and agingSim.generator.cells.health == lifetime.health[-1]
+    deepCycleAging = CellAging(BatteryCell(3.65, 9, 2, BatteryCell.LI_CO_O2))
+    assert deepCycleAging.cycle_damage([100]) > 2 * deepCycleAging.cycle_damage([50]) and deepCycleAging.cycle_damage([50]) == 1.0
+
+    # A CC-CV charger charges in one closed form curve, the same in every engine, and reports its real minimum recharge time
+    def build_charger_simulation() -> Simulation:
+        chargerSim = build_simulation(logType=np.float64, equivalentCircuit=EquivalentCircuit(0.05, [(0.02, 1000.0)]))
+        chargerSim.generator.charger = CCCVCharger(maxPower=80)
+        return chargerSim
+    chargerSims = run_dense_engines(build_charger_simulation)
+    loopChargerLog = chargerSims[Simulation.LOOP_ENGINE].log
+    assert loopChargerLog.stateOfCharge[-1] == 99.0 and np.all(np.diff(loopChargerLog.stateOfCharge[1801:]) >= 0)
+    assert np.all(np.diff(loopChargerLog.stateOfCharge[1801:2400]) > np.diff(loopChargerLog.stateOfCharge[1802:2401]))
+    chargeProfile = CCCVCharger().profile(chargerSims[Simulation.LOOP_ENGINE].generator, 40.0, 99.0)
+    assert abs(chargeProfile.state_of_charge_at(chargeProfile.ccDuration) - CCCVCharger.DEFAULT_CV_STATE_OF_CHARGE) < 1e-12
+    assert chargeProfile.state_of_charge_at(chargeProfile.duration) == 99.0 and chargeProfile.state_of_charge_at(chargeProfile.duration - 1) < 99.0
+    chargerTrajectory = build_simulation()
+    chargerTrajectory.generator.charger = CCCVCharger(maxPower=80)
+    assert abs(chargerTrajectory.charge_trajectory().state_of_charge_at(2699) - 99.0) < 1e-12
+    slowChargerSim = build_simulation()
+    slowChargerSim.generator.charger = CCCVCharger(maxPower=30)
+    try:
+        slowChargerSim.run(2700, 90, Simulation.VECTORIZED_ENGINE)
+        assert False, "Should have raised ValueError"
+    except ValueError:
+        pass  # test passes
+
+    # Consumption objects are views of a ConsumerBank, whose (powermode x consumer) loads match adding them up one at a time
+    bankSim = build_simulation()
+    consumerBank = ConsumerBank.from_consumers(bankSim.consumers)
+    assert bankSim.consumers[0].bank is consumerBank and consumerBank.voltage.tolist() == [4.0, 2.0]
+    bankSim.consumers[1].maxCurrent = 3.5
+    assert consumerBank.maxCurrent[1] == 3.5
+    bankSchedule = compile_schedule(bankSim.consumers, bankSim.powermodes)
+    for row, powermode in zip(bankSchedule, bankSim.powermodes[0::2]):
+        if not row["isRecharge"]:
+            for consumer in bankSim.consumers:
+                consumer.turn_on(powermode[consumer])
+            assert row["totalCurrent"] == sum(consumer.current for consumer in bankSim.consumers)
+            assert row["energyPerSecond"] == sum(consumer.real_time_energy(Simulation.ONE_SECOND) for consumer in bankSim.consumers)
+    manyConsumers = ConsumerBank()
+    for k in range(100):
+        Consumption(f"Sensor {k}", 5, 0.01, 0.02 * (k + 1), 0.05 * (k + 1), 50, manyConsumers)
+    assert len(manyConsumers) == 100 and manyConsumers.data.shape[1] >= 100
+    assert np.allclose(manyConsumers.segment_loads(np.full((1, 100), Consumption.AVG_POWER_DRAW_MODE))[0], 0.02 * 5050)
+    manyConsumers.turn_on(np.full(100, Consumption.MAX_POWER_DRAW_MODE))
+    assert manyConsumers.consumers[99].current == 5.0 and manyConsumers.consumers[99].deviceOn
+
+    # Recorded load traces are memory mapped and integrated exactly over every simulation step, whatever the engine
+    with tempfile.TemporaryDirectory() as traceDirectory:
+        radioSamples = (0.2 + 0.15 * np.sin(np.arange(5000) / 37.0)).astype(np.float32)
+        np.save(os.path.join(traceDirectory, "radio.npy"), radioSamples)
+        radioSamples.tofile(os.path.join(traceDirectory, "radio.bin"))
+        radio = TraceConsumption("Radio", 3.3, os.path.join(traceDirectory, "radio.npy"), 1000)
+        assert isinstance(radio.samples, np.memmap) and radio.duration == 5.0
+        assert np.allclose(radio.step_currents(0.0, np.ones(5)), radioSamples.reshape(5, 1000).mean(axis=1), atol=1e-12)
+        TraceConsumption.MAX_WINDOW_SAMPLES = 700
+        assert np.allclose(radio.step_currents(2.5, np.full(8, 0.75)), radio.step_currents(7.5, np.full(8, 0.75)), atol=1e-12)
+        TraceConsumption.MAX_WINDOW_SAMPLES = 2**20
+        rawRadio = TraceConsumption("Radio", 3.3, os.path.join(traceDirectory, "radio.bin"), 1000, loop=False)
+        assert np.allclose(rawRadio.step_currents(0.0, np.ones(5)), radio.step_currents(0.0, np.ones(5)), atol=1e-12)
+        assert np.all(rawRadio.step_currents(5.0, np.ones(3)) == 0.0) and abs(rawRadio.step_currents(4.5, [1.0])[0] - radioSamples[4500:].mean() / 2) < 1e-9
+
+        def build_trace_simulation() -> Simulation:
+            traceSim = build_simulation(logType=np.float64)
+            traceRadio = TraceConsumption("Radio", 3.3, os.path.join(traceDirectory, "radio.npy"), 1000)
+            traceSim.consumers.append(traceRadio)
+            traceSim.powermodes[0][traceRadio] = TraceConsumption.TRACE_DRAW_MODE
+            traceSim.powermodes[2][traceRadio] = TraceConsumption.OFF_DRAW_MODE
+            return traceSim
+        traceSims = run_dense_engines(build_trace_simulation)
+        noTraceSim = build_simulation(logType=np.float64)
+        noTraceSim.run(2700, 90)
+        assert traceSims[Simulation.LOOP_ENGINE].log.stateOfCharge[1200] < noTraceSim.log.stateOfCharge[1200]
+        firstTraceSim = build_simulation(logType=np.float64)
+        firstRadio = TraceConsumption("Radio", 3.3, os.path.join(traceDirectory, "radio.npy"), 1000)
+        firstTraceSim.consumers.insert(0, firstRadio)
+        firstTraceSim.powermodes[0][firstRadio] = TraceConsumption.TRACE_DRAW_MODE
+        firstTraceSim.powermodes[2][firstRadio] = TraceConsumption.OFF_DRAW_MODE
+        firstTraceSim.run(2700, 90, Simulation.VECTORIZED_ENGINE)
+        assert ConsumerBank.shared(firstTraceSim.consumers) is None
+        assert np.abs(firstTraceSim.log.data - traceSims[Simulation.LOOP_ENGINE].log.data).max() < 1e-9
+
+        # A 0 second powermode has no time steps, so its pulses and trace never divide by a zero-length step
+        def build_zero_length_simulation() -> Simulation:
+            zeroSim = build_trace_simulation()
+            zeroSim.pulsePeriod = 1.5
+            zeroSim.powermodes[0:0] = [dict(zeroSim.powermodes[0]), 0 * Simulation.ONE_SECOND]
+            return zeroSim
+        zeroSims = run_dense_engines(build_zero_length_simulation)
+        assert zeroSims[Simulation.LOOP_ENGINE].log.data.shape == traceSims[Simulation.LOOP_ENGINE].log.data.shape
+        assert not np.isnan(zeroSims[Simulation.VECTORIZED_ENGINE].log.data).any()
+        try:
+            radio.step_currents(0.0, [1.0, 0.0])
+            assert False, "Should have raised ValueError"
+        except ValueError:
+            pass  # test passes
+
+    # Duty cycles modelled as PWM pulses, one period integrated and folded over every time step
+    def build_pulse_simulation() -> Simulation:
+        pulseSim = build_simulation(logType=np.float64, equivalentCircuit=EquivalentCircuit(0.05, [(0.02, 1000.0)]))
+        pulseSim.pulsePeriod = 1.5
+        return pulseSim
+    run_dense_engines(build_pulse_simulation)
+    averagedSim = build_simulation(logType=np.float64)
+    averagedSim.run(2700, 90)
+    fastPulseSim = build_simulation(logType=np.float64)
+    fastPulseSim.pulsePeriod = 0.01
+    fastPulseSim.run(2700, 90, Simulation.VECTORIZED_ENGINE)
+    assert np.abs(fastPulseSim.log.stateOfCharge - averagedSim.log.stateOfCharge).max() < 1e-9
+    assert np.abs(fastPulseSim.log.packCurrent - averagedSim.log.packCurrent).max() < 1e-12 and np.abs(fastPulseSim.log.load - averagedSim.log.load).max() < 1e-12
+    pulseSchedule = compile_schedule(fastPulseSim.consumers, fastPulseSim.powermodes)
+    meanCurrent, meanSquare, meanPower, peakCurrent, peakPower = pulse_loads(fastPulseSim.consumers, pulseSchedule[0], 0.01, np.full(1000, 0.0025))
+    assert abs(meanCurrent.mean() - (0.5 * 3.125 + 2)) < 1e-9 and peakCurrent == 3.125 + 2 and peakPower == 4 * 3.125 + 2 * 2
+    assert abs(meanSquare.mean() - (0.5 * (3.125 + 2) ** 2 + 0.5 * 2 ** 2)) < 1e-9 and meanCurrent.max() > meanCurrent.min() and meanPower.max() < peakPower + 1e-9
+    try:
+        pulse_loads(fastPulseSim.consumers, pulseSchedule[0], 0.01, np.array([0.0025, 0.0]))
+        assert False, "Should have raised ValueError"
+    except ValueError:
+        pass  # test passes
+
+    # Staggered pulses never overlap, so their peak current stays under a limit that all pulses at once would break
+    staggeredPack = BatteryPack(BatteryCell(3.65, 9, 2, BatteryCell.LI_FE_P_O4), ['2S', '2P'])
+    heaters = [Consumption("Heater A", 1, 0, 0, 8, 50), Consumption("Heater B", 1, 0, 0, 8, 50)]
+    staggeredSim = Simulation(heaters, staggeredPack, [{heaters[0]: Consumption.MAX_POWER_DRAW_MODE, heaters[1]: Consumption.MAX_POWER_DRAW_MODE}, 60], logType=np.float64)
+    staggeredSim.pulsePeriod = 0.02
+    heaters[1].set_pulse_phase(50)
+    staggeredSim.run(60, 90)
+    assert abs(staggeredSim.generator.cells.currentAmpere - 4.0) < 1e-9
+    assert np.all(staggeredSim.log.packCurrent[1:] == 8.0) and np.all(staggeredSim.log.load[1:] == 8.0)
+    heaters[1].set_pulse_phase(0)
+    try:
+        staggeredSim.run(60, 90, Simulation.VECTORIZED_ENGINE)
+        assert False, "Should have raised ValueError"
+    except ValueError:
+        pass  # test passes
+    try:
+        heaters[1].set_pulse_phase(150)
+        assert False, "Should have raised ValueError"
+    except ValueError:
+        pass  # test passes
+
+    # Whole number loads print the way the original second by second loop printed them, in every engine and in sweeps
+    heater = Consumption("Heater", 12, 0, 1, 1, 100)
+    heaterModes = [{heater: Consumption.MAX_POWER_DRAW_MODE}, 60]
+    for engine in (Simulation.LOOP_ENGINE, Simulation.VECTORIZED_ENGINE, Simulation.EVENT_ENGINE):
+        try:
+            Simulation([heater], BatteryPack(BatteryCell(3.65, 2.5, 1, BatteryCell.LI_FE_P_O4), ['1S', '1P']), heaterModes).run(60, 90, engine)
+            assert False, "Should have raised ValueError"
+        except ValueError as error:
+            assert str(error).startswith("Warning: Total power draw of 12 Watts")
+    heaterSweep = ParameterSweep([heater], heaterModes).run([SweepConfiguration(BatteryCell.LI_FE_P_O4, 3.65, 2.5, 1, ['1S', '1P'], 90)])
+    assert heaterSweep.violations[0].startswith("Warning: Total power draw of 12 Watts")
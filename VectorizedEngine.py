@@ -0,0 +1,590 @@
+#!/usr/bin/python3
+
+# Standard libraries
+import math
+from dataclasses import dataclass
+
+# External libraries
+import numpy as np
+
+# Internal libraries
+from Power.BatteryCell import BatteryCell
+from SimulationLog import SimulationLog
+from Checkpoint import Checkpoint
+from PowermodeSchedule import compile_schedule, apply_draw_modes, has_traces, trace_loads, pulse_loads, format_watts
+
+
+@dataclass
+class SimulationChunk:
+    times: np.ndarray           # Units are seconds since start of simulation
+    stateOfCharge: np.ndarray   # Units are percentage
+    voltage: np.ndarray         # Units are Volts (battery pack)
+    current: np.ndarray         # Units are Amps (battery pack)
+    power: np.ndarray           # Units are Watts (battery pack)
+
+    def __len__(self):
+        return len(self.times)
+
+
+def nearest_soc_index(chemistry: str, stateOfCharge: np.ndarray) -> np.ndarray:
+    """ Vectorized version of np.abs(BatteryCell.CHEM_SOC[chemistry] - stateOfCharge).argmin() for every element of an array
+
+        Ties are resolved towards the lower index, exactly like argmin() returns the first minimum.
+
+    Args:
+        chemistry (str): The chemistry type of a battery cell, defined as a CONSTANT in BatteryCell.py
+        stateOfCharge (np.ndarray): States of charge (in %) to look up
+
+    Returns:
+        np.ndarray: Array indexes into BatteryCell.CHEM_SOC[chemistry] and BatteryCell.CHEM_VOLTAGE[chemistry]
+    """
+    return BatteryCell.voltage_lookup(chemistry).nearest_indexes(stateOfCharge)
+
+
+def charging_ampere(cell, rechargeStep: float) -> float:
+    """ Current into a battery cell that raises its state of charge by rechargeStep each second, at its nominal voltage
+
+    Args:
+        cell (BatteryCell): The cell being recharged
+        rechargeStep (float): State of charge (in %) gained per second
+
+    Returns:
+        float: Charging current in Amps
+    """
+    return (rechargeStep / 100) * cell.totalEnergyCapacity * 3600 / cell.nominalVoltage
+
+
+def circuit_traces(sim, voltage: np.ndarray, cellAmpere: float, polarization: np.ndarray, heat: np.ndarray, stepLengths: np.ndarray) -> tuple:
+    """ Terminal voltage and IR loss channels of a block of time steps, from EquivalentCircuit.response()
+
+    Args:
+        sim (Simulation): The simulation being run
+        voltage (np.ndarray): Cell open circuit voltage (in Volts) at the end of every time step
+        cellAmpere (float): Current through every cell (in Amps), negative when charging
+        polarization (np.ndarray): Voltage across all RC pairs at the end of every time step
+        heat (np.ndarray): Energy (in Watt-hours) turned into heat in every cell in every time step
+        stepLengths (np.ndarray): Length in seconds of every time step
+
+    Returns:
+        np.ndarray: Cell terminal voltage (in Volts) at the end of every time step
+        np.ndarray: Power (in Watts) lost in the internal resistance of the whole pack in every time step
+    """
+    cellsInPack = sim.generator.seriesCount * sim.generator.parallelCount
+    terminalVoltage = sim.generator.cells.equivalentCircuit.terminal_voltage(voltage, cellAmpere, polarization)
+
+    return terminalVoltage, heat * 3600 / stepLengths * cellsInPack
+
+
+def segment_load(sim, segment, voltageRegulatorEfficiency: int) -> float:
+    """ Turn on every consumer for one power consuming segment, check the battery pack can supply it, and set the cell current draw
+
+        The load is constant within a segment, so these checks only need to run once per segment instead of once per second.
+
+    Args:
+        sim (Simulation): The simulation whose consumers and battery pack are updated in place
+        segment (np.void): Row of the compiled powermodes, see PowermodeSchedule.compile_schedule()
+        voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+
+    Returns:
+        float: Energy (in Watt-hours) removed from every battery cell each second
+
+    Raises:
+        ValueError: If the total power draw exceeds the battery pack capacity, or the current draw exceeds the battery cell limit
+    """
+    apply_draw_modes(sim.consumers, segment)
+    totalPowerDraw = float(segment["totalPower"])
+
+    effectivePowerOutput = sim.generator.maxPackPower * (voltageRegulatorEfficiency / 100)
+    if totalPowerDraw > effectivePowerOutput:
+        raise ValueError(f"Warning: Total power draw of {format_watts(totalPowerDraw)} Watts, exceeds battery pack capacity of {effectivePowerOutput} Watts")
+
+    sim.generator.cells.update_ampere(float(segment["totalCurrent"]) / sim.generator.parallelCount)
+
+    return float(segment["energyPerSecond"]) / (sim.generator.seriesCount * sim.generator.parallelCount)
+
+
+def segment_step_load(sim, segment, stepLengths: np.ndarray, segmentTime: float, voltageRegulatorEfficiency: int) -> tuple:
+    """ Load of a power consuming segment at every time step, when TraceConsumption objects play in it or duty cycles are pulsed
+
+        Checks every time step against the battery pack limits before any of them runs, with the same ValueError messages
+        as segment_load(). Like segment_load(), the current and load reported are the on-current and on-power, the duty
+        cycle only scales the energy. With pulsed duty cycles (see Simulation.pulsePeriod) the on-current is the peak of
+        the pulses, and the energy is integrated over every step by folding one PWM period (see PowermodeSchedule.pulse_loads()).
+
+    Args:
+        sim (Simulation): The simulation whose consumers are updated in place
+        segment (np.void): Row of the compiled powermodes, see PowermodeSchedule.compile_schedule()
+        stepLengths (np.ndarray): Length in seconds of every time step to run
+        segmentTime (float): Seconds since the segment started at the start of the first time step
+        voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+
+    Returns:
+        tuple: On-current (in Amps) of every cell, total power draw (in Watts), energy (in Watt-hours) removed from every
+               cell, variance of the cell current (in Amps^2, None without pulses) and mean current (in Amps) of every cell
+               at every time step, or None if the load is constant over the segment
+
+    Raises:
+        ValueError: If the total power draw exceeds the battery pack capacity, or the current draw exceeds the battery cell limit, in any time step
+    """
+    # A 0 second powermode has no time steps to integrate, and step_count() never splits off a zero-length step
+    if len(stepLengths) == 0:
+        return None
+
+    pulsed = sim.pulsePeriod is not None
+    if pulsed:
+        apply_draw_modes(sim.consumers, segment)
+    else:
+        energyPerCell = segment_load(sim, segment, voltageRegulatorEfficiency)
+    traceCurrent, tracePower = trace_loads(sim.consumers, segment, stepLengths, segmentTime)
+    if traceCurrent is None and not pulsed:
+        return None
+
+    parallelCount = sim.generator.parallelCount
+    cellsInPack = sim.generator.seriesCount * parallelCount
+    ripple = None
+    if pulsed:
+        meanCurrent, meanSquare, meanLoad, peakCurrent, peakLoad = pulse_loads(sim.consumers, segment, sim.pulsePeriod, stepLengths, segmentTime)
+        peakCurrent = np.full(len(stepLengths), peakCurrent)
+        peakLoad = np.full(len(stepLengths), peakLoad)
+        stepEnergy = meanLoad * stepLengths / 3600 / cellsInPack
+        ripple = np.maximum(meanSquare - meanCurrent * meanCurrent, 0.0) / (parallelCount * parallelCount)
+    else:
+        peakCurrent = float(segment["totalCurrent"])
+        peakLoad = float(segment["totalPower"])
+        meanCurrent = peakCurrent
+        stepEnergy = energyPerCell * stepLengths
+
+    if traceCurrent is not None:
+        meanCurrent = meanCurrent + traceCurrent
+        peakCurrent = peakCurrent + traceCurrent
+        peakLoad = peakLoad + tracePower
+        stepEnergy = stepEnergy + tracePower * stepLengths / 3600 / cellsInPack
+
+    effectivePowerOutput = sim.generator.maxPackPower * (voltageRegulatorEfficiency / 100)
+    overPower = np.flatnonzero(peakLoad > effectivePowerOutput)
+    if len(overPower) > 0:
+        raise ValueError(f"Warning: Total power draw of {format_watts(peakLoad[overPower[0]])} Watts, exceeds battery pack capacity of {effectivePowerOutput} Watts")
+
+    peakAmpere = peakCurrent / parallelCount
+    overCurrent = np.flatnonzero(peakAmpere > sim.generator.cells.maxAmpere)
+    if len(overCurrent) > 0:
+        sim.generator.cells.update_ampere(float(peakAmpere[overCurrent[0]]))
+
+    return peakAmpere, peakLoad, stepEnergy, ripple, meanCurrent / parallelCount
+
+
+def consumption_segment(sim, segment, stepLengths: np.ndarray, voltageRegulatorEfficiency: int, withTraces: bool = False, stepLoad: tuple = None) -> tuple:
+    """ Compute one power consuming segment of a "powermodes" list in one shot, instead of one Python loop iteration per second
+
+        The per second energy draw is constant within a segment, so the cell energy is a clamped cumulative sum.
+        Power limits and current limits are checked once (see segment_load()), with the same ValueError messages as Simulation.run()
+
+    Args:
+        sim (Simulation): The simulation whose consumers and battery pack are updated in place
+        segment (np.void): Row of the compiled powermodes, see PowermodeSchedule.compile_schedule()
+        stepLengths (np.ndarray): Length in seconds of every time step to run, see Simulation.step_lengths()
+        voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+        withTraces (bool, optional): Also compute the voltage and power at every time step. Defaults to False (last time step only).
+        stepLoad (tuple, optional): Load at every time step from segment_step_load(), already checked. Defaults to None (a constant load).
+
+    Returns:
+        np.ndarray: State of charge (in %) at the end of every time step
+        np.ndarray: Cell voltage (in Volts) at the end of every time step
+        np.ndarray: Pack power (in Watts) at the end of every time step
+        tuple: Cell terminal voltage and pack IR loss at every time step (see circuit_traces()), or None without an EquivalentCircuit or traces
+    """
+    cell = sim.generator.cells
+    ripple = None
+    if stepLoad is None:
+        energyPerCell = segment_load(sim, segment, voltageRegulatorEfficiency)
+        stepEnergy = energyPerCell * stepLengths
+        cellAmpere = cell.currentAmpere
+    else:
+        cellAmpere, _, stepEnergy, ripple, meanAmpere = stepLoad
+
+    circuit = cell.equivalentCircuit
+    if circuit is not None and stepLoad is None:
+        # The load current is constant, so the RC pairs have a closed form response over the whole segment
+        polarization, drawn, heat = circuit.response(cell.currentAmpere, stepLengths)
+        stepEnergy = stepEnergy + drawn
+    elif circuit is not None:
+        # The current changes every step, so the RC pairs are stepped one at a time
+        polarization, drawn, heat = np.empty(len(stepLengths)), np.empty(len(stepLengths)), np.empty(len(stepLengths))
+        for k in range(len(stepLengths)):
+            drawn[k], heat[k] = circuit.step(float(meanAmpere[k]), float(stepLengths[k]))
+            polarization[k] = circuit.polarization
+        if ripple is not None:
+            # The RC pairs follow the mean of pulses much shorter than their time constant, the series resistance heats up with every pulse
+            rippleLoss = circuit.seriesResistance * ripple * stepLengths / 3600
+            drawn += rippleLoss
+            heat += rippleLoss
+        stepEnergy = stepEnergy + drawn
+
+    # Sequential cumulative sum gives bit for bit the same values as "currentEnergy -= energy" once per time step
+    timeStepsToRun = len(stepLengths)
+    energy = np.empty(timeStepsToRun + 1)
+    energy[0] = cell.currentEnergy
+    np.negative(stepEnergy, out=energy[1:])
+    np.cumsum(energy, out=energy)
+    np.maximum(energy, 0.00, out=energy)
+    energy = energy[1:]
+    soc = (energy / cell.totalEnergyCapacity) * 100
+
+    # BatteryCell.consume_energy() snaps the voltage using the state of charge from BEFORE the energy is removed
+    previousSoc = np.empty(timeStepsToRun)
+    previousSoc[0] = cell.stateOfCharge
+    previousSoc[1:] = soc[:-1]
+    if not withTraces:
+        previousSoc = previousSoc[-1:]
+    voltage = BatteryCell.CHEM_VOLTAGE[cell.chemistry][nearest_soc_index(cell.chemistry, previousSoc)]
+    if stepLoad is not None:
+        cell.currentAmpere = float(cellAmpere[-1])
+        if not withTraces:
+            cellAmpere = cellAmpere[-1:]
+    power = voltage * cellAmpere
+
+    cell.currentEnergy = float(energy[-1])
+    cell.currentVoltage = float(voltage[-1])
+    cell.currentPower = float(power[-1])
+    cell.stateOfCharge = float(soc[-1])
+
+    traces = None
+    if circuit is not None and withTraces:
+        # Terminal voltage sags with the current the RC pairs see, the mean of any pulses
+        traces = circuit_traces(sim, voltage, cellAmpere if stepLoad is None else meanAmpere, polarization, heat, stepLengths)
+
+    return soc, voltage, power * sim.generator.seriesCount * sim.generator.parallelCount, traces
+
+
+def charger_segment(sim, finalSoC: float, timeDuration: int, stepLengths: np.ndarray, withTraces: bool = False) -> tuple:
+    """ Compute one "RECHARGE" segment of a "powermodes" list from the closed form curve of the battery pack's CCCVCharger
+
+        The curve only depends on the state of charge it starts from, so a segment split into several calls gives the
+        same result as one call.
+
+    Args:
+        sim (Simulation): The simulation whose battery pack is updated in place
+        finalSoC (float): The requested state of charge at the end of the segment
+        timeDuration (int): The requested recharge time in seconds defined in the "powermodes" list
+        stepLengths (np.ndarray): Length in seconds of every time step to run, see Simulation.step_lengths()
+        withTraces (bool, optional): Also compute the voltage and power at every time step. Defaults to False (last time step only).
+
+    Returns:
+        tuple: Same as recharge_segment(), the error is always None
+
+    Raises:
+        ValueError: If the charger can't reach finalSoC within timeDuration, or finalSoC is above 100% or below the current state of charge
+    """
+    cell = sim.generator.cells
+    startStateOfCharge = cell.stateOfCharge
+    profile = sim.generator.charger.profile(sim.generator, startStateOfCharge, finalSoC)
+    if profile.duration > timeDuration:
+        raise ValueError(f"Requested recharge time of {timeDuration} seconds is too fast! The charger needs {math.ceil(profile.duration)} seconds.")
+
+    requested = profile.state_of_charge_at(np.cumsum(stepLengths))
+    energy = (requested / 100) * cell.totalEnergyCapacity
+    soc = (energy / cell.totalEnergyCapacity) * 100
+    voltage = BatteryCell.CHEM_VOLTAGE[cell.chemistry][nearest_soc_index(cell.chemistry, requested if withTraces else requested[-1:])]
+    power = voltage * cell.currentAmpere
+    if len(requested) > 0:
+        sim.generator.charger.charge_cell(cell, float(requested[-1]))
+
+    # The charging current changes every step, so the RC pairs are stepped one at a time
+    traces = None
+    circuit = cell.equivalentCircuit
+    if circuit is not None:
+        chargeAmpere = -charging_ampere(cell, np.diff(requested, prepend=startStateOfCharge) / stepLengths)
+        polarization = np.empty(len(stepLengths))
+        heat = np.empty(len(stepLengths))
+        for k in range(len(stepLengths)):
+            _, heat[k] = circuit.step(float(chargeAmpere[k]), float(stepLengths[k]))
+            polarization[k] = circuit.polarization
+        if withTraces:
+            traces = circuit_traces(sim, voltage, chargeAmpere, polarization, heat, stepLengths)
+
+    return soc, voltage, power * sim.generator.seriesCount * sim.generator.parallelCount, None, traces
+
+
+def recharge_segment(sim, finalSoC: float, timeDuration: int, timeToRun: float, stepLengths: np.ndarray, fastestAllowedRechargeTime: float, withTraces: bool = False, rechargeStep: float = None) -> tuple:
+    """ Compute one "RECHARGE" segment of a "powermodes" list in one shot, instead of one BatteryCell.recharge() call per second
+
+    Args:
+        sim (Simulation): The simulation whose battery pack is updated in place
+        finalSoC (float): The requested state of charge at the end of the full (non truncated) segment
+        timeDuration (int): The requested recharge time in seconds defined in the "powermodes" list
+        timeToRun (float): Time in seconds to run, which may be less than timeDuration
+        stepLengths (np.ndarray): Length in seconds of every time step to run, see Simulation.step_lengths()
+        fastestAllowedRechargeTime (float): Shortest recharge time in seconds the battery pack allows, as computed in Simulation.run()
+        withTraces (bool, optional): Also compute the voltage and power at every time step. Defaults to False (last time step only).
+        rechargeStep (float, optional): State of charge gained per second, when continuing a segment split into several calls. Defaults to None (computed from finalSoC).
+
+    Returns:
+        np.ndarray: State of charge (in %) at the end of every completed time step
+        np.ndarray: Cell voltage (in Volts) at the end of every completed time step
+        np.ndarray: Pack power (in Watts) at the end of every completed time step
+        ValueError: The error BatteryCell.recharge() raised part way through the segment, or None
+        tuple: Cell terminal voltage and pack IR loss at every completed time step (see circuit_traces()), or None without an EquivalentCircuit or traces
+    """
+    if sim.generator.charger is not None:
+        return charger_segment(sim, finalSoC, timeDuration, stepLengths, withTraces)
+
+    cell = sim.generator.cells
+    if rechargeStep is None:
+        rechargeStep = (finalSoC - cell.state_of_charge()) / timeToRun
+
+    if fastestAllowedRechargeTime > timeDuration:
+        raise ValueError(f"Requested recharge time of {timeDuration} seconds is too fast!")
+
+    # Requested state of charge passed to every BatteryCell.recharge() call
+    timeStepsToRun = len(stepLengths)
+    requested = np.empty(timeStepsToRun + 1)
+    requested[0] = cell.stateOfCharge
+    np.multiply(rechargeStep, stepLengths, out=requested[1:])
+    np.cumsum(requested, out=requested)
+
+    error = None
+    tooHigh = requested[1:] > BatteryCell.MAX_STATE_OF_CHARGE
+    tooLow = requested[1:] < requested[:-1]
+    failed = np.flatnonzero(tooHigh | tooLow)
+    completedSteps = timeStepsToRun
+    if len(failed) > 0:
+        completedSteps = int(failed[0])
+        if tooHigh[completedSteps]:
+            error = ValueError("Can't recharge battery cell above 100%")
+        else:
+            error = ValueError(f"Requested State of Recharge ({float(requested[completedSteps + 1])}%), is less than current state of charge ({round(float(requested[completedSteps]), 2)}%).")
+
+    requested = requested[1:completedSteps + 1]
+    energy = cell.totalEnergyCapacity * (requested / 100)
+    soc = (energy / cell.totalEnergyCapacity) * 100
+    voltage = BatteryCell.CHEM_VOLTAGE[cell.chemistry][nearest_soc_index(cell.chemistry, requested if withTraces else requested[-1:])]
+    power = voltage * cell.currentAmpere
+
+    if completedSteps > 0:
+        # Health uses the recharge cycle count from before the last BatteryCell.recharge() call increments it
+        cyclesBeforeLastRecharge = cell.rechargeCycleNumber + int(np.count_nonzero(requested[:-1] <= 50))
+        cell.health = np.exp((np.log(0.8) / BatteryCell.CHEM_MAX_CYCLES[cell.chemistry]) * cyclesBeforeLastRecharge)
+        cell.rechargeCycleNumber = cyclesBeforeLastRecharge + int(requested[-1] <= 50)
+
+        cell.stateOfCharge = float(requested[-1])
+        cell.currentEnergy = float(energy[-1])
+        cell.currentVoltage = float(voltage[-1])
+        cell.currentPower = float(power[-1])
+
+    # The charger supplies the IR losses, so they don't change the state of charge, only the RC pairs and the logged channels
+    traces = None
+    circuit = cell.equivalentCircuit
+    if circuit is not None:
+        chargeAmpere = -charging_ampere(cell, rechargeStep)
+        polarization, _, heat = circuit.response(chargeAmpere, stepLengths[:completedSteps])
+        if withTraces:
+            traces = circuit_traces(sim, voltage, chargeAmpere, polarization, heat, stepLengths[:completedSteps])
+
+    return soc, voltage, power * sim.generator.seriesCount * sim.generator.parallelCount, error, traces
+
+
+def run_vectorized(sim, runTimeInSeconds: int, voltageRegulatorEfficiency: int, start: Checkpoint = None, checkpoints: list = None, progress = None) -> list:
+    """ Drop in replacement for the second by second Simulation.run() loop, computing every powermode segment with NumPy arrays
+
+        Produces the same batteryPackPercentageLog, the same final BatteryCell and Consumption state and raises the same ValueErrors.
+
+    Args:
+        sim (Simulation): The simulation to run
+        runTimeInSeconds (int): The duration in seconds for which the simulation is run.
+        voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+        start (Checkpoint, optional): Carry on from this powermode boundary, restoring its state first. Defaults to None (start from t=0).
+        checkpoints (list, optional): List to append a Checkpoint to at every powermode boundary reached, and at the end. Defaults to None.
+        progress (callable, optional): Called as progress(timeIndex) before every powermode and every sim.PROGRESS_INTERVAL time steps within one,
+                                       when every log entry before timeIndex is final. Any exception it raises stops the run, which carries on
+                                       from the checkpoint of that powermode next time. Defaults to None.
+
+    Returns:
+        list: Battery charge state data calculated during a simulation run.
+    """
+    if sim.experimentDuration < runTimeInSeconds:
+        raise ValueError(f"Requested simulation time of {runTimeInSeconds}, is more than time defined in the powermodes variable.")
+
+    if start is None:
+        sim.batteryPackPercentageLog[0] = int(sim.generator.cells.stateOfCharge)
+        if sim.log is not None:
+            sim.log.record(0, int(sim.generator.cells.stateOfCharge), sim.generator.cells.currentVoltage, sim.generator.current_volts_amps_power, 0, SimulationLog.NO_MODE)
+
+        start = Checkpoint.capture(sim, 0, 1, sim.timeStep)
+    else:
+        start.restore(sim)
+
+    timeIndex = start.timeIndex
+    totalElaspedTime = start.totalElaspedTime
+    schedule = compile_schedule(sim.consumers, sim.powermodes)
+    variableLoad = has_traces(schedule) or sim.pulsePeriod is not None
+
+    for i in range(start.segmentIndex, len(sim.powermodes), 2):
+        if checkpoints is not None and (len(checkpoints) == 0 or checkpoints[-1].segmentIndex < i):
+            checkpoints.append(Checkpoint.capture(sim, i, timeIndex, totalElaspedTime))
+        timeDuration = sim.powermodes[i+1]
+        timeToRun = min(timeDuration, runTimeInSeconds - totalElaspedTime)
+        stepCount, lastStepLength = sim.step_count(timeToRun)
+        cell = sim.generator.cells
+        fastestAllowedRechargeTime = int(((cell.totalEnergyCapacity - cell.currentEnergy) / (cell.maxPower)) * 3600) / sim.generator.parallelCount
+
+        segment = schedule[i // 2]
+        rechargeStep = None
+        if segment["isRecharge"] and timeToRun > 0:
+            rechargeStep = (float(segment["rechargeTarget"]) - cell.state_of_charge()) / timeToRun
+
+        # With a progress callback, long powermodes are computed in blocks, so progress and cancelling never wait for a whole powermode
+        blockSize = sim.PROGRESS_INTERVAL if progress is not None else max(stepCount, 1)
+        for blockStart in range(0, max(stepCount, 1), blockSize):
+            if progress is not None:
+                progress(timeIndex)
+
+            stepLengths = np.full(min(blockSize, stepCount - blockStart), float(sim.timeStep))
+            if blockStart + len(stepLengths) == stepCount and stepCount > 0:
+                stepLengths[-1] = lastStepLength
+
+            if len(stepLengths) > 0:
+                error = None
+                load = 0
+                stepLoad = None
+                withTraces = sim.log is not None
+                if segment["isRecharge"]:
+                    soc, voltage, _, error, traces = recharge_segment(sim, float(segment["rechargeTarget"]), timeDuration, timeToRun, stepLengths, fastestAllowedRechargeTime, withTraces, rechargeStep)
+                else:
+                    if variableLoad:
+                        stepLoad = segment_step_load(sim, segment, stepLengths, float(blockStart * sim.timeStep), voltageRegulatorEfficiency)
+                    soc, voltage, _, traces = consumption_segment(sim, segment, stepLengths, voltageRegulatorEfficiency, withTraces, stepLoad)
+                    load = float(segment["totalPower"])
+
+                cellAmpere = cell.currentAmpere
+                if stepLoad is not None:
+                    cellAmpere, load = stepLoad[:2]
+
+                if sim.log is not None:
+                    sim.log.record_block(timeIndex, soc, voltage, sim.generator.seriesCount, sim.generator.parallelCount, cellAmpere, load, i // 2, *(traces or ()))
+                else:
+                    sim.batteryPackPercentageLog[timeIndex:timeIndex + len(soc)] = soc.tolist()
+                timeIndex += len(soc)
+
+                if error is not None:
+                    raise error
+
+        totalElaspedTime += timeToRun
+        if totalElaspedTime > runTimeInSeconds:
+            break
+
+    if checkpoints is not None:
+        checkpoints.append(Checkpoint.capture(sim, len(sim.powermodes), timeIndex, totalElaspedTime))
+
+    return sim.batteryPackPercentageLog
+
+
+def iter_vectorized(sim, runTimeInSeconds: int, voltageRegulatorEfficiency: int, chunkSize: int):
+    """ Generator version of run_vectorized(), yielding the simulation output in fixed size chunks as it is computed
+
+        Powermodes are computed chunkSize time steps at a time, so memory use never depends on the run time.
+        Concatenating every chunk's stateOfCharge gives exactly the list run_vectorized() returns.
+
+    Args:
+        sim (Simulation): The simulation to run, whose consumers and battery pack are updated in place
+        runTimeInSeconds (int): The duration in seconds for which the simulation is run.
+        voltageRegulatorEfficiency (int): Rough efficiency of a DC to DC voltage regulator
+        chunkSize (int): Number of time steps in every chunk, except the last one which may be shorter
+
+    Yields:
+        SimulationChunk: The next chunkSize time steps, starting with the state before the simulation starts
+
+    Raises:
+        ValueError: The same ValueErrors as Simulation.run(), after yielding every time step completed before the error
+    """
+    if chunkSize < 1:
+        raise ValueError("Chunk size must be at least one time step.")
+
+    if sim.experimentDuration < runTimeInSeconds:
+        raise ValueError(f"Requested simulation time of {runTimeInSeconds}, is more than time defined in the powermodes variable.")
+
+    cell = sim.generator.cells
+    seriesCount = sim.generator.seriesCount
+    parallelCount = sim.generator.parallelCount
+    schedule = compile_schedule(sim.consumers, sim.powermodes)
+    variableLoad = has_traces(schedule) or sim.pulsePeriod is not None
+
+    # Rows are times, state of charge, voltage, current and power
+    chunk = np.empty((5, chunkSize))
+    filled = 0
+
+    def add(columns: tuple):
+        """ Copy columns into the chunk, returning every chunk that filled up """
+        nonlocal chunk, filled
+        fullChunks = []
+        offset = 0
+
+        while offset < len(columns[0]):
+            count = min(chunkSize - filled, len(columns[0]) - offset)
+            for row, column in enumerate(columns):
+                chunk[row, filled:filled + count] = column[offset:offset + count]
+
+            filled += count
+            offset += count
+            if filled == chunkSize:
+                fullChunks.append(SimulationChunk(*chunk))
+                chunk = np.empty((5, chunkSize))
+                filled = 0
+
+        return fullChunks
+
+    packVolts, packAmps, packPower = sim.generator.current_volts_amps_power
+    yield from add(([0.0], [int(cell.stateOfCharge)], [packVolts], [packAmps], [packPower]))
+
+    try:
+        totalElaspedTime = sim.timeStep
+        segmentStart = 0
+        for i in range(0, len(sim.powermodes), 2):
+            timeDuration = sim.powermodes[i+1]
+            timeToRun = min(timeDuration, runTimeInSeconds - totalElaspedTime)
+            stepCount, lastStepLength = sim.step_count(timeToRun)
+            fastestAllowedRechargeTime = int(((cell.totalEnergyCapacity - cell.currentEnergy) / (cell.maxPower)) * 3600) / parallelCount
+
+            if stepCount > 0:
+                segment = schedule[i // 2]
+                rechargeStep = None
+                if segment["isRecharge"]:
+                    rechargeStep = (float(segment["rechargeTarget"]) - cell.state_of_charge()) / timeToRun
+
+                for start in range(0, stepCount, chunkSize):
+                    # Step lengths and end times of this chunk only, never of the whole segment
+                    stepIndexes = np.arange(start, min(start + chunkSize, stepCount))
+                    stepLengths = np.full(len(stepIndexes), float(sim.timeStep))
+                    if stepIndexes[-1] == stepCount - 1:
+                        stepLengths[-1] = lastStepLength
+                    stepEnds = segmentStart + np.minimum((stepIndexes + 1) * sim.timeStep, timeToRun)
+
+                    error = None
+                    stepLoad = None
+                    if rechargeStep is not None:
+                        soc, voltage, _, error, _ = recharge_segment(sim, float(segment["rechargeTarget"]), timeDuration, timeToRun, stepLengths, fastestAllowedRechargeTime, True, rechargeStep)
+                    else:
+                        if variableLoad:
+                            stepLoad = segment_step_load(sim, segment, stepLengths, float(start * sim.timeStep), voltageRegulatorEfficiency)
+                        soc, voltage, _, _ = consumption_segment(sim, segment, stepLengths, voltageRegulatorEfficiency, True, stepLoad)
+
+                    # Same arithmetic as BatteryPack.current_volts_amps_power()
+                    voltage = seriesCount * voltage
+                    current = np.full(len(soc), parallelCount * cell.currentAmpere) if stepLoad is None else parallelCount * stepLoad[0]
+                    yield from add((stepEnds[:len(soc)], soc, voltage, current, voltage * current))
+
+                    if error is not None:
+                        raise error
+
+                segmentStart += timeToRun
+
+            totalElaspedTime += timeToRun
+            if totalElaspedTime > runTimeInSeconds:
+                break
+    except ValueError:
+        # Hand over every completed time step before the error
+        if filled > 0:
+            yield SimulationChunk(*chunk[:, :filled])
+        raise
+
+    if filled > 0:
+        yield SimulationChunk(*chunk[:, :filled])
@@ -1,13 +1,18 @@
 #!/usr/bin/python3
 
 # External libraries
+import base64
 import sqlite3
 from typing import BinaryIO
 from datetime import datetime
-from nicegui import Tailwind, ui
+import numpy as np
+from nicegui import Tailwind, app, ui
 
 # Internal libraries
 from Simulation import Simulation
+from BackgroundRun import BackgroundRunner
+from PiecewiseLinearLog import PiecewiseLinearLog
+from Downsample import downsample
 from PowerModes import PowerModes
 from Power.Consumption import Consumption
 from Power.BatteryCell import BatteryCell
@@ -25,6 +30,16 @@ packConfigInput = ['1S', '1P']
 efficiencyInput = '95'
 powerModesInput = []
 
+# Plots never get more points than the window is wide, see draw_trace()
+PLOT_PIXEL_WIDTH = 1920
+plotRange = None                # Zoomed in (start, stop) time range in seconds, or None for the whole trace
+shownTrace = ([], [])           # Full resolution (times, values) of the plotted trace
+timeArray = (None, None)        # (sim.timeLog, the same times as a NumPy array), converted again only when sim.timeLog is replaced
+
+# Single worker thread running simulations off the GUI event loop, and the last progress drawn by refresh_plot()
+runner = BackgroundRunner()
+lastProgress = None
+
 #errorLabel = ""
 
 csvHelp ="""
@@ -58,23 +73,53 @@ def set_battery_pack_parameters(voltageInput: float, energyInput: float, cRating
 
 
 def run_sim(sim: Simulation, plot) -> None:
-    """ Run simulation defined by GUI inputs and power modes defined in main.py main() function, and then update the graphical plot.
+    """ Start a background run of the simulation defined by GUI inputs and power modes defined in main.py main() function.
+
+        Any run still in flight is cancelled first. The plot is updated by refresh_plot() as the run progresses.
 
     Args:
         sim (Simulation): The simulation object to run.
     """
     global efficiencyInput
 
+    if errorLabel.visible:
+        errorLabel.visible = False
+
     try:
-        plot.figure['data'][0]['y'] = sim.run(sim.experimentDuration, int(efficiencyInput))
+        # Every click restarts from the same battery state, only recomputing powermodes that changed since the last click
+        runner.start(sim, sim.experimentDuration, int(efficiencyInput))
 
     except ValueError as e:
         errorLabel.visible = True
         errorLabel.set_text(f"RUNTIME ERROR: {e}")
-        plot.figure['data'][0]['y'] = [0] * sim.experimentDuration
 
-    finally:
-        plot.update()
+
+def refresh_plot(sim: Simulation, plot) -> None:
+    """ Draw the finished part of a background run, called periodically by a GUI timer
+
+    Args:
+        sim (Simulation): The simulation object being run.
+    """
+    global lastProgress
+
+    progress = runner.poll()
+    if progress is None or progress is lastProgress:
+        return
+    lastProgress = progress
+
+    progressBar.set_value(progress.fraction)
+    cancelButton.set_enabled(not progress.done)
+
+    times, values = plot_points(sim)
+    if progress.error is not None:
+        errorLabel.visible = True
+        errorLabel.set_text(f"RUNTIME ERROR: {progress.error}")
+        draw_trace(plot, times, np.zeros(len(times)))
+    elif progress.done and not progress.cancelled:
+        draw_trace(plot, times, values)
+    else:
+        # Partial trace, only the log entries the run has finished
+        draw_trace(plot, times[:progress.completed], values[:progress.completed])
 
 
 def set_sim_params(sim: Simulation, plot) -> None:
@@ -89,11 +134,14 @@ def set_sim_params(sim: Simulation, plot) -> None:
     if errorLabel.visible:
         errorLabel.visible = False
 
+    # The background run must stop before its simulation is changed
+    runner.cancel(wait=True)
+
     try:
         sim.initialize_data(float(voltageInput))
         sim.valid_dc_dc_voltage_regulator_efficiency(int(efficiencyInput))
         sim.generator = set_battery_pack_parameters(float(voltageInput), float(energyInput), int(cRatingInput), str(chemistryInput), packConfigInput)
-        plot.figure['data'][0]['y'] = sim.batteryPackPercentageLog
+        draw_trace(plot, *plot_points(sim))
 
     except ValueError as e:
         if DEBUG_STATEMENTS_ON: print("A run time errror occured!")
@@ -138,6 +186,91 @@ def process_csv_upload(content: BinaryIO): # -> list:
     #return convert_power_modes(powerModesObjList)
 
 
+def typed_array(values: np.ndarray, dtype: str) -> dict:
+    """ Encode numbers as a Plotly typed array, which is far smaller and faster to parse than a JSON list of floats
+
+    Args:
+        values (np.ndarray): Numbers to send to the browser
+        dtype (str): Plotly typed array type, such as 'f8' or 'f4'
+
+    Returns:
+        dict: Base64 encoded little endian data, in place of a list in a Plotly figure
+    """
+    data = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': dtype, 'bdata': base64.b64encode(data.tobytes()).decode('ascii')}
+
+
+def draw_trace(plot, times: np.ndarray, values: np.ndarray, pixelWidth: int = PLOT_PIXEL_WIDTH) -> None:
+    """ Plot a trace at the resolution of the screen, so the browser never gets more points than it has pixels
+
+        The full resolution trace is kept, to downsample again whenever the user zooms in (see zoom_plot()).
+
+    Args:
+        times (np.ndarray): Times in seconds
+        values (np.ndarray): State of charge (in %) at each time
+        pixelWidth (int, optional): Width of the plot in pixels. Defaults to PLOT_PIXEL_WIDTH.
+    """
+    global shownTrace
+
+    # Arrays are kept as they are, without a copy, when plot_points() already gives float64 arrays
+    shownTrace = (np.asarray(times, dtype=np.float64), np.asarray(values, dtype=np.float64))
+    plotTimes, plotValues = downsample(*shownTrace, pixelWidth, plotRange)
+
+    plot.figure['data'][0]['x'] = typed_array(plotTimes, 'f8')
+    plot.figure['data'][0]['y'] = typed_array(plotValues, 'f4')
+    if plotRange is None:
+        plot.figure['layout']['xaxis'].pop('range', None)
+        plot.figure['layout']['xaxis']['autorange'] = True
+    else:
+        plot.figure['layout']['xaxis']['range'] = list(plotRange)
+        plot.figure['layout']['xaxis']['autorange'] = False
+
+    plot.update()
+
+
+def zoom_plot(plot, relayout: dict) -> None:
+    """ Downsample the plot again for the time range the user zoomed to, or back to the whole trace
+
+    Args:
+        relayout (dict): Arguments of the Plotly 'plotly_relayout' event
+    """
+    global plotRange
+
+    if 'xaxis.range[0]' in relayout and 'xaxis.range[1]' in relayout:
+        plotRange = (float(relayout['xaxis.range[0]']), float(relayout['xaxis.range[1]']))
+    elif relayout.get('xaxis.autorange'):
+        plotRange = None
+    else:
+        return
+
+    draw_trace(plot, *shownTrace)
+
+
+def plot_points(sim: Simulation) -> tuple:
+    """ Time and state of charge points to plot, for every kind of battery charge state log
+
+        Called on every refresh_plot() tick of a background run, so the time log is only converted to an array when it
+        changes and a SimulationLog is used without any copy.
+
+    Args:
+        sim (Simulation): The simulation object containing the battery pack percentage log.
+
+    Returns:
+        np.ndarray: Times in seconds
+        np.ndarray: State of charge (in %) at each time
+    """
+    global timeArray
+
+    if isinstance(sim.batteryPackPercentageLog, PiecewiseLinearLog):
+        # Straight lines between the breakpoints are exactly the piecewise linear log, at a tiny fraction of the points
+        return sim.batteryPackPercentageLog.breakpoints()
+
+    if timeArray[0] is not sim.timeLog:
+        timeArray = (sim.timeLog, np.asarray(sim.timeLog, dtype=np.float64))
+
+    return timeArray[1], np.asarray(sim.batteryPackPercentageLog, dtype=np.float64)
+
+
 def save_data(sim: Simulation) -> None:
     """ Save sim.batteryPackPercentageLog list to auto incrementing tables based on date and time in a SQlite database
 
@@ -153,8 +286,11 @@ def save_data(sim: Simulation) -> None:
     c.execute(f'''CREATE TABLE IF NOT EXISTS BatteryPackPercentageDataTable_{timestamp}
                  (timestamp TEXT, percentage REAL)''')
 
-    for i in range(len(sim.batteryPackPercentageLog)):
-        c.execute(f"INSERT INTO BatteryPackPercentageDataTable_{timestamp} VALUES (?, ?)", (str(i), sim.batteryPackPercentageLog[i]))
+    # One row per time step with the time of that step, a piecewise linear log and its StepTimes are expanded to every step
+    values = sim.batteryPackPercentageLog
+    percentages = values.tolist() if hasattr(values, "tolist") else list(values)
+    times = sim.timeLog.tolist() if hasattr(sim.timeLog, "tolist") else list(sim.timeLog)
+    c.executemany(f"INSERT INTO BatteryPackPercentageDataTable_{timestamp} VALUES (?, ?)", ((str(times[i]), percentages[i]) for i in range(len(percentages))))
 
     conn.commit()
     conn.close()
@@ -196,15 +332,18 @@ def GUI(sim: Simulation) -> None:
     Args:
         sim (Simulation): Data to display in the GUI.
     """
-    global plot, chemistryInput, voltageInput, energyInput, cRatingInput, packConfigInput, efficiencyInput, errorLabel
+    global plot, chemistryInput, voltageInput, energyInput, cRatingInput, packConfigInput, efficiencyInput, errorLabel, progressBar, cancelButton, shownTrace
 
+    initialTimes, _ = plot_points(sim)
+    shownTrace = (np.asarray(initialTimes, dtype=np.float64), np.full(len(initialTimes), BatteryCell.MAX_STATE_OF_CHARGE))
+    initialTimes, initialValues = downsample(*shownTrace, PLOT_PIXEL_WIDTH)
     fig = {
         'data': [
             {
                 'type': 'scatter',
                 'name': 'Battery Simulation',
-                'x': list(range(0, sim.experimentDuration)),
-                'y': [BatteryCell.MAX_STATE_OF_CHARGE] * sim.experimentDuration,  # Initial chart shall display 100% state of charge
+                'x': typed_array(initialTimes, 'f8'),
+                'y': typed_array(initialValues, 'f4'),  # Initial chart shall display 100% state of charge
                 'line': {'width': 4}
             },
         ],
@@ -239,6 +378,7 @@ def GUI(sim: Simulation) -> None:
     })
 
     plot = ui.plotly(fig).classes('w-full h-[500px] relative z-0')
+    plot.on('plotly_relayout', lambda e: zoom_plot(plot, e.args))
 
     with ui.dialog() as dialog, ui.card().classes("w-max"):#.classes("w-[900px] max-w-[95%]"):  # 👈 make dialog wider:
         ui.label("Example .csv file structure").classes("text-xl font-bold")
@@ -264,6 +404,10 @@ def GUI(sim: Simulation) -> None:
         ui.button("Confirm Parameters, Reset Graph, & Reset Error Messages ", icon='settings', on_click= lambda: set_sim_params(sim, plot)).props('color=orange').classes('justify-center w-full')
         ui.space().classes('justify-center w-full')
         ui.button("Run Simulation", icon='start', on_click= lambda: run_sim(sim, plot)).props('color=green').classes('justify-center w-full')
+        progressBar = ui.linear_progress(value=0, show_value=False).classes('w-full')
+        cancelButton = ui.button("Cancel Simulation", icon='cancel', on_click= lambda: runner.cancel()).props('color=grey').classes('justify-center w-full')
+        cancelButton.set_enabled(False)
+        ui.timer(0.25, lambda: refresh_plot(sim, plot))
         ui.space().classes('justify-center w-full')
         ui.button("Save Simulation to SQLite Database", icon='save', on_click= lambda: save_data(sim)).props('color=blue').classes('justify-center w-full')
         #ui.space().classes('justify-center w-full')
@@ -293,11 +437,13 @@ if __name__ in {"__main__", "__mp_main__"}:
                   {BatteryCell.RECHARGE: 69.0},           400 * Simulation.ONE_SECOND]
 
     batteryPack = set_battery_pack_parameters(float(voltageInput), float(energyInput), int(cRatingInput), str(chemistryInput), list(packConfigInput))
-    sim = Simulation(submodules, batteryPack, powerModes)
+    # A float64 SimulationLog, so the plot reads the state of charge log without converting it
+    sim = Simulation(submodules, batteryPack, powerModes, logType=np.float64)
     sim.initialize_data(float(voltageInput))
     if DEBUG_STATEMENTS_ON: sim.print_all_sim_objects("Pre GUI")
 
     #set_app_dock_icon()
     GUI(sim)
 
-    ui.run(native=True, dark=True, window_size=(1920, 1080), title='Battery Pack Simulation', on_air=None)
+    app.on_shutdown(runner.shutdown)
+    ui.run(native=True, dark=True, window_size=(PLOT_PIXEL_WIDTH, 1080), title='Battery Pack Simulation', on_air=None)